@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .database import AsyncSessionLocal
+from .metrics import REGISTRY
+from .models import ConsignmentArchiveDB, ConsignmentDB
+from .summary import SummaryDelta, apply_delta
+from .utils.etag import bump_account_versions, invalidate_con
+
+# Keeps the consignments table to live parcels. Delivered and cancelled
+# consignments, and any older than ARCHIVE_AFTER_DAYS, are moved to
+# consignments_archive a chunk at a time: one DELETE ... RETURNING takes the
+# rows out (checking again that they still qualify, so an edit that lands first
+# wins) and the same transaction inserts them into the archive, takes them off
+# the summaries and bumps their accounts' list versions. Nothing else changes
+# about an archived consignment, and GET by number still finds it, so no outbox
+# event is written and its label is kept. A run that stops part way loses
+# nothing; the next one carries on.
+#
+#   python -m app.archive                       # one run, then exit
+#   python -m app.archive --after-days 30
+#
+# ARCHIVE_INTERVAL runs it in the app every so many seconds as well.
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "5000"))
+# Seconds between runs in the app; 0 leaves it to the CLI (or cron)
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "0"))
+
+# Statuses that are final; see ConStatus in app/schemas.py
+FINISHED = ("delivered", "cancelled")
+
+logger = logging.getLogger(__name__)
+
+archived_rows = REGISTRY.counter(
+    "archive_rows_total", "Consignments moved from the hot table to the archive")
+
+COLUMNS = list(ConsignmentDB.__table__.columns)
+
+
+def archivable(cutoff: datetime):
+    return or_(ConsignmentDB.status.in_(FINISHED), ConsignmentDB.created_at < cutoff)
+
+
+async def find_archived(db: AsyncSession, consignment_number: int) -> ConsignmentArchiveDB | None:
+    # The fallback for reads by number that miss the hot table
+    stmt = select(ConsignmentArchiveDB).where(ConsignmentArchiveDB.consignment_number == consignment_number)
+    return (await db.execute(stmt)).scalar_one_or_none()
+
+
+class Archiver:
+    def __init__(self, session_factory: async_sessionmaker, chunk_size: int = ARCHIVE_CHUNK_SIZE,
+                 after_days: float = ARCHIVE_AFTER_DAYS, interval: float = ARCHIVE_INTERVAL):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.after_days = after_days
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def run(self, now: datetime | None = None) -> int:
+        # Moves everything that qualifies as of now; returns how many
+        now = now or datetime.now(timezone.utc)
+        cutoff = now - timedelta(days=self.after_days)
+        total, last_id = 0, 0
+        while True:
+            async with self.session_factory() as db:
+                async with db.begin():
+                    ids = (await db.scalars(
+                        select(ConsignmentDB.id)
+                        .where(ConsignmentDB.id > last_id, archivable(cutoff))
+                        .order_by(ConsignmentDB.id)
+                        .limit(self.chunk_size)
+                    )).all()
+                    if not ids:
+                        break
+                    moved = await self._chunk(db, ids, cutoff, now)
+            total += len(moved)
+            last_id = ids[-1]
+            if moved:
+                archived_rows.inc(amount=len(moved))
+                invalidate_con(*(row.consignment_number for row in moved))
+                logger.info("Archived %d consignments, up to id %d", total, last_id)
+            if len(ids) < self.chunk_size:
+                break
+        return total
+
+    async def _chunk(self, db: AsyncSession, ids: list[int], cutoff: datetime, now: datetime) -> list:
+        moved = (await db.execute(
+            delete(ConsignmentDB)
+            .where(ConsignmentDB.id.in_(ids), archivable(cutoff))
+            .returning(*COLUMNS)
+            .execution_options(synchronize_session=False)
+        )).all()
+        if not moved:
+            return moved
+        # one executemany rather than an ORM insert per row
+        await db.execute(insert(ConsignmentArchiveDB), [{**row._asdict(), "archived_at": now} for row in moved])
+        # The summaries and list versions describe the hot table
+        delta = SummaryDelta()
+        for row in moved:
+            delta.removed(row)
+        await apply_delta(db, delta)
+        await bump_account_versions(db, *(row.account_no for row in moved))
+        return moved
+
+    async def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # A cancelled run rolls back its current chunk; the next one redoes it
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Archive run failed, trying again in %.0fs", self.interval, exc_info=True)
+            await asyncio.sleep(self.interval)
+
+
+archiver = Archiver(AsyncSessionLocal)
+
+
+def main(argv=None):
+    from .database import async_engine
+
+    parser = argparse.ArgumentParser(description="Move finished and aged-out consignments to the archive")
+    parser.add_argument("--after-days", type=float, default=ARCHIVE_AFTER_DAYS,
+                        help="archive consignments created longer ago than this, whatever their status")
+    parser.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    async def run() -> int:
+        try:
+            return await Archiver(AsyncSessionLocal, args.chunk_size, args.after_days).run()
+        finally:
+            await async_engine.dispose()
+
+    print(f"archived {asyncio.run(run())} consignments")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
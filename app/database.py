@@ -1,8 +1,10 @@
-import os, time
+import asyncio, os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 # Pick env file by APP_ENV (default dev)
 envfile = {
@@ -16,26 +18,54 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
 RETRIES = int(os.getenv("DB_RETRIES", "10"))
 DELAY = float(os.getenv("DB_RETRY_DELAY", "1.5"))
+# Connections kept open per engine, extra ones allowed under burst, and how long
+# a request waits for one before giving up (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
 
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 
-# small retry (harmless for SQLite, useful for Postgres)
-for _ in range(RETRIES):
-    try:
-        engine = create_engine(DATABASE_URL, pool_pre_ping=True, echo=SQL_ECHO, connect_args=connect_args)
-        with engine.connect():
-            pass
-        break
-    except OperationalError:
-        time.sleep(DELAY)
+def async_url(url: str) -> str:
+    # Same database, async driver: aiosqlite for SQLite, psycopg 3 for Postgres
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        return u.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if u.get_backend_name() == "postgresql":
+        return u.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+    return url
 
 
+def engine_args(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False}}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT}
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_url(DATABASE_URL))
+
+# Nothing connects at import; the app waits for the database in its lifespan.
+# The sync engine is for migrations, CLIs and the bulk streaming endpoints.
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, echo=SQL_ECHO, **engine_args(DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, echo=SQL_ECHO, **engine_args(ASYNC_DATABASE_URL))
+
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+def upsert_insert(db, model):
+    # INSERT that takes on_conflict_do_update/do_nothing, for the session's database
+    insert = postgresql.insert if db.bind.dialect.name == "postgresql" else sqlite.insert
+    return insert(model)
+
 
+async def wait_for_db(retries: int = RETRIES, delay: float = DELAY):
+    # small retry (harmless for SQLite, useful for Postgres still starting up)
+    for attempt in range(retries):
+        try:
+            async with async_engine.connect():
+                return
+        except OperationalError:
+            if attempt == retries - 1:
+                raise
+            await asyncio.sleep(delay)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
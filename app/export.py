@@ -0,0 +1,229 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+from typing import Iterable, Iterator
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from .models import ConsignmentDB
+from .utils.pagination import json_default
+
+# Column order of every export format
+EXPORT_COLUMNS = (
+    "id", "account_no", "name",
+    "addressline1", "addressline2", "addressline3", "addressline4",
+    "weight", "consignment_number", "delivery_depot",
+    "version", "created_at", "status",
+)
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+EXPORT_CHUNK_SIZE = 10_000
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_stmt(account_no: str | None = None, depot: int | None = None,
+                from_con: int | None = None, to_con: int | None = None):
+    # Plain columns, no ORM objects; ordered so ranges can be resumed by consignment_number
+    stmt = select(*(getattr(ConsignmentDB, c) for c in EXPORT_COLUMNS))
+    if account_no is not None:
+        stmt = stmt.where(ConsignmentDB.account_no == account_no)
+    if depot is not None:
+        stmt = stmt.where(ConsignmentDB.delivery_depot == depot)
+    if from_con is not None:
+        stmt = stmt.where(ConsignmentDB.consignment_number >= from_con)
+    if to_con is not None:
+        stmt = stmt.where(ConsignmentDB.consignment_number <= to_con)
+    return stmt.order_by(ConsignmentDB.consignment_number)
+
+
+def iter_chunks(db: Session, stmt, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[list]:
+    result = db.execute(stmt.execution_options(yield_per=chunk_size))
+    yield from result.partitions()
+
+
+def _csv(chunks: Iterable[list]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def _ndjson(chunks: Iterable[list]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=json_default) + "\n" for row in rows).encode()
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportError("Parquet and Arrow exports need pyarrow installed")
+    return pyarrow
+
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ("id", pa.int64()),
+        ("account_no", pa.string()),
+        ("name", pa.string()),
+        ("addressline1", pa.string()),
+        ("addressline2", pa.string()),
+        ("addressline3", pa.string()),
+        ("addressline4", pa.string()),
+        ("weight", pa.int32()),
+        ("consignment_number", pa.int64()),
+        ("delivery_depot", pa.int32()),
+        ("version", pa.int32()),
+        ("created_at", pa.timestamp("us", tz="UTC")),
+        ("status", pa.string()),
+    ])
+
+
+class _Drain(io.RawIOBase):
+    # Write-only sink that hands back whatever was written since the last drain
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow_batches(pa, schema, chunks):
+    for rows in chunks:
+        columns = list(zip(*rows))
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+            schema=schema,
+        )
+
+
+def _parquet(chunks: Iterable[list]) -> Iterator[bytes]:
+    pa = _pyarrow()
+    schema = _arrow_schema(pa)
+    sink = _Drain()
+    # One row group per chunk, so each chunk can go out as soon as it's encoded
+    with pa.parquet.ParquetWriter(sink, schema, compression="snappy") as writer:
+        for batch in _arrow_batches(pa, schema, chunks):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _arrow(chunks: Iterable[list]) -> Iterator[bytes]:
+    pa = _pyarrow()
+    schema = _arrow_schema(pa)
+    sink = _Drain()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in _arrow_batches(pa, schema, chunks):
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {
+    "csv": _csv,
+    "ndjson": _ndjson,
+    "parquet": _parquet,
+    "arrow": _arrow,
+}
+
+
+def _gzip(data: Iterable[bytes]) -> Iterator[bytes]:
+    z = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31 -> gzip container
+    for chunk in data:
+        out = z.compress(chunk)
+        if out:
+            yield out
+    yield z.flush()
+
+
+def export(chunks: Iterable[list], fmt: str, gzip: bool = False) -> Iterator[bytes]:
+    if fmt not in WRITERS:
+        raise ExportError(f"Unknown export format '{fmt}'")
+    if fmt in ("parquet", "arrow"):
+        _pyarrow() # fail before anything is streamed
+    data = WRITERS[fmt](chunks)
+    return _gzip(data) if gzip else data
+
+
+def filename(fmt: str, gzip: bool = False) -> str:
+    ext = {"arrow": "arrows"}.get(fmt, fmt)
+    return f"consignments.{ext}" + (".gz" if gzip else "")
+
+
+def main(argv=None):
+    from .database import DATABASE_URL
+
+    parser = argparse.ArgumentParser(description="Export consignments")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument("--out", default="-", help="output file, - for stdout")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--account-no")
+    parser.add_argument("--depot", type=int)
+    parser.add_argument("--from-con", type=int)
+    parser.add_argument("--to-con", type=int)
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    parser.add_argument("--database-url", default=DATABASE_URL)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url)
+    stmt = export_stmt(args.account_no, args.depot, args.from_con, args.to_con)
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    rows = 0
+
+    def counted(chunks):
+        nonlocal rows
+        for chunk in chunks:
+            rows += len(chunk)
+            yield chunk
+
+    try:
+        with Session(engine) as db:
+            for data in export(counted(iter_chunks(db, stmt, args.chunk_size)), args.format, args.gzip):
+                out.write(data)
+    except ExportError as e:
+        parser.error(str(e))
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(f"exported {rows} rows", file=sys.stderr)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
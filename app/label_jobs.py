@@ -0,0 +1,140 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from types import SimpleNamespace
+
+from . import label_store as store
+from .label_template import render_label_pdf
+from .metrics import label_render_duration, label_renders
+
+# "process" keeps reportlab off the event loop thread and the GIL; "thread" is lighter for dev/tests
+LABEL_POOL = os.getenv("LABEL_POOL", "process")
+LABEL_WORKERS = int(os.getenv("LABEL_WORKERS", "2"))
+# How long GET .../label waits for a pending render before answering 202
+LABEL_WAIT = float(os.getenv("LABEL_WAIT", "2.0"))
+
+# Everything the label layout reads off a consignment
+LABEL_FIELDS = (
+    "account_no", "name",
+    "addressline1", "addressline2", "addressline3", "addressline4",
+    "weight", "consignment_number", "delivery_depot",
+)
+
+
+def _render(fields: dict) -> tuple[bool, float]:
+    # Runs in the worker; only plain dicts cross the process boundary. Returns
+    # whether it drew anything: a label stored from the same fields is kept.
+    start = time.perf_counter()
+    number = fields["consignment_number"]
+    digest = store.label_digest(fields)
+    if store.label_store.digest(number) == digest:
+        return False, time.perf_counter() - start
+    store.label_store.put(number, render_label_pdf(SimpleNamespace(**fields)), digest)
+    return True, time.perf_counter() - start
+
+
+class LabelRenderPool:
+    def __init__(self, kind: str = LABEL_POOL, workers: int = LABEL_WORKERS):
+        self.kind = kind
+        self.workers = workers
+        self._executor: Executor | None = None
+        self._jobs: dict[int, asyncio.Task] = {} # consignment_number -> latest job
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0 # label already stored from the same fields
+        self.deleted = 0
+        self._render_times: deque = deque(maxlen=1000)
+
+    def _get_executor(self) -> Executor:
+        # Created on first use so importing the app never starts worker processes
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="label")
+        return self._executor
+
+    def submit(self, con) -> asyncio.Task:
+        fields = {f: getattr(con, f) for f in LABEL_FIELDS}
+        return self._queue(con.consignment_number, self._draw(fields))
+
+    def delete(self, consignment_number: int) -> asyncio.Task:
+        # For a deleted consignment. Queued behind its renders, so a late one
+        # can't write the label back afterwards.
+        return self._queue(consignment_number, self._remove(consignment_number))
+
+    def _queue(self, number: int, job) -> asyncio.Task:
+        prev = self._jobs.get(number)
+        task = asyncio.ensure_future(self._after(prev, job))
+        self._jobs[number] = task
+        self.queued += 1
+
+        def _done(t):
+            self.queued -= 1
+            if self._jobs.get(number) is t:
+                del self._jobs[number]
+            if t.cancelled() or t.exception() is not None:
+                self.failed += 1
+                label_renders.inc("error")
+            elif t.result() is None:
+                self.deleted += 1
+            elif t.result()[0]:
+                self.completed += 1
+                self._render_times.append(t.result()[1])
+                label_renders.inc("ok")
+                label_render_duration.observe(t.result()[1])
+            else:
+                self.skipped += 1
+                label_renders.inc("unchanged")
+
+        task.add_done_callback(_done)
+        return task
+
+    async def _after(self, prev: asyncio.Task | None, job):
+        # Jobs for the same label run in submit order, so an older edit never overwrites a newer one
+        if prev is not None:
+            await asyncio.wait([prev])
+        return await job
+
+    async def _draw(self, fields: dict):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), _render, fields)
+
+    async def _remove(self, consignment_number: int):
+        # Small enough not to need the render workers
+        await asyncio.to_thread(store.label_store.delete, consignment_number)
+
+    def pending(self, consignment_number: int) -> asyncio.Task | None:
+        return self._jobs.get(consignment_number)
+
+    async def shutdown(self):
+        # Let queued renders finish before the workers go away
+        if self._jobs:
+            await asyncio.wait(list(self._jobs.values()))
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        times = sorted(self._render_times)
+        return {
+            "pool": self.kind,
+            "workers": self.workers,
+            "queue_depth": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "unchanged": self.skipped,
+            "deleted": self.deleted,
+            "render_ms_avg": round(1000 * sum(times) / len(times), 2) if times else None,
+            "render_ms_p95": round(1000 * times[int(0.95 * (len(times) - 1))], 2) if times else None,
+        }
+
+
+label_pool = LabelRenderPool()
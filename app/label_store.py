@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from . import pdf_generator
+from .pdf_generator import ensure_dir
+
+# Where rendered labels are kept. Each label is stored with a digest of the
+# fields it was drawn from, so a render whose fields haven't changed since the
+# last one can be skipped.
+#
+# "local" writes under pdf_generator.LABEL_DIR; "s3" writes to LABEL_BUCKET on
+# any S3-compatible object store (S3_ENDPOINT_URL for MinIO and the like).
+LABEL_STORE = os.getenv("LABEL_STORE", "local")
+LABEL_BUCKET = os.getenv("LABEL_BUCKET", "labels")
+LABEL_PREFIX = os.getenv("LABEL_PREFIX", "labels/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+# Part of every digest; bump it when the label layout changes so stored labels
+# are drawn again
+LABEL_LAYOUT_VERSION = 1
+
+
+def label_digest(fields: dict) -> str:
+    data = json.dumps([LABEL_LAYOUT_VERSION, fields], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def label_key(consignment_number: int) -> str:
+    # Two levels of 100 directories from the low digits, so sequential numbers
+    # spread evenly: 1234567 -> 67/45/label_1234567.pdf
+    n = consignment_number
+    return f"{n % 100:02d}/{n // 100 % 100:02d}/label_{n}.pdf"
+
+
+def label_path(consignment_number: int) -> str:
+    # LABEL_DIR is read on each call, so it can be pointed elsewhere at runtime
+    return os.path.join(pdf_generator.LABEL_DIR, *label_key(consignment_number).split("/"))
+
+
+def atomic_write(path: str, data: bytes):
+    # Readers see the old file or the new one, never half of one. No fsync: a
+    # label lost in a crash is drawn again on the next GET.
+    ensure_dir(path)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class LocalLabelStore:
+    # The digest sits next to the PDF in <label>.sha256. It is written after
+    # the PDF and removed before it, so it never vouches for a file it didn't see.
+    def local_path(self, consignment_number: int) -> str | None:
+        return label_path(consignment_number)
+
+    def digest(self, consignment_number: int) -> str | None:
+        try:
+            with open(label_path(consignment_number) + ".sha256") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, consignment_number: int) -> bool:
+        return os.path.exists(label_path(consignment_number))
+
+    def get(self, consignment_number: int) -> bytes:
+        with open(label_path(consignment_number), "rb") as f:
+            return f.read()
+
+    def put(self, consignment_number: int, data: bytes, digest: str):
+        path = label_path(consignment_number)
+        atomic_write(path, data)
+        atomic_write(path + ".sha256", digest.encode())
+
+    def delete(self, consignment_number: int):
+        path = label_path(consignment_number)
+        for p in (path + ".sha256", path):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+
+class S3LabelStore:
+    # The digest is object metadata, so it lands with the object in one PUT
+    def __init__(self, bucket: str = LABEL_BUCKET, prefix: str = LABEL_PREFIX, client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = client
+
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+        return self._client
+
+    def key(self, consignment_number: int) -> str:
+        return self.prefix + label_key(consignment_number)
+
+    def local_path(self, consignment_number: int) -> str | None:
+        return None
+
+    def _head(self, consignment_number: int) -> dict | None:
+        try:
+            return self.client().head_object(Bucket=self.bucket, Key=self.key(consignment_number))
+        except Exception as e:
+            # botocore's ClientError, without importing botocore up front
+            code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def digest(self, consignment_number: int) -> str | None:
+        head = self._head(consignment_number)
+        return None if head is None else head.get("Metadata", {}).get("label-digest")
+
+    def exists(self, consignment_number: int) -> bool:
+        return self._head(consignment_number) is not None
+
+    def get(self, consignment_number: int) -> bytes:
+        res = self.client().get_object(Bucket=self.bucket, Key=self.key(consignment_number))
+        return res["Body"].read()
+
+    def put(self, consignment_number: int, data: bytes, digest: str):
+        self.client().put_object(
+            Bucket=self.bucket, Key=self.key(consignment_number), Body=data,
+            ContentType="application/pdf", Metadata={"label-digest": digest},
+        )
+
+    def delete(self, consignment_number: int):
+        self.client().delete_object(Bucket=self.bucket, Key=self.key(consignment_number))
+
+
+def make_label_store(kind: str = LABEL_STORE):
+    if kind == "local":
+        return LocalLabelStore()
+    if kind == "s3":
+        return S3LabelStore()
+    raise ValueError(f"Unknown label store {kind!r}")
+
+
+# Built again in each render worker process, from the same environment
+label_store = make_label_store()
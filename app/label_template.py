@@ -0,0 +1,116 @@
+import io
+from typing import Iterable, Iterator
+
+from .pdf_generator import (
+    A4, A6, BOX_X, BOX_Y, BOX_WIDTH, BOX_HEIGHT, RULE_Y,
+    BARCODE_HEIGHT, BARCODE_BAR_WIDTH,
+)
+
+# Same layout as generate_label_pdf, drawn to memory rather than a file. The
+# parts that are the same on every label (the box and the rule under the
+# account line) are a reportlab form XObject, drawn once per document and
+# placed on each label with doForm.
+
+FONT = "Helvetica"
+FONT_BOLD = "Helvetica-Bold"
+BASE_FORM = "LabelBase"
+
+# Sheet layouts for bulk printing: page size and where each label's origin goes
+SHEET_LAYOUTS = {
+    "a6": (A6, [(0, 0)]),
+    # 4-up, A4 is exactly two A6 wide and (just over) two high; fills top-left first
+    "a4": (A4, [
+        (0, A4[1] - A6[1]), (A6[0], A4[1] - A6[1]),
+        (0, A4[1] - 2 * A6[1]), (A6[0], A4[1] - 2 * A6[1]),
+    ]),
+}
+
+
+class LabelTemplate:
+    def __init__(self, pagesize=A6, compress: bool = False):
+        self.pagesize = pagesize
+        self.compress = compress
+
+    def _canvas(self, buf, pagesize):
+        # reportlab is imported on first use; see app/pdf_generator.py
+        from reportlab.pdfgen import canvas
+
+        c = canvas.Canvas(buf, pagesize=pagesize, pageCompression=int(self.compress))
+        c.beginForm(BASE_FORM, upperx=A6[0], uppery=A6[1])
+        c.setLineWidth(1)
+        c.setStrokeColorRGB(0, 0, 0)
+        c.rect(BOX_X, BOX_Y, BOX_WIDTH, BOX_HEIGHT, stroke=1, fill=0)
+        c.line(BOX_X, RULE_Y, BOX_X + BOX_WIDTH, RULE_Y)
+        c.endForm()
+        return c
+
+    def draw(self, c, consignment):
+        # One label with its origin at the canvas origin
+        from reportlab.graphics.barcode import code128
+
+        c.doForm(BASE_FORM)
+        c.setFillColorRGB(0, 0, 0)
+        c.setFont(FONT, 10)
+        c.drawString(20, 350, f"Account: {consignment.account_no}")
+        c.drawString(20, 320, f"{consignment.name}")
+        c.drawString(20, 300, f"{consignment.addressline1}")
+        if consignment.addressline2:
+            c.drawString(20, 275, f"{consignment.addressline2}")
+        c.drawString(20, 260, f"{consignment.addressline3}")
+        c.drawString(20, 245, f"{consignment.addressline4}")
+
+        c.setFont(FONT_BOLD, 36)
+        c.drawCentredString(BOX_X + BOX_WIDTH / 2 + 40, BOX_Y + BOX_HEIGHT - 200, f"{consignment.delivery_depot}")
+
+        c.setFont(FONT, 10)
+        c.drawString(20, 130, f"Consignment No: {consignment.consignment_number}")
+        c.drawString(160, 130, f"Weight: {consignment.weight}kg")
+
+        barcode_value = str(consignment.consignment_number)
+        barcode = code128.Code128(barcode_value, barHeight=BARCODE_HEIGHT, barWidth=BARCODE_BAR_WIDTH)
+        barcode_x = BOX_X + (BOX_WIDTH - barcode.width) / 2
+        barcode_y = BOX_Y - 80
+        barcode.drawOn(c, barcode_x, barcode_y)
+
+        c.setFont(FONT, 9)
+        c.drawCentredString(BOX_X + BOX_WIDTH / 2, barcode_y - 12, barcode_value)
+
+    def render(self, consignment) -> bytes:
+        # Whole single-page PDF, in memory
+        buf = io.BytesIO()
+        c = self._canvas(buf, self.pagesize)
+        self.draw(c, consignment)
+        c.showPage()
+        c.save()
+        return buf.getvalue()
+
+    def stream_sheet(self, consignments: Iterable, layout: str = "a6",
+                     chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        # Multi-page PDF of labels, yielded in chunks. reportlab writes the
+        # document out on save, so the pages are held (compressed) until then.
+        pagesize, slots = SHEET_LAYOUTS[layout]
+        buf = io.BytesIO()
+        c = self._canvas(buf, pagesize)
+        it = iter(consignments)
+        while True:
+            page_cons = [con for _, con in zip(slots, it)]
+            if not page_cons:
+                break
+            for (x, y), con in zip(slots, page_cons):
+                c.saveState()
+                c.translate(x, y)
+                self.draw(c, con)
+                c.restoreState()
+            c.showPage()
+        c.save()
+
+        data = buf.getbuffer()
+        for start in range(0, len(data), chunk_size):
+            yield bytes(data[start:start + chunk_size])
+
+
+label_template = LabelTemplate()
+
+
+def render_label_pdf(consignment) -> bytes:
+    return label_template.render(consignment)
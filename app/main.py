@@ -1,30 +1,118 @@
 
+import asyncio
+import logging
+import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, status, Depends, Response
+from typing import Literal
+from fastapi import FastAPI, HTTPException, status, Depends, Response, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .database import SessionLocal, engine
-from sqlalchemy import select
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse, JSONResponse
+from .database import SessionLocal, AsyncSessionLocal, engine, async_engine, wait_for_db
+from sqlalchemy import select, text
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from .schemas import(
     ConCreate, ConRead,
-    ConEdit, ConList
+    ConEdit, ConList,
+    ConBatchResult, ConSearchResult, DepotSummary, AccountSummary
 )
-from .models import ConsignmentDB, Base
-from .pdf_generator import generate_label_pdf
-from .utils.account_validator import validate_account_exists
-from .utils.get_next_con import get_next_con_num
-from .utils.gazzing import resolve_depot_number
-from .security import get_current_account_claims
+from .models import ConsignmentDB
+from .migrate import run_migrations
+from .metrics import MetricsMiddleware, REGISTRY, CONTENT_TYPE, db_commit_duration
+from .profiling import ProfilingMiddleware
+from .summary import SummaryDelta, snapshot, apply_delta, depot_summary, account_summary
+from .outbox import CREATED, UPDATED, DELETED, add_event, notify_publisher, outbox_publisher
+from .redepot import redepot_job
+from .archive import archiver, find_archived
+from .label_jobs import label_pool, LABEL_WAIT, LABEL_FIELDS
+from .label_store import label_store
+from .label_template import label_template
+from .export import (
+    export, export_stmt, iter_chunks, filename,
+    ExportError, MEDIA_TYPES, EXPORT_CHUNK_SIZE
+)
+from .utils.account_validator import (
+    validate_account_exists, account_cache, invalidate_account_cache
+)
+from .utils.get_next_con import get_next_con_num, allocate_con_nums, con_allocator
+from .utils.gazzing import (
+    resolve_depot_number, depot_cache, fetch_depot_number, fetch_depot_table,
+    normalise_area, invalidate_depot_cache, warm_depot_cache, DEPOT_CACHE_WARM
+)
+from .utils.upstream import start_clients, close_clients, deadline, UpstreamError, CLIENTS
+from .utils.etag import (
+    con_etag, list_etag, etag_matches, not_modified,
+    get_cached_con, cache_con, invalidate_con, response_cache,
+    get_account_version, bump_account_versions
+)
+from .utils.search import search_stmt
+from .utils.pagination import (
+    encode_cursor, decode_cursor, wants_ndjson, ndjson_lines,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NDJSON, page_limit
+)
+from .security import ADMIN_ROLE, get_current_account_claims, require_admin, token_cache, invalidate_token_cache
+
+
+logger = logging.getLogger(__name__)
 
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() == "true"
+# Start serving straight away and bring the database up in the background;
+# /health/ready answers 503 until that is done. Off: startup waits for it.
+FAST_START = os.getenv("FAST_START", "false").lower() == "true"
+READY_CHECK_TIMEOUT = float(os.getenv("READY_CHECK_TIMEOUT", "2.0"))
+
+async def prepare(app: FastAPI):
+    await wait_for_db()
+    # Otherwise run `python -m app.migrate upgrade` before starting the app
+    if MIGRATE_ON_STARTUP:
+        await asyncio.to_thread(run_migrations, engine)
+    if DEPOT_CACHE_WARM:
+        await warm_depot_cache()
+    if outbox_publisher is not None:
+        await outbox_publisher.start()
+    # Off unless ARCHIVE_INTERVAL; see app/archive.py
+    await archiver.start()
+    app.state.ready = True
+
+def startup_done(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Startup failed", exc_info=task.exception())
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
+    app.state.ready = False
+    app.state.startup = None
+    await start_clients()
+    if FAST_START:
+        app.state.startup = asyncio.create_task(prepare(app))
+        app.state.startup.add_done_callback(startup_done)
+    else:
+        await prepare(app)
     yield
+    if app.state.startup is not None and not app.state.startup.done():
+        app.state.startup.cancel()
+    if outbox_publisher is not None:
+        await outbox_publisher.stop()
+    # an interrupted re-depot resumes from its last chunk on the next POST
+    await redepot_job.stop()
+    await archiver.stop()
+    await label_pool.shutdown()
+    await con_allocator.close()
+    await close_clients()
+    await async_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+# Rows fetched per round-trip when streaming large result sets
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "500"))
+# Total time a create may spend on the accounts service and the gazetteer, and
+# the part of it the account check may use before the number lease gets the rest
+CREATE_DEADLINE = float(os.getenv("CREATE_DEADLINE_MS", "2000")) / 1000
+CREATE_ACCOUNT_CHECK_SHARE = float(os.getenv("CREATE_ACCOUNT_CHECK_SHARE", "0.5"))
+
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,85 +120,463 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Off unless PROFILING_ENABLED; see app/profiling.py
+app.add_middleware(ProfilingMiddleware)
+# Added last so it wraps everything, CORS included
+app.add_middleware(MetricsMiddleware)
 
 # Uncomment this line to reset DB
 #Base.metadata.drop_all(bind=engine)
 #Base.metadata.create_all(bind=engine)
 
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Sync session for the bulk exports and label sheets. Their bodies are CPU-bound
+# encoders, which Starlette runs in the threadpool along with the queries.
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
 
-def commit_or_rollback(db: Session, error_msg: str):
+async def commit_or_rollback(db: AsyncSession, error_msg: str, events: list = ()):
+    # events: (event type, consignment) pairs for the outbox. They are written
+    # after a flush, so inserts and updates have their new version, and commit
+    # (or roll back) together with the change.
     try:
-        db.commit()
+        if events:
+            await db.flush()
+            for event_type, con in events:
+                add_event(db, event_type, con)
+        with db_commit_duration.time():
+            await db.commit()
     except IntegrityError:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=error_msg
         )
+    except StaleDataError:
+        # Someone else changed or deleted the row since we read it
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Consignment was changed by another request, try again"
+        )
+
+async def resolve_con_refs(con: ConCreate) -> tuple[int, int]:
+    # (consignment number, depot). The number waits on the account check, the
+    # depot lookup needs neither, so it runs alongside them; the first failure
+    # cancels whatever is still running.
+    async def check_account():
+        with deadline(CREATE_DEADLINE * CREATE_ACCOUNT_CHECK_SHARE):
+            await validate_account_exists(con.account_no)
+
+    async def next_number() -> int:
+        await check
+        return await get_next_con_num(con.account_no)
+
+    async def depot_number() -> int:
+        try:
+            return await resolve_depot_number(con.addressline4)
+        except HTTPException:
+            # A missing account still wins over a depot failure, as it did when
+            # these ran one after another
+            await check
+            raise
+
+    try:
+        with deadline(CREATE_DEADLINE):
+            async with asyncio.timeout(CREATE_DEADLINE):
+                async with asyncio.TaskGroup() as tg:
+                    check = tg.create_task(check_account())
+                    number = tg.create_task(next_number())
+                    depot = tg.create_task(depot_number())
+    except* HTTPException as group:
+        raise min(group.exceptions, key=lambda e: e.status_code) from None
+    except* TimeoutError:
+        raise UpstreamError("Upstream services did not answer in time") from None
+    return number.result(), depot.result()
+
+# The session dependencies close before a StreamingResponse body runs. A closed
+# session can be used again (it checks out a fresh connection), so the query
+# runs in the body, in chunks off a server-side cursor, and is closed when done.
+async def stream_chunks(db: AsyncSession, stmt, chunk_size: int = STREAM_CHUNK_SIZE):
+    try:
+        result = await db.stream(stmt.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+    finally:
+        await db.close()
+
+def stream_chunks_sync(db: Session, stmt, chunk_size: int = STREAM_CHUNK_SIZE):
+    try:
+        yield from iter_chunks(db, stmt, chunk_size)
+    finally:
+        db.close()
+
+def stream_rows_sync(db: Session, stmt):
+    for chunk in stream_chunks_sync(db, stmt):
+        yield from chunk
 
 @app.get("/health")
 def health():
     return {"status" : "ok"}
 
-#Get all consignments
+# Liveness: the process is serving. Only fails if a fast start gave up on the
+# database, so the orchestrator restarts it.
+@app.get("/health/live")
+def health_live(request: Request):
+    startup = request.app.state.startup
+    if startup is not None and startup.done() and not startup.cancelled() and startup.exception():
+        return JSONResponse({"status": "failed"}, status_code=503)
+    return {"status": "ok"}
+
+# Readiness: startup finished and the database answers
+@app.get("/health/ready")
+async def health_ready(request: Request, db: AsyncSession = Depends(get_db)):
+    if not request.app.state.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    try:
+        await asyncio.wait_for(db.execute(text("SELECT 1")), READY_CHECK_TIMEOUT)
+    except (OSError, SQLAlchemyError, asyncio.TimeoutError):
+        return JSONResponse({"status": "unavailable"}, status_code=503)
+    return {"status": "ready"}
+
+#Prometheus scrape target
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+#Cache counters, to check the caches are earning their keep
+@app.get("/api/cache/stats")
+def cache_stats():
+    return {
+        "depot": depot_cache.stats(),
+        "account": account_cache.stats(),
+        "token": token_cache.stats(),
+        "response": response_cache.stats(),
+    }
+
+#Label render queue depth and timings
+@app.get("/api/labels/stats")
+def label_stats():
+    return label_pool.stats()
+
+#Connection pool / circuit breaker state per upstream service
+@app.get("/api/upstream/stats")
+def upstream_stats():
+    return {c.name.lower(): c.stats() for c in CLIENTS}
+
+#Drop cached depot lookups (one area, or all of them)
+@app.delete("/api/cache/depot", status_code=204, dependencies=[Depends(require_admin)])
+def clear_depot_cache(area: str | None = None):
+    invalidate_depot_cache(area)
+
+#Drop cached account checks, e.g. after an account is created or closed
+@app.delete("/api/cache/account", status_code=204, dependencies=[Depends(require_admin)])
+def clear_account_cache(account_no: str | None = None):
+    invalidate_account_cache(account_no)
+
+#Drop cached token checks, e.g. after JWT_SECRET is rotated
+@app.delete("/api/cache/token", status_code=204, dependencies=[Depends(require_admin)])
+def clear_token_cache():
+    invalidate_token_cache()
+
+# Move consignments to the depot the gazetteer now gives their area: one area,
+# or every area in the gazetteer's table. Runs in the background; resume=true
+# carries on with jobs an earlier run didn't finish without asking the gazetteer.
+@app.post("/api/admin/redepot", status_code=202, dependencies=[Depends(require_admin)])
+async def start_redepot(area: str | None = None, resume: bool = False):
+    if redepot_job.running:
+        raise HTTPException(status_code=409, detail="A re-depot job is already running")
+    # Claimed before the first await, so a second POST gets the 409
+    with redepot_job.starting():
+        areas = []
+        if not resume:
+            if area is None:
+                depots = await fetch_depot_table()
+            else:
+                depots = {normalise_area(area): await fetch_depot_number(area.strip())}
+            # New consignments go to the new depots from here on
+            for key, depot in depots.items():
+                depot_cache.set(key, depot)
+            areas = await redepot_job.remap(depots)
+        redepot_job.start()
+    return {"areas": areas, **redepot_job.stats()}
+
+@app.get("/api/admin/redepot", dependencies=[Depends(require_admin)])
+async def redepot_status():
+    jobs = await redepot_job.jobs()
+    return {
+        **redepot_job.stats(),
+        "jobs": [
+            {"area": j.area, "delivery_depot": j.delivery_depot, "status": j.status,
+             "last_id": j.last_id, "changed": j.changed}
+            for j in jobs
+        ],
+    }
+
+#Get all consignments, a page at a time (or streamed as NDJSON)
 @app.get("/api/consignment", response_model=list[ConRead])
-def list_cons(db: Session = Depends(get_db)):
-    stmt = select(ConsignmentDB).order_by(ConsignmentDB.id)
-    return db.execute(stmt).scalars().all()
+async def list_cons(
+    request: Request,
+    response: Response,
+    after_id: int | None = None,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+):
+    limit = page_limit(limit, after_id, cursor)
+    if cursor is not None:
+        after_id = decode_cursor(cursor)
+    filters = [ConsignmentDB.id > after_id] if after_id is not None else []
+
+    if wants_ndjson(request):
+        # Everything after the cursor, in constant memory
+        stmt = (select(*(getattr(ConsignmentDB, f) for f in ConRead.model_fields))
+                .where(*filters)
+                .order_by(ConsignmentDB.id))
+        return StreamingResponse(ndjson_lines(stream_chunks(db, stmt)), media_type=NDJSON)
+
+    stmt = select(ConsignmentDB).where(*filters).order_by(ConsignmentDB.id)
+    if limit is None:
+        return (await db.scalars(stmt)).all()
+    # One extra row tells us whether there is a next page
+    cons = (await db.scalars(stmt.limit(limit + 1))).all()
+    if len(cons) > limit:
+        cons = cons[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(cons[-1].id)
+    return cons
+
+#Search the token's consignments by consignee name and address, a page at a time
+#(declared before /{consignment_number} so "search" isn't taken for a number)
+@app.get("/api/consignment/search", response_model=ConSearchResult)
+async def search_cons(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    claims: dict = Depends(get_current_account_claims),
+):
+    token_account_no = claims.get("account_no")
+    if not token_account_no:
+        raise HTTPException(status_code=403, detail="Token not valid for this account")
+
+    stmt = search_stmt(db.bind.dialect.name, token_account_no, q).order_by(ConsignmentDB.consignment_number)
+    if cursor is not None:
+        stmt = stmt.where(ConsignmentDB.consignment_number > decode_cursor(cursor))
+    cons = (await db.scalars(stmt.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(cons) > limit:
+        cons = cons[:limit]
+        next_cursor = encode_cursor(cons[-1].consignment_number)
+    return {"consignments": cons, "next_cursor": next_cursor}
 
 #Get consignments by con number
 @app.get("/api/consignment/{consignment_number}", response_model=ConRead)
-def get_con_by_number(consignment_number: int, db: Session = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
+async def get_con_by_number(consignment_number: int, request: Request, db: AsyncSession = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
+    cached = get_cached_con(consignment_number)
+    if cached is not None:
+        account_no, etag, body = cached
+    else:
+        generation = response_cache.generation
+        stmt = select(ConsignmentDB).where(ConsignmentDB.consignment_number==consignment_number)
+        con = (await db.execute(stmt)).scalar_one_or_none()
+        if not con:
+            # Delivered and old consignments have moved to the archive
+            con = await find_archived(db, consignment_number)
+        if not con:
+            raise HTTPException(status_code=404, detail="Consignment not found")
+        account_no, etag, body = con.account_no, con_etag(con.consignment_number, con.version), None
+
+    # Cached or not, the token has to match the consignment's account
+    token_account_no = claims.get("account_no")
+    if not token_account_no or token_account_no != account_no:
+        raise HTTPException(status_code=403, detail="Token not valid for this account")
+
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if body is None:
+        body = ConRead.model_validate(con, from_attributes=True).model_dump_json().encode()
+        cache_con(consignment_number, account_no, etag, body, generation)
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+
+#Get the PDF label for a consignment
+@app.get("/api/consignment/{consignment_number}/label")
+async def get_con_label(consignment_number: int, db: AsyncSession = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
     stmt = select(ConsignmentDB).where(ConsignmentDB.consignment_number==consignment_number)
-    con = db.execute(stmt).scalar_one_or_none()
+    con = (await db.execute(stmt)).scalar_one_or_none()
+    if not con:
+        con = await find_archived(db, consignment_number)
     if not con:
         raise HTTPException(status_code=404, detail="Consignment not found")
-    
+
     token_account_no = claims.get("account_no")
     if not token_account_no or token_account_no != con.account_no:
         raise HTTPException(status_code=403, detail="Token not valid for this account")
 
-    return con
+    job = label_pool.pending(consignment_number)
+    if job is None and not await asyncio.to_thread(label_store.exists, consignment_number):
+        # Never rendered (or the file was lost), queue it now
+        job = label_pool.submit(con)
+
+    if job is not None:
+        await asyncio.wait([job], timeout=LABEL_WAIT)
+        if not job.done():
+            return Response(status_code=202, headers={"Retry-After": "1"})
+        if job.cancelled() or job.exception() is not None:
+            raise HTTPException(status_code=500, detail="Label rendering failed")
+
+    filename = f"label_{consignment_number}.pdf"
+    path = label_store.local_path(consignment_number)
+    if path is not None:
+        return FileResponse(path, media_type="application/pdf", filename=filename)
+    return Response(
+        await asyncio.to_thread(label_store.get, consignment_number),
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+#Bulk labels for a depot, an account or a list of cons, as one PDF
+@app.get("/api/manifest/labels")
+def manifest_labels(
+    depot: int | None = None,
+    account_no: str | None = None,
+    consignment_number: list[int] | None = Query(None),
+    layout: Literal["a6", "a4"] = "a6",
+    db: Session = Depends(get_sync_db),
+    claims: dict = Depends(get_current_account_claims),
+):
+    filters = []
+    if depot is not None:
+        filters.append(ConsignmentDB.delivery_depot == depot)
+    if account_no is not None:
+        filters.append(ConsignmentDB.account_no == account_no)
+    if consignment_number:
+        filters.append(ConsignmentDB.consignment_number.in_(consignment_number))
+    if len(filters) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="Give exactly one of depot, account_no or consignment_number"
+        )
+
+    # A depot's labels span accounts, so they are for admin tokens only; any
+    # other manifest is held to the token's account
+    if claims.get("role") != ADMIN_ROLE:
+        token_account_no = claims.get("account_no")
+        if depot is not None:
+            raise HTTPException(status_code=403, detail="Admin token required")
+        if not token_account_no or (account_no is not None and account_no != token_account_no):
+            raise HTTPException(status_code=403, detail="Token not valid for this account")
+        filters.append(ConsignmentDB.account_no == token_account_no)
+
+    if db.execute(select(ConsignmentDB.id).where(*filters).limit(1)).first() is None:
+        raise HTTPException(status_code=404, detail="No Consignments found")
+
+    # Only the columns the label needs, page by page off a streaming cursor
+    stmt = (select(*(getattr(ConsignmentDB, f) for f in LABEL_FIELDS))
+            .where(*filters)
+            .order_by(ConsignmentDB.consignment_number))
+    return StreamingResponse(
+        label_template.stream_sheet(stream_rows_sync(db, stmt), layout),
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'inline; filename="manifest.pdf"'},
+    )
+
+
+#Bulk export for billing / analytics jobs, across every account
+@app.get("/api/export/consignments", dependencies=[Depends(require_admin)])
+def export_cons(
+    format: Literal["csv", "ndjson", "parquet", "arrow"] = "csv",
+    gzip: bool = False,
+    account_no: str | None = None,
+    depot: int | None = None,
+    from_con: int | None = None,
+    to_con: int | None = None,
+    db: Session = Depends(get_sync_db),
+):
+    stmt = export_stmt(account_no, depot, from_con, to_con)
+    try:
+        body = export(stream_chunks_sync(db, stmt, EXPORT_CHUNK_SIZE), format, gzip)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename(format, gzip)}"'},
+    )
 
 
 #Get all cons from a particular account 
 @app.get("/api/consignment/account/{account_no}", response_model=ConList)
-async def list_con_for_account(account_no: str, db: Session = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
+async def list_con_for_account(
+    account_no: str,
+    request: Request,
+    response: Response,
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    claims: dict = Depends(get_current_account_claims),
+):
     token_account_no = claims.get("account_no")
     if not token_account_no or token_account_no != account_no:
         raise HTTPException(status_code=403, detail="Token not valid for this account")
 
-    validate_account_exists(account_no)
+    await validate_account_exists(account_no)
+    limit = page_limit(limit, cursor)
 
     stmt = (select(ConsignmentDB.consignment_number)
             .where(ConsignmentDB.account_no == account_no)
             .order_by(ConsignmentDB.consignment_number))
-    con = db.execute(stmt).scalars().all()
-    if not con: 
+    if cursor is not None:
+        stmt = stmt.where(ConsignmentDB.consignment_number > decode_cursor(cursor))
+
+    if wants_ndjson(request):
+        return StreamingResponse(ndjson_lines(stream_chunks(db, stmt)), media_type=NDJSON)
+
+    # The counter is read before the list, so the ETag is never newer than the page
+    etag = list_etag(account_no, await get_account_version(db, account_no), cursor, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    con = (await db.scalars(stmt if limit is None else stmt.limit(limit + 1))).all()
+    if not con and cursor is None:
          raise HTTPException(status_code=404, detail="No Consignments found for this account")
+
+    if limit is not None and len(con) > limit:
+        con = con[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(con[-1])
+    response.headers["ETag"] = etag
     return {
         "account_no": account_no,
         "consignments": con
     }
 
 
+#Counts and weight for the ops dashboards, from the summary tables (admin only)
+@app.get("/api/summary/depot", response_model=list[DepotSummary], dependencies=[Depends(require_admin)])
+async def summary_by_depot(depot: int | None = None, db: AsyncSession = Depends(get_db)):
+    return await depot_summary(db, depot)
+
+@app.get("/api/summary/account", response_model=list[AccountSummary], dependencies=[Depends(require_admin)])
+async def summary_by_account(account_no: str | None = None, db: AsyncSession = Depends(get_db)):
+    return await account_summary(db, account_no)
+
+
 #Create Consignment
 @app.post("/api/consignment", response_model=ConRead, status_code=201)
-async def create_con(con: ConCreate, db: Session = Depends(get_db)):
-    #Check if account exists
-    validate_account_exists(con.account_no)
-
-    #get next con number
-    next_num = await get_next_con_num(con.account_no)
-    #Get depot number
-    depot_number = await resolve_depot_number(con.addressline4)
-    
+async def create_con(con: ConCreate, db: AsyncSession = Depends(get_db)):
+    #Check the account, get the next con number and the depot
+    next_num, depot_number = await resolve_con_refs(con)
+
     con_db = ConsignmentDB(
         **con.model_dump(),
         consignment_number=next_num,
@@ -118,15 +584,21 @@ async def create_con(con: ConCreate, db: Session = Depends(get_db)):
     )
 
     db.add(con_db)
-    commit_or_rollback(db, "Consignment creation failed")
-    db.refresh(con_db)
-    # Generate PDF label
-    generate_label_pdf(con_db)
+    await bump_account_versions(db, con_db.account_no)
+    delta = SummaryDelta()
+    delta.added(con_db)
+    await apply_delta(db, delta)
+    await commit_or_rollback(db, "Consignment creation failed", [(CREATED, con_db)])
+    await db.refresh(con_db)
+    invalidate_con(con_db.consignment_number)
+    notify_publisher()
+    # Generate PDF label in the background
+    label_pool.submit(con_db)
     return con_db
 
 #Create Consignment w Auth
 @app.post("/api/consignment/auth", response_model=ConRead, status_code=201)
-async def create_con(con: ConCreate, db: Session = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
+async def create_con(con: ConCreate, db: AsyncSession = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
     
     token_account_no = claims.get("account_no")
     if not token_account_no or token_account_no != con.account_no:
@@ -135,14 +607,9 @@ async def create_con(con: ConCreate, db: Session = Depends(get_db), claims: dict
             detail="Token not valid for this account",
         )
     
-    #Check if account exists
-    validate_account_exists(con.account_no)
+    #Check the account, get the next con number and the depot
+    next_num, depot_number = await resolve_con_refs(con)
 
-    #get next con number
-    next_num = await get_next_con_num(con.account_no)
-    #Get depot number
-    depot_number = await resolve_depot_number(con.addressline4)
-    
     con_db = ConsignmentDB(
         **con.model_dump(),
         consignment_number=next_num,
@@ -150,24 +617,131 @@ async def create_con(con: ConCreate, db: Session = Depends(get_db), claims: dict
     )
 
     db.add(con_db)
-    commit_or_rollback(db, "Consignment creation failed")
-    db.refresh(con_db)
-    # Generate PDF label
-    generate_label_pdf(con_db)
+    await bump_account_versions(db, con_db.account_no)
+    delta = SummaryDelta()
+    delta.added(con_db)
+    await apply_delta(db, delta)
+    await commit_or_rollback(db, "Consignment creation failed", [(CREATED, con_db)])
+    await db.refresh(con_db)
+    invalidate_con(con_db.consignment_number)
+    notify_publisher()
+    # Generate PDF label in the background
+    label_pool.submit(con_db)
     return con_db
     
 
+#Create many Consignments in one go
+@app.post("/api/consignment/batch", response_model=ConBatchResult)
+async def create_con_batch(cons: list[ConCreate], db: AsyncSession = Depends(get_db)):
+    if not cons:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(cons) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large (max {MAX_BATCH_SIZE} consignments)"
+        )
+
+    # index -> reason, one bad item must not sink the rest of the wave
+    errors: dict[int, str] = {}
+
+    #Check each account once
+    bad_accounts: dict[str, str] = {}
+    for account_no in dict.fromkeys(c.account_no for c in cons):
+        try:
+            await validate_account_exists(account_no)
+        except HTTPException as e:
+            bad_accounts[account_no] = e.detail
+
+    #Get depot number once per county
+    depots: dict[str, int] = {}
+    for area in dict.fromkeys(c.addressline4 for c in cons):
+        try:
+            depots[area] = await resolve_depot_number(area)
+        except HTTPException:
+            pass
+
+    pending: dict[str, list[int]] = {}
+    for i, con in enumerate(cons):
+        if con.account_no in bad_accounts:
+            errors[i] = bad_accounts[con.account_no]
+        elif con.addressline4 not in depots:
+            errors[i] = f"Could not resolve depot for '{con.addressline4}'"
+        else:
+            pending.setdefault(con.account_no, []).append(i)
+
+    #Reserve all con numbers for an account in one call
+    numbers: dict[int, int] = {}
+    for account_no, indexes in pending.items():
+        try:
+            nums = await allocate_con_nums(account_no, len(indexes))
+        except HTTPException:
+            for i in indexes:
+                errors[i] = "Could not allocate consignment number"
+            continue
+        numbers.update(zip(indexes, nums))
+
+    # Numbers already in the table would fail the whole insert, so drop them up front
+    if numbers:
+        stmt = (select(ConsignmentDB.consignment_number)
+                .where(ConsignmentDB.consignment_number.in_(numbers.values())))
+        taken = set((await db.scalars(stmt)).all())
+        for i, num in list(numbers.items()):
+            if num in taken:
+                errors[i] = f"Consignment number {num} already exists"
+                del numbers[i]
+
+    created: dict[int, ConsignmentDB] = {}
+    for i, num in numbers.items():
+        created[i] = ConsignmentDB(
+            **cons[i].model_dump(),
+            consignment_number=num,
+            delivery_depot=depots[cons[i].addressline4]
+        )
+
+    # Single transaction for the whole wave
+    db.add_all(created.values())
+    await bump_account_versions(db, *(c.account_no for c in created.values()))
+    delta = SummaryDelta()
+    for con_db in created.values():
+        delta.added(con_db)
+    await apply_delta(db, delta)
+    await commit_or_rollback(db, "Consignment batch creation failed",
+                             [(CREATED, c) for c in created.values()])
+    invalidate_con(*(c.consignment_number for c in created.values()))
+    notify_publisher()
+
+    # Generate PDF labels in the background
+    for con_db in created.values():
+        label_pool.submit(con_db)
+
+    results = []
+    for i in range(len(cons)):
+        if i in created:
+            results.append({"index": i, "ok": True, "consignment": created[i]})
+        else:
+            results.append({"index": i, "ok": False, "error": errors[i]})
+
+    return {
+        "created": len(created),
+        "failed": len(cons) - len(created),
+        "results": results
+    }
+    
+
+async def archived_or_404(db: AsyncSession, consignment_number: int):
+    # Archived consignments can still be read, but not changed
+    if await find_archived(db, consignment_number) is not None:
+        raise HTTPException(status_code=409, detail="Consignment is archived and can't be changed")
+    raise HTTPException(status_code=404, detail="Consignment not found")
+
 #Patch Consignment 
 @app.patch("/api/consignment/{consignment_number}", response_model=ConRead)
-async def edit_consignment(consignment_number: int, payload: ConEdit, db: Session = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
+async def edit_consignment(consignment_number: int, payload: ConEdit, db: AsyncSession = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
 
     stmt = select(ConsignmentDB).where(ConsignmentDB.consignment_number == consignment_number)
-    con = db.execute(stmt).scalar_one_or_none()
+    con = (await db.execute(stmt)).scalar_one_or_none()
     if not con:
-        raise HTTPException(
-            status_code=404, 
-            detail="Consignment not found"
-            )
+        await archived_or_404(db, consignment_number)
     
     token_account_no = claims.get("account_no")
     if not token_account_no or token_account_no != con.account_no:
@@ -177,6 +751,7 @@ async def edit_consignment(consignment_number: int, payload: ConEdit, db: Sessio
         )
     
     updates = payload.model_dump(exclude_unset=True)
+    before = snapshot(con)
 
     # If county/addressline4 is changed, reevaluate depot
     if "addressline4" in updates:
@@ -184,31 +759,45 @@ async def edit_consignment(consignment_number: int, payload: ConEdit, db: Sessio
         depot_number = await resolve_depot_number(new_county)
         con.delivery_depot = depot_number
 
+    # Moving a consignment changes both accounts' lists
+    if updates.get("account_no", con.account_no) != con.account_no:
+        await bump_account_versions(db, con.account_no, updates["account_no"])
+
     for key, value in updates.items():
         setattr(con, key, value)
 
-    commit_or_rollback(db, "Invalid Consignment Details")
-    db.refresh(con)
-    generate_label_pdf(con)
+    delta = SummaryDelta()
+    delta.changed(before, con)
+    await apply_delta(db, delta)
+    await commit_or_rollback(db, "Invalid Consignment Details", [(UPDATED, con)])
+    await db.refresh(con)
+    invalidate_con(consignment_number)
+    notify_publisher()
+    label_pool.submit(con)
     
     return con
     
 #Delete Consignment
 @app.delete("/api/consignment/{consignment_number}", status_code=204)
-def delete_consignment(consignment_number: int, db: Session = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
+async def delete_consignment(consignment_number: int, db: AsyncSession = Depends(get_db), claims: dict = Depends(get_current_account_claims)):
     stmt = select(ConsignmentDB).where(ConsignmentDB.consignment_number == consignment_number)
-    con = db.execute(stmt).scalar_one_or_none()
+    con = (await db.execute(stmt)).scalar_one_or_none()
     if not con:
-        raise HTTPException(
-            status_code=404, 
-            detail="Consignment not found"
-            )
+        await archived_or_404(db, consignment_number)
     token_account_no = claims.get("account_no")
     if not token_account_no or token_account_no != con.account_no:
         raise HTTPException(
             status_code=403,
             detail="Token not valid for this account",
             )
-    db.delete(con)
-    db.commit()
+    await db.delete(con)
+    await bump_account_versions(db, con.account_no)
+    delta = SummaryDelta()
+    delta.removed(con)
+    await apply_delta(db, delta)
+    await commit_or_rollback(db, "Consignment delete failed", [(DELETED, con)])
+    invalidate_con(consignment_number)
+    notify_publisher()
+    # Its label goes too, once any render still queued for it is done
+    label_pool.delete(consignment_number)
     
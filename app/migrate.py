@@ -0,0 +1,92 @@
+import argparse
+import importlib
+import pkgutil
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select, text
+from sqlalchemy.engine import Engine
+
+from . import migrations
+
+# Bookkeeping table, one row per applied migration
+meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+# Arbitrary key so concurrent workers on Postgres take turns migrating
+PG_LOCK_KEY = 7_250_001
+
+
+def discover() -> list:
+    mods = [
+        importlib.import_module(f"{migrations.__name__}.{info.name}")
+        for info in pkgutil.iter_modules(migrations.__path__)
+    ]
+    mods.sort(key=lambda m: m.VERSION)
+    versions = [m.VERSION for m in mods]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f"Duplicate migration versions: {versions}")
+    return mods
+
+
+def applied_versions(engine: Engine) -> set[int]:
+    with engine.begin() as conn:
+        meta.create_all(conn, checkfirst=True)
+        return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def run_migrations(engine: Engine, target: int | None = None) -> list[int]:
+    # Each migration and its bookkeeping row commit together
+    done = applied_versions(engine)
+    applied = []
+    for mod in discover():
+        if mod.VERSION in done or (target is not None and mod.VERSION > target):
+            continue
+        with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": PG_LOCK_KEY})
+                # someone else may have applied it while we waited
+                already = conn.execute(
+                    select(schema_migrations.c.version).where(schema_migrations.c.version == mod.VERSION)
+                ).first()
+                if already:
+                    continue
+            mod.upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=mod.VERSION,
+                description=mod.DESCRIPTION,
+                applied_at=datetime.now(timezone.utc),
+            ))
+        applied.append(mod.VERSION)
+    return applied
+
+
+def status(engine: Engine) -> list[tuple[int, str, bool]]:
+    done = applied_versions(engine)
+    return [(m.VERSION, m.DESCRIPTION, m.VERSION in done) for m in discover()]
+
+
+def main(argv=None):
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Database migrations")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    up = sub.add_parser("upgrade", help="apply pending migrations")
+    up.add_argument("--to", type=int, help="stop after this version")
+    sub.add_parser("status", help="list migrations and whether they're applied")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "upgrade":
+        applied = run_migrations(engine, args.to)
+        print(f"applied: {applied}" if applied else "already up to date")
+    else:
+        for version, description, done in status(engine):
+            print(f"{version:04d} [{'x' if done else ' '}] {description}")
+
+
+if __name__ == "__main__":
+    main()
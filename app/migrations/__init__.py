@@ -0,0 +1,3 @@
+# Versioned schema migrations, applied in VERSION order by app.migrate.
+# Each module defines VERSION, DESCRIPTION and upgrade(conn). Once a migration
+# has shipped, don't edit it; add a new one.
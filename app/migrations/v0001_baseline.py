@@ -0,0 +1,24 @@
+from sqlalchemy import MetaData, Table, Column, Integer, String
+
+VERSION = 1
+DESCRIPTION = "consignments table"
+
+
+def upgrade(conn):
+    # The schema as Base.metadata.create_all built it before migrations existed,
+    # so databases created that way are picked up as already at this version
+    meta = MetaData()
+    Table(
+        "consignments", meta,
+        Column("id", Integer, primary_key=True),
+        Column("account_no", String, nullable=False),
+        Column("name", String(6), nullable=False),
+        Column("addressline1", String(30), nullable=False),
+        Column("addressline2", String(30), nullable=True),
+        Column("addressline3", String(30), nullable=False),
+        Column("addressline4", String(30), nullable=False),
+        Column("weight", Integer, nullable=False),
+        Column("consignment_number", Integer, nullable=False, unique=True),
+        Column("delivery_depot", Integer, nullable=False),
+    )
+    meta.create_all(conn, checkfirst=True)
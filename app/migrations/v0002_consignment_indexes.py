@@ -0,0 +1,17 @@
+from sqlalchemy import text
+
+VERSION = 2
+DESCRIPTION = "index consignments by account and by depot"
+
+
+def upgrade(conn):
+    # list_con_for_account filters on account_no and orders by consignment_number
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_consignments_account_no_consignment_number "
+        "ON consignments (account_no, consignment_number)"
+    ))
+    # manifests, exports and the re-depot job filter on delivery_depot
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_consignments_delivery_depot "
+        "ON consignments (delivery_depot)"
+    ))
@@ -0,0 +1,18 @@
+from sqlalchemy import MetaData, Table, Column, Integer, String, text
+
+VERSION = 3
+DESCRIPTION = "consignment row versions and per-account change counters"
+
+
+def upgrade(conn):
+    # Bumped on every UPDATE (optimistic locking), and what the ETag is built from
+    conn.execute(text("ALTER TABLE consignments ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+    # Bumped whenever a consignment joins or leaves an account's list
+    meta = MetaData()
+    Table(
+        "account_versions", meta,
+        Column("account_no", String, primary_key=True),
+        Column("version", Integer, nullable=False),
+    )
+    meta.create_all(conn, checkfirst=True)
@@ -0,0 +1,22 @@
+from sqlalchemy import JSON, MetaData, Table, Column, DateTime, Integer, String
+
+VERSION = 4
+DESCRIPTION = "outbox of consignment events for the publisher"
+
+
+def upgrade(conn):
+    # Written in the same transaction as the consignment change, deleted once
+    # the broker has confirmed it. With a single publisher, id order is publish
+    # order; several publishers skip each other's locked batches, so theirs
+    # can go out of order.
+    meta = MetaData()
+    Table(
+        "outbox", meta,
+        Column("id", Integer, primary_key=True),
+        Column("event_type", String, nullable=False),
+        Column("consignment_number", Integer, nullable=False),
+        Column("account_no", String, nullable=False),
+        Column("payload", JSON, nullable=False),
+        Column("created_at", DateTime(timezone=True), nullable=False),
+    )
+    meta.create_all(conn, checkfirst=True)
@@ -0,0 +1,32 @@
+from sqlalchemy import MetaData, Table, Column, Integer, String, text
+
+VERSION = 5
+DESCRIPTION = "per-depot and per-account consignment summaries"
+
+
+def upgrade(conn):
+    # Kept up to date by the handlers, in the same transaction as the change
+    meta = MetaData()
+    Table(
+        "depot_summary", meta,
+        Column("delivery_depot", Integer, primary_key=True),
+        Column("consignments", Integer, nullable=False),
+        Column("total_weight", Integer, nullable=False),
+    )
+    Table(
+        "account_summary", meta,
+        Column("account_no", String, primary_key=True),
+        Column("consignments", Integer, nullable=False),
+        Column("total_weight", Integer, nullable=False),
+    )
+    meta.create_all(conn, checkfirst=True)
+
+    # Start from what is already there
+    conn.execute(text(
+        "INSERT INTO depot_summary (delivery_depot, consignments, total_weight) "
+        "SELECT delivery_depot, COUNT(*), SUM(weight) FROM consignments GROUP BY delivery_depot"
+    ))
+    conn.execute(text(
+        "INSERT INTO account_summary (account_no, consignments, total_weight) "
+        "SELECT account_no, COUNT(*), SUM(weight) FROM consignments GROUP BY account_no"
+    ))
@@ -0,0 +1,46 @@
+from sqlalchemy import text
+
+VERSION = 6
+DESCRIPTION = "text search index over consignee name and address"
+
+COLUMNS = ("name", "addressline1", "addressline2", "addressline3", "addressline4")
+
+
+def upgrade(conn):
+    if conn.dialect.name == "postgresql":
+        # Generated column, so every write keeps it current in its own transaction
+        parts = " || ' ' || ".join(f"coalesce({c}, '')" for c in COLUMNS)
+        conn.execute(text(
+            "ALTER TABLE consignments ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('simple', {parts})) STORED"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_consignments_search ON consignments USING gin (search_vector)"
+        ))
+        return
+
+    # SQLite: FTS5 over the consignments rows (external content, so the text
+    # isn't stored twice), kept in step by triggers. account_no is indexed too
+    # so a search can be narrowed to one account inside the index.
+    cols = ("account_no",) + COLUMNS
+    names = ", ".join(cols)
+    new = ", ".join(f"new.{c}" for c in cols)
+    old = ", ".join(f"old.{c}" for c in cols)
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS consignments_fts USING fts5({names}, "
+        "content='consignments', content_rowid='id', prefix='2 3')"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS consignments_fts_ai AFTER INSERT ON consignments BEGIN "
+        f"INSERT INTO consignments_fts (rowid, {names}) VALUES (new.id, {new}); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS consignments_fts_ad AFTER DELETE ON consignments BEGIN "
+        f"INSERT INTO consignments_fts (consignments_fts, rowid, {names}) VALUES ('delete', old.id, {old}); END"
+    ))
+    conn.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS consignments_fts_au AFTER UPDATE OF {names} ON consignments BEGIN "
+        f"INSERT INTO consignments_fts (consignments_fts, rowid, {names}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO consignments_fts (rowid, {names}) VALUES (new.id, {new}); END"
+    ))
+    conn.execute(text("INSERT INTO consignments_fts (consignments_fts) VALUES ('rebuild')"))
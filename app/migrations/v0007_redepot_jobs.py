@@ -0,0 +1,20 @@
+from sqlalchemy import MetaData, Table, Column, DateTime, Integer, String
+
+VERSION = 7
+DESCRIPTION = "progress of bulk re-depot jobs"
+
+
+def upgrade(conn):
+    # One row per remapped area. last_id is the consignments.id the job has
+    # worked up to, committed with each chunk, so an interrupted job resumes there.
+    meta = MetaData()
+    Table(
+        "redepot_jobs", meta,
+        Column("area", String, primary_key=True),
+        Column("delivery_depot", Integer, nullable=False),
+        Column("status", String, nullable=False),
+        Column("last_id", Integer, nullable=False),
+        Column("changed", Integer, nullable=False),
+        Column("updated_at", DateTime(timezone=True), nullable=False),
+    )
+    meta.create_all(conn, checkfirst=True)
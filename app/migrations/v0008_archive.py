@@ -0,0 +1,36 @@
+from sqlalchemy import MetaData, Table, Column, DateTime, Integer, String, text
+
+VERSION = 8
+DESCRIPTION = "consignment status and created_at, and the archive table"
+
+
+def upgrade(conn):
+    created_at = DateTime(timezone=True).compile(dialect=conn.dialect)
+    # SQLite can't add a column defaulting to the current time, so created_at is
+    # set by the app on insert. Rows already here are stamped with the time of
+    # the upgrade, which starts their ARCHIVE_AFTER_DAYS from now.
+    conn.execute(text(f"ALTER TABLE consignments ADD COLUMN created_at {created_at}"))
+    conn.execute(text("UPDATE consignments SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+    conn.execute(text("ALTER TABLE consignments ADD COLUMN status VARCHAR NOT NULL DEFAULT 'created'"))
+
+    # Where app/archive.py moves delivered, cancelled and aged-out consignments.
+    # Same columns, same ids, and only the lookup by number is indexed.
+    meta = MetaData()
+    Table(
+        "consignments_archive", meta,
+        Column("id", Integer, primary_key=True, autoincrement=False),
+        Column("account_no", String, nullable=False),
+        Column("name", String(6), nullable=False),
+        Column("addressline1", String(30), nullable=False),
+        Column("addressline2", String(30), nullable=True),
+        Column("addressline3", String(30), nullable=False),
+        Column("addressline4", String(30), nullable=False),
+        Column("weight", Integer, nullable=False),
+        Column("consignment_number", Integer, nullable=False, unique=True),
+        Column("delivery_depot", Integer, nullable=False),
+        Column("version", Integer, nullable=False),
+        Column("created_at", DateTime(timezone=True)),
+        Column("status", String, nullable=False),
+        Column("archived_at", DateTime(timezone=True), nullable=False),
+    )
+    meta.create_all(conn, checkfirst=True)
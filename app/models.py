@@ -1,12 +1,23 @@
+from datetime import datetime, timezone
+
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, ForeignKey
+from sqlalchemy import String, Integer, ForeignKey, Index, JSON, DateTime
 
 class Base(DeclarativeBase):
     pass
 
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
 class ConsignmentDB(Base):
     __tablename__ = "consignments"
+    # Created by migrations (app/migrations), declared here so create_all matches
+    __table_args__ = (
+        Index("ix_consignments_account_no_consignment_number", "account_no", "consignment_number"),
+        Index("ix_consignments_delivery_depot", "delivery_depot"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     account_no: Mapped[str] = mapped_column(String)
@@ -18,6 +29,79 @@ class ConsignmentDB(Base):
     weight: Mapped[int] = mapped_column(Integer, nullable=False)
     consignment_number: Mapped[int] = mapped_column(Integer, nullable=False, unique=True)
     delivery_depot: Mapped[int] = mapped_column(Integer, nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default="1")
+    created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), default=utcnow)
+    status: Mapped[str] = mapped_column(String, nullable=False, default="created", server_default="created")
     #eircode
     #country
-    
\ No newline at end of file
+
+    # UPDATEs check and bump version, so a lost update fails instead of overwriting
+    __mapper_args__ = {"version_id_col": version}
+
+
+# Delivered, cancelled and aged-out consignments, moved here by app/archive.py.
+# Same ids and columns as consignments, looked up by number only.
+class ConsignmentArchiveDB(Base):
+    __tablename__ = "consignments_archive"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    account_no: Mapped[str] = mapped_column(String)
+    name: Mapped[str] = mapped_column(String(6), nullable=False)
+    addressline1: Mapped[str] = mapped_column(String(30), nullable=False)
+    addressline2: Mapped[str] = mapped_column(String(30), nullable=True)
+    addressline3: Mapped[str] = mapped_column(String(30), nullable=False)
+    addressline4: Mapped[str] = mapped_column(String(30), nullable=False)
+    weight: Mapped[int] = mapped_column(Integer, nullable=False)
+    consignment_number: Mapped[int] = mapped_column(Integer, nullable=False, unique=True)
+    delivery_depot: Mapped[int] = mapped_column(Integer, nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True))
+    status: Mapped[str] = mapped_column(String, nullable=False)
+    archived_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class AccountVersionDB(Base):
+    __tablename__ = "account_versions"
+
+    account_no: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    
+
+class OutboxDB(Base):
+    __tablename__ = "outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    event_type: Mapped[str] = mapped_column(String, nullable=False)
+    consignment_number: Mapped[int] = mapped_column(Integer, nullable=False)
+    account_no: Mapped[str] = mapped_column(String, nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+# Counts and weight per depot and per account, maintained by app/summary.py
+class DepotSummaryDB(Base):
+    __tablename__ = "depot_summary"
+
+    delivery_depot: Mapped[int] = mapped_column(Integer, primary_key=True)
+    consignments: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_weight: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+class AccountSummaryDB(Base):
+    __tablename__ = "account_summary"
+
+    account_no: Mapped[str] = mapped_column(String, primary_key=True)
+    consignments: Mapped[int] = mapped_column(Integer, nullable=False)
+    total_weight: Mapped[int] = mapped_column(Integer, nullable=False)
+
+
+# Bulk re-depot progress, one row per remapped area (app/redepot.py)
+class RedepotJobDB(Base):
+    __tablename__ = "redepot_jobs"
+
+    area: Mapped[str] = mapped_column(String, primary_key=True)
+    delivery_depot: Mapped[int] = mapped_column(Integer, nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False)
+    last_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    changed: Mapped[int] = mapped_column(Integer, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
@@ -1,28 +1,46 @@
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A6
-from reportlab.lib import colors
-from reportlab.graphics.barcode import code128
-from reportlab.lib.units import mm
-
 import os
 
+# reportlab is imported when a label is drawn, not with the app; it is the
+# slowest import on the startup path and most workers never draw a label.
 
 LABEL_DIR = "labels"
-os.makedirs(LABEL_DIR, exist_ok=True)
+
+# reportlab.lib.units.mm and pagesizes, without importing reportlab
+mm = 72.0 / 2.54 * 0.1
+A6 = (105 * mm, 148 * mm)
+A4 = (210 * mm, 297 * mm)
+
+#Box Dims
+BOX_X = 15
+BOX_Y = 150
+BOX_WIDTH = 200
+BOX_HEIGHT = 220
+RULE_Y = 340
+BARCODE_HEIGHT = 18*mm
+BARCODE_BAR_WIDTH = 2
+
+
+def ensure_dir(filepath: str):
+    # The label directory is created by the first write rather than at import
+    os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+
 
 def generate_label_pdf(consignment):
+    from reportlab.pdfgen import canvas
+    from reportlab.lib import colors
+    from reportlab.graphics.barcode import code128
 
     filename = f"label_{consignment.consignment_number}.pdf"
     filepath = os.path.join(LABEL_DIR, filename)
+    ensure_dir(filepath)
 
     # Create Blank PDF
     c = canvas.Canvas(filepath, pagesize=A6)
 
-    #Box Dims
-    box_x = 15
-    box_y = 150
-    box_width = 200
-    box_height = 220
+    box_x = BOX_X
+    box_y = BOX_Y
+    box_width = BOX_WIDTH
+    box_height = BOX_HEIGHT
     # Label Layout
     c.setLineWidth(1)
     c.setStrokeColor(colors.black)
@@ -31,7 +49,7 @@ def generate_label_pdf(consignment):
     c.setFont("Helvetica", 10)
     c.drawString(20, 350, f"Account: {consignment.account_no}")
 
-    c.line(15, 340, 215, 340)
+    c.line(box_x, RULE_Y, box_x + box_width, RULE_Y)
 
     c.drawString(20, 320, f"{consignment.name}")
     c.drawString(20, 300, f"{consignment.addressline1}")
@@ -59,7 +77,7 @@ def generate_label_pdf(consignment):
 
     barcode_value = str(consignment.consignment_number) 
 
-    barcode = code128.Code128(barcode_value, barHeight=18*mm, barWidth=2)
+    barcode = code128.Code128(barcode_value, barHeight=BARCODE_HEIGHT, barWidth=BARCODE_BAR_WIDTH)
 
    
     barcode_x = box_x + (box_width - barcode.width) / 2
@@ -73,4 +91,4 @@ def generate_label_pdf(consignment):
 
     c.save()
 
-    return filepath
\ No newline at end of file
+    return filepath
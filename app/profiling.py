@@ -0,0 +1,215 @@
+import asyncio
+import cProfile
+import json
+import os
+import random
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+# Opt-in per-request profiling. With PROFILING_ENABLED on, a request is profiled
+# when it carries the PROFILE_HEADER header or ?profile= query flag, or when it
+# is picked by the per-route sample rate. Each profile is a cProfile .prof file
+# (snakeviz / flameprof / gprof2dot) plus a .json file listing the SQL and
+# upstream calls the request made, with timings.
+#
+# The profiler is only switched on while the request's own task is running, so
+# other requests on the event loop neither show up in the .prof nor pay for
+# it. Work the request hands to other tasks (create's concurrent upstream
+# lookups) or to threads (sync endpoints) is in the .json trace but not the .prof.
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile").lower()
+PROFILE_QUERY_PARAM = os.getenv("PROFILE_QUERY_PARAM", "profile")
+# If set, the header / query flag must carry this value, not just "1"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# Fraction of requests profiled on every route, and overrides per route as
+# "POST /api/consignment=0.05,PATCH /api/consignment/{consignment_number}=0.1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ROUTE_RATES = os.getenv("PROFILE_ROUTE_RATES", "")
+# Long statements are cut down in the .json so a bulk insert doesn't swamp it
+MAX_STATEMENT_LEN = 500
+
+
+def parse_route_rates(value: str) -> dict[str, float]:
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, rate = item.rpartition("=")
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+route_rates = parse_route_rates(PROFILE_ROUTE_RATES)
+
+
+@dataclass
+class RequestTrace:
+    sql: list[dict] = field(default_factory=list)
+    upstream: list[dict] = field(default_factory=list)
+
+
+# Set only while a profiled request is running, so the hooks below cost one
+# ContextVar.get for everybody else
+current_trace: ContextVar[RequestTrace | None] = ContextVar("current_trace", default=None)
+
+
+def record_upstream(service: str, method: str, url: str, status: str, elapsed: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.upstream.append({
+            "service": service, "method": method, "url": url,
+            "status": status, "ms": round(elapsed * 1000, 3),
+        })
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_trace.get() is not None:
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = current_trace.get()
+    starts = conn.info.get("profile_start")
+    if trace is None or not starts:
+        return
+    trace.sql.append({
+        "statement": " ".join(statement.split())[:MAX_STATEMENT_LEN],
+        "executemany": executemany,
+        "ms": round((time.perf_counter() - starts.pop()) * 1000, 3),
+    })
+
+
+def _handle_error(context):
+    starts = context.connection.info.get("profile_start") if context.connection is not None else None
+    if starts and current_trace.get() is not None:
+        starts.pop()
+
+
+event.listen(Engine, "before_cursor_execute", _before_execute)
+event.listen(Engine, "after_cursor_execute", _after_execute)
+event.listen(Engine, "handle_error", _handle_error)
+
+
+def requested(scope) -> bool:
+    # Header or query flag on this request
+    value = None
+    for name, raw in scope["headers"]:
+        if name == PROFILE_HEADER.encode():
+            value = raw.decode("latin-1")
+            break
+    if value is None:
+        query = scope.get("query_string", b"").decode("latin-1")
+        match = re.search(rf"(?:^|&){re.escape(PROFILE_QUERY_PARAM)}=([^&]*)", query)
+        value = match.group(1) if match else None
+    if not value:
+        return False
+    if PROFILE_TOKEN:
+        return value == PROFILE_TOKEN
+    return value.lower() not in ("0", "false", "no")
+
+
+def sample_rate(scope) -> float:
+    # Routing hasn't happened yet, so find the route template ourselves
+    if not route_rates:
+        return PROFILE_SAMPLE_RATE
+    app = scope.get("app")
+    for route in getattr(app, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            key = f"{scope['method']} {route.path}"
+            if key in route_rates:
+                return route_rates[key]
+            return route_rates.get(route.path, PROFILE_SAMPLE_RATE)
+    return PROFILE_SAMPLE_RATE
+
+
+def write_profile(profile_id: str, profiler: cProfile.Profile, info: dict) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    profiler.dump_stats(base + ".prof")
+    with open(base + ".json", "w") as f:
+        json.dump(info, f, indent=2)
+    return base
+
+
+class _Profiled:
+    # Awaits a coroutine with the profiler on only while the coroutine itself
+    # runs; it goes off at every suspension, while other tasks have the loop
+    def __init__(self, coro, profiler: cProfile.Profile):
+        self.coro = coro
+        self.profiler = profiler
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            self.profiler.enable()
+            try:
+                if error is None:
+                    yielded = self.coro.send(value)
+                else:
+                    yielded = self.coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profiler.disable()
+            try:
+                value, error = (yield yielded), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILING_ENABLED:
+            return await self.app(scope, receive, send)
+        trigger = "request" if requested(scope) else None
+        if trigger is None:
+            rate = sample_rate(scope)
+            if rate <= 0 or random.random() >= rate:
+                return await self.app(scope, receive, send)
+            trigger = "sample"
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{scope['method']}-{uuid.uuid4().hex[:8]}"
+        status = 500
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = [*message["headers"], (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        trace = RequestTrace()
+        token = current_trace.set(trace)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            await _Profiled(self.app(scope, receive, send_wrapper), profiler)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_trace.reset(token)
+            route = scope.get("route")
+            info = {
+                "id": profile_id,
+                "trigger": trigger,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": route.path if route is not None else None,
+                "status": status,
+                "ms": round(elapsed * 1000, 3),
+                "sql_ms": round(sum(s["ms"] for s in trace.sql), 3),
+                "upstream_ms": round(sum(u["ms"] for u in trace.upstream), 3),
+                "sql": trace.sql,
+                "upstream": trace.upstream,
+            }
+            await asyncio.to_thread(write_profile, profile_id, profiler, info)
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, case, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .database import AsyncSessionLocal, upsert_insert
+from .label_jobs import label_pool
+from .metrics import REGISTRY
+from .models import ConsignmentDB, OutboxDB, RedepotJobDB
+from .outbox import UPDATED, event_row, notify_publisher
+from .summary import SummaryDelta, apply_delta
+from .utils.etag import bump_account_versions, invalidate_con
+from .utils.gazzing import normalise_area
+
+# Moves consignments onto a new depot after the gazetteer remaps an area.
+# remap() records one job row per area whose consignments sit on the wrong
+# depot; run() walks consignments.id once, in chunks, for all of them, and per
+# chunk moves every mismatched row with one UPDATE whose CASE maps each stored
+# spelling of an area to its new depot. Each chunk commits on its own with the
+# summary deltas, outbox events and job progress, so locks are short and an
+# interrupted run resumes from the last committed chunk. Rows already on the
+# right depot are left alone, so running a job twice changes nothing the
+# second time. Labels are re-rendered for the moved rows only.
+
+REDEPOT_CHUNK_SIZE = int(os.getenv("REDEPOT_CHUNK_SIZE", "5000"))
+
+PENDING = "pending"
+DONE = "done"
+
+logger = logging.getLogger(__name__)
+
+redepot_rows = REGISTRY.counter(
+    "redepot_rows_changed_total", "Consignments moved to a new depot by re-depot jobs")
+
+# Every column: the outbox event carries the whole consignment
+RETURNED = list(ConsignmentDB.__table__.columns)
+
+
+async def area_variants(db: AsyncSession) -> dict[str, dict[str, set[int]]]:
+    # normalised area -> addressline4 as typed -> depots in use. One grouped
+    # scan; the UPDATEs then match the exact stored spellings.
+    rows = await db.execute(
+        select(ConsignmentDB.addressline4, ConsignmentDB.delivery_depot)
+        .group_by(ConsignmentDB.addressline4, ConsignmentDB.delivery_depot)
+    )
+    areas: dict[str, dict[str, set[int]]] = {}
+    for spelling, depot in rows:
+        areas.setdefault(normalise_area(spelling), {}).setdefault(spelling, set()).add(depot)
+    return areas
+
+
+class RedepotJob:
+    def __init__(self, session_factory: async_sessionmaker, chunk_size: int = REDEPOT_CHUNK_SIZE,
+                 labels=label_pool):
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.labels = labels
+        self._task: asyncio.Task | None = None
+        self._starting = False
+        self.changed = 0
+        self.scanned = 0 # ids covered so far, out of total
+        self.total = 0
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.error: str | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._starting or (self._task is not None and not self._task.done())
+
+    @contextmanager
+    def starting(self):
+        # Counts as running from here until start(), across whatever the
+        # caller awaits in between, so a second caller can't start it too
+        if self.running:
+            raise RuntimeError("A re-depot job is already running")
+        self._starting = True
+        try:
+            yield
+        finally:
+            self._starting = False
+
+    async def remap(self, depots: dict[str, int]) -> list[str]:
+        # depots: normalised area -> its depot now. Returns the areas that have
+        # consignments on another depot, each with a pending job row.
+        async with self.session_factory() as db:
+            async with db.begin():
+                found = await area_variants(db)
+                areas = sorted(
+                    area for area, depot in depots.items()
+                    if any(used != {depot} for used in found.get(area, {}).values())
+                )
+                now = datetime.now(timezone.utc)
+                for area in areas:
+                    stmt = upsert_insert(db, RedepotJobDB).values(
+                        area=area, delivery_depot=depots[area], status=PENDING,
+                        last_id=0, changed=0, updated_at=now,
+                    )
+                    # A fresh remap starts the area again; moved rows are skipped anyway
+                    await db.execute(stmt.on_conflict_do_update(
+                        index_elements=[RedepotJobDB.area],
+                        set_={"delivery_depot": stmt.excluded.delivery_depot, "status": PENDING,
+                              "last_id": 0, "changed": 0, "updated_at": now},
+                    ))
+        return areas
+
+    async def run(self) -> int:
+        # Works through every pending job, including ones an earlier run left
+        self.changed = self.scanned = self.total = 0
+        self.started_at, self.finished_at, self.error = time.monotonic(), None, None
+        try:
+            async with self.session_factory() as db:
+                jobs = (await db.scalars(
+                    select(RedepotJobDB).where(RedepotJobDB.status == PENDING).order_by(RedepotJobDB.area)
+                )).all()
+                if not jobs:
+                    return 0
+                found = await area_variants(db)
+                max_id = await db.scalar(select(func.max(ConsignmentDB.id))) or 0
+            # One pass for every pending area, from the one furthest behind.
+            # Rows added after this are created with the new depot already.
+            spellings = {job.area: sorted(found.get(job.area, {})) for job in jobs}
+            last_id = min(job.last_id for job in jobs)
+            self.total = max(0, max_id - last_id)
+
+            while last_id < max_id:
+                upto = min(last_id + self.chunk_size, max_id)
+                await self._chunk(spellings, upto)
+                self.scanned += upto - last_id
+                last_id = upto
+                logger.info("Re-depot of %d areas: up to id %d of %d, %d moved, %.0f rows/s",
+                            len(jobs), last_id, max_id, self.changed, self.rows_per_sec())
+            await self._finish(list(spellings))
+            return self.changed
+        except Exception as e:
+            self.error = repr(e)
+            raise
+        finally:
+            self.finished_at = time.monotonic()
+
+    async def _chunk(self, spellings: dict[str, list[str]], upto: int):
+        # spellings: area -> addressline4 as stored, for each job in the run
+        moved = []
+        async with self.session_factory() as db:
+            async with db.begin():
+                progress = (await db.scalars(
+                    select(RedepotJobDB)
+                    .where(RedepotJobDB.area.in_(list(spellings)), RedepotJobDB.status == PENDING)
+                    .order_by(RedepotJobDB.area)
+                    .with_for_update()
+                )).all()
+                # Each area from where it had got to
+                todo = [p for p in progress if p.last_id < upto and spellings[p.area]]
+                area_of = {s: p.area for p in todo for s in spellings[p.area]}
+                if todo:
+                    before = {r.id: r for r in await db.execute(
+                        select(ConsignmentDB.id, ConsignmentDB.delivery_depot,
+                               ConsignmentDB.account_no, ConsignmentDB.weight)
+                        .where(ConsignmentDB.id <= upto, or_(*(
+                            and_(
+                                ConsignmentDB.id > p.last_id,
+                                ConsignmentDB.addressline4.in_(spellings[p.area]),
+                                ConsignmentDB.delivery_depot != p.delivery_depot,
+                            )
+                            for p in todo
+                        )))
+                        .with_for_update()
+                    )}
+                    if before:
+                        new_depot = case(
+                            {s: p.delivery_depot for p in todo for s in spellings[p.area]},
+                            value=ConsignmentDB.addressline4,
+                        )
+                        # version goes up as for any other edit, so ETags and
+                        # optimistic locks see the change
+                        moved = (await db.execute(
+                            update(ConsignmentDB)
+                            .where(ConsignmentDB.id.in_(list(before)))
+                            .values(delivery_depot=new_depot, version=ConsignmentDB.version + 1)
+                            .returning(*RETURNED)
+                            .execution_options(synchronize_session=False)
+                        )).all()
+                        await self._record(db, before, moved)
+                moved_by_area = Counter(area_of[con.addressline4] for con in moved)
+                now = datetime.now(timezone.utc)
+                for p in todo:
+                    p.last_id = upto
+                    p.changed += moved_by_area[p.area]
+                    p.updated_at = now
+
+        if moved:
+            self.changed += len(moved)
+            redepot_rows.inc(amount=len(moved))
+            invalidate_con(*(con.consignment_number for con in moved))
+            notify_publisher()
+            for con in moved:
+                self.labels.submit(con)
+
+    async def _record(self, db: AsyncSession, before: dict, moved: list):
+        # Everything else a depot change touches, in the chunk's transaction
+        delta = SummaryDelta()
+        for con in moved:
+            old = before[con.id]
+            delta.changed((old.delivery_depot, old.account_no, old.weight), con)
+        await apply_delta(db, delta)
+        await bump_account_versions(db, *(con.account_no for con in moved))
+        # one executemany rather than an ORM insert per event
+        await db.execute(insert(OutboxDB), [event_row(UPDATED, con) for con in moved])
+
+    async def _finish(self, areas: list[str]):
+        async with self.session_factory() as db:
+            async with db.begin():
+                await db.execute(
+                    update(RedepotJobDB)
+                    .where(RedepotJobDB.area.in_(areas))
+                    .values(status=DONE, updated_at=datetime.now(timezone.utc))
+                )
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        self._task.add_done_callback(self._done)
+        return self._task
+
+    def _done(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Re-depot failed", exc_info=task.exception())
+
+    async def stop(self):
+        # Stops after rolling back the current chunk; run() picks up from there
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def rows_per_sec(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return self.scanned / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "rows_scanned": self.scanned,
+            "rows_total": self.total,
+            "rows_changed": self.changed,
+            "rows_per_sec": round(self.rows_per_sec(), 1),
+            "error": self.error,
+        }
+
+    async def jobs(self) -> list[RedepotJobDB]:
+        async with self.session_factory() as db:
+            return (await db.scalars(select(RedepotJobDB).order_by(RedepotJobDB.area))).all()
+
+
+redepot_job = RedepotJob(AsyncSessionLocal)
@@ -1,6 +1,7 @@
 # app/schemas.py
 from pydantic import BaseModel, EmailStr, constr, conint, field_validator, StringConstraints, Field
-from typing import Annotated, Optional, List
+from datetime import datetime
+from typing import Annotated, Literal, Optional, List
 from annotated_types import Ge, Le
 
 
@@ -14,6 +15,8 @@ AddLine2Str = Annotated[str, StringConstraints(min_length=2, max_length=30)]
 AddLine3Str = Annotated[str, StringConstraints(min_length=2, max_length=30)]
 AddLine4Str = Annotated[str, StringConstraints(min_length=2, max_length=30)]
 WeightInt = Annotated[int, Ge(1), Le(30)]
+# delivered and cancelled are final; app/archive.py moves those out of the hot table
+ConStatus = Literal["created", "in_transit", "delivered", "cancelled"]
 #eircode
 #country
 
@@ -39,6 +42,8 @@ class ConRead(BaseModel):
     #eircode
     delivery_depot: int
     weight: WeightInt
+    status: ConStatus = "created"
+    created_at: Optional[datetime] = None
 
 
 class ConEdit(BaseModel):
@@ -50,9 +55,39 @@ class ConEdit(BaseModel):
     addressline4: Optional[AddLine4Str] = None
     #eircode
     weight: Optional[WeightInt] = None
+    status: Optional[ConStatus] = None
 
 
 class ConList(BaseModel):
     account_no: AccountStr
     consignments: List[int]
 
+
+class ConSearchResult(BaseModel):
+    consignments: List[ConRead]
+    next_cursor: Optional[str] = None
+
+
+class ConBatchItemResult(BaseModel):
+    index: int # position of the item in the submitted list
+    ok: bool
+    consignment: Optional[ConRead] = None
+    error: Optional[str] = None
+
+
+class ConBatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[ConBatchItemResult]
+
+
+class DepotSummary(BaseModel):
+    delivery_depot: int
+    consignments: int
+    total_weight: int
+
+
+class AccountSummary(BaseModel):
+    account_no: str
+    consignments: int
+    total_weight: int
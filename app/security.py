@@ -1,21 +1,32 @@
+import hashlib
 import os
+import time
 import jwt
 from jwt import InvalidTokenError, ExpiredSignatureError, InvalidAudienceError, InvalidIssuerError
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from .utils.ttl_cache import TTLCache
+
 JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALG = os.getenv("JWT_ALG", "HS256")
 JWT_ISS = os.getenv("JWT_ISS", "auth-service")
 JWT_AUD = os.getenv("JWT_AUD", "dpd-app")
+# The "role" claim the operational endpoints (re-depot, cache flushes) require
+ADMIN_ROLE = os.getenv("ADMIN_ROLE", "admin")
 
-bearer_scheme = HTTPBearer(auto_error=True)
+# Verified claims, so a client reusing one bearer token isn't re-verified on
+# every call. Entries never outlive the token's exp, nor TOKEN_CACHE_TTL.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
 
-def decode_access_token(token: str) -> dict:
-    if not JWT_SECRET:
-        raise RuntimeError("JWT_SECRET is not set for this service")
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_CACHE_TTL)
 
+bearer_scheme = HTTPBearer(auto_error=True)
+
+def verify_access_token(token: str) -> dict:
+    # Full signature and claims check, no cache
     try:
         payload = jwt.decode(
             token,
@@ -32,6 +43,40 @@ def decode_access_token(token: str) -> dict:
         raise HTTPException(status_code=401, detail="Invalid token claims")
     except InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+
+def token_ttl(claims: dict) -> float:
+    exp = claims.get("exp")
+    if exp is None:
+        return TOKEN_CACHE_TTL
+    return min(TOKEN_CACHE_TTL, exp - time.time())
+
+
+def decode_access_token(token: str) -> dict:
+    if not JWT_SECRET:
+        raise RuntimeError("JWT_SECRET is not set for this service")
+
+    # Keyed by the secret too, so nothing verified under an old secret is served
+    # after a rotation. Only a hash of the token is kept.
+    key = (JWT_SECRET, hashlib.sha256(token.encode()).digest())
+    claims = token_cache.get(key)
+    if claims is None:
+        # rejected tokens raise here, so they are never cached
+        claims = verify_access_token(token)
+        ttl = token_ttl(claims)
+        if ttl > 0:
+            token_cache.set(key, claims, ttl)
+    return claims
+
+
+def invalidate_token_cache():
+    token_cache.invalidate()
+
+
+def rotate_jwt_secret(secret: str):
+    global JWT_SECRET
+    JWT_SECRET = secret
+    invalidate_token_cache()
     
 
 def get_current_account_claims(
@@ -39,3 +84,9 @@ def get_current_account_claims(
 ) -> dict:
     return decode_access_token(creds.credentials)
 
+
+def require_admin(claims: dict = Depends(get_current_account_claims)) -> dict:
+    if claims.get("role") != ADMIN_ROLE:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token required")
+    return claims
+
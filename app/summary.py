@@ -0,0 +1,153 @@
+import argparse
+import sys
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import upsert_insert
+from .models import AccountSummaryDB, ConsignmentDB, DepotSummaryDB
+
+# Consignment count and total weight per depot and per account. Handlers apply
+# the change a write makes to these rows in the same transaction as the write,
+# so the dashboards read a few small rows instead of grouping the whole table.
+#
+#   python -m app.summary verify    # recount and report drift, exit 1 if any
+#   python -m app.summary rebuild   # replace the summaries with a recount
+
+SUMMARIES = (
+    (DepotSummaryDB, ConsignmentDB.delivery_depot),
+    (AccountSummaryDB, ConsignmentDB.account_no),
+)
+
+
+class SummaryDelta:
+    # (count, weight) changes per depot and per account, netted out, so an edit
+    # that doesn't move anything touches no summary rows
+    def __init__(self):
+        self.depots: dict[int, Counter] = {}
+        self.accounts: dict[str, Counter] = {}
+
+    def _add(self, depot: int, account_no: str, count: int, weight: int):
+        for bucket, key in ((self.depots, depot), (self.accounts, account_no)):
+            c = bucket.setdefault(key, Counter())
+            c["consignments"] += count
+            c["total_weight"] += weight
+
+    def added(self, con):
+        self._add(con.delivery_depot, con.account_no, 1, con.weight)
+
+    def removed(self, con):
+        self._add(con.delivery_depot, con.account_no, -1, -con.weight)
+
+    def changed(self, before: tuple, con):
+        # before is snapshot(con) from ahead of the edit
+        depot, account_no, weight = before
+        self._add(depot, account_no, -1, -weight)
+        self.added(con)
+
+
+def snapshot(con) -> tuple:
+    return con.delivery_depot, con.account_no, con.weight
+
+
+async def apply_delta(db: AsyncSession, delta: SummaryDelta):
+    # Upserts in the caller's transaction, keys sorted so concurrent writers
+    # take the row locks in the same order
+    for model, changes in ((DepotSummaryDB, delta.depots), (AccountSummaryDB, delta.accounts)):
+        key = model.__table__.primary_key.columns.values()[0]
+        for value in sorted(changes):
+            c = changes[value]
+            if not c["consignments"] and not c["total_weight"]:
+                continue
+            stmt = upsert_insert(db, model).values({key.name: value, **c})
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[key],
+                set_={
+                    "consignments": model.consignments + stmt.excluded.consignments,
+                    "total_weight": model.total_weight + stmt.excluded.total_weight,
+                },
+            )
+            await db.execute(stmt)
+
+
+async def depot_summary(db: AsyncSession, depot: int | None = None) -> list[DepotSummaryDB]:
+    stmt = select(DepotSummaryDB).where(DepotSummaryDB.consignments > 0).order_by(DepotSummaryDB.delivery_depot)
+    if depot is not None:
+        stmt = stmt.where(DepotSummaryDB.delivery_depot == depot)
+    return (await db.scalars(stmt)).all()
+
+
+async def account_summary(db: AsyncSession, account_no: str | None = None) -> list[AccountSummaryDB]:
+    stmt = select(AccountSummaryDB).where(AccountSummaryDB.consignments > 0).order_by(AccountSummaryDB.account_no)
+    if account_no is not None:
+        stmt = stmt.where(AccountSummaryDB.account_no == account_no)
+    return (await db.scalars(stmt)).all()
+
+
+def recount(conn, column) -> dict:
+    rows = conn.execute(
+        select(column, func.count(), func.coalesce(func.sum(ConsignmentDB.weight), 0)).group_by(column)
+    )
+    return {key: (n, weight) for key, n, weight in rows}
+
+
+def stored(conn, model) -> dict:
+    key = model.__table__.primary_key.columns.values()[0]
+    rows = conn.execute(select(key, model.consignments, model.total_weight))
+    # a row that has dropped to zero is the same as no row
+    return {k: (n, weight) for k, n, weight in rows if n or weight}
+
+
+def verify(engine: Engine) -> list[tuple]:
+    # (table, key, stored (count, weight), actual (count, weight)) for each mismatch
+    drift = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # one snapshot for both reads, so writes in between don't look like drift
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        for model, column in SUMMARIES:
+            have, want = stored(conn, model), recount(conn, column)
+            for key in sorted(have.keys() | want.keys(), key=str):
+                if have.get(key, (0, 0)) != want.get(key, (0, 0)):
+                    drift.append((model.__tablename__, key, have.get(key, (0, 0)), want.get(key, (0, 0))))
+    return drift
+
+
+def rebuild(engine: Engine):
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Writers wait until the recount is in, so none of their deltas are lost
+            conn.execute(text("LOCK TABLE consignments IN SHARE MODE"))
+        for model, column in SUMMARIES:
+            conn.execute(delete(model))
+            key = model.__table__.primary_key.columns.values()[0].name
+            conn.execute(insert(model).from_select(
+                [key, "consignments", "total_weight"],
+                select(column, func.count(), func.coalesce(func.sum(ConsignmentDB.weight), 0)).group_by(column),
+            ))
+
+
+def main(argv=None):
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="Consignment summary tables")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("verify", help="recount and report any drift")
+    sub.add_parser("rebuild", help="replace the summaries with a full recount")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "rebuild":
+        rebuild(engine)
+        print("rebuilt")
+        return 0
+    drift = verify(engine)
+    for table, key, have, want in drift:
+        print(f"{table} {key}: stored {have[0]} / {have[1]}kg, actual {want[0]} / {want[1]}kg")
+    print(f"{len(drift)} rows drifted" if drift else "summaries match")
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
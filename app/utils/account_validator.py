@@ -1,32 +1,62 @@
-import httpx
 from fastapi import HTTPException
 import os
 
+from .ttl_cache import TTLCache
+from .upstream import accounts_client, UpstreamError
+from ..metrics import timed_call
+
 ACCOUNTS_API = os.getenv("ACCOUNTS_API")
+# Accounts rarely appear or disappear, but keep "does not exist" short so a new account works quickly
+ACCOUNT_CACHE_TTL = float(os.getenv("ACCOUNT_CACHE_TTL", "300"))
+ACCOUNT_CACHE_NEGATIVE_TTL = float(os.getenv("ACCOUNT_CACHE_NEGATIVE_TTL", "10"))
+ACCOUNT_CACHE_SIZE = int(os.getenv("ACCOUNT_CACHE_SIZE", "10000"))
+
+# account_no -> exists?
+account_cache = TTLCache(maxsize=ACCOUNT_CACHE_SIZE, ttl=ACCOUNT_CACHE_TTL)
+
 
-def validate_account_exists(account_no: str):
+async def fetch_account_exists(account_no: str) -> bool:
     
     url = f"{ACCOUNTS_API}/api/accounts/{account_no}"  
 
-    try:
-        with httpx.Client(timeout=3.0) as client:
-            response = client.get(url)
-    except httpx.RequestError:
+    # Transport errors and an open circuit surface as 502 "Accounts service unavailable"
+    response = await accounts_client.get(url)
+
+    if response.status_code == 404:
+        return False
+
+    # Raising here keeps 5xx out of the cache
+    if response.status_code != 200:
         raise HTTPException(
             status_code=502,
-            detail="Accounts service unavailable"
+            detail="Unknown error validating account"
         )
 
-    if response.status_code == 404:
+    return True
+
+
+@timed_call("validate_account_exists")
+async def validate_account_exists(account_no: str):
+    try:
+        exists = await account_cache.get_or_load(
+            account_no,
+            lambda: fetch_account_exists(account_no),
+            ttl=lambda exists: ACCOUNT_CACHE_TTL if exists else ACCOUNT_CACHE_NEGATIVE_TTL,
+        )
+    except TimeoutError:
+        raise UpstreamError(f"{accounts_client.name} service did not answer in time") from None
+
+    if not exists:
         raise HTTPException(
             status_code=400,
             detail=f"Account '{account_no}' does not exist"
         )
 
-    if response.status_code != 200:
-        raise HTTPException(
-            status_code=502,
-            detail="Unknown error validating account"
-        )
+    return True
+
 
-    return True
\ No newline at end of file
+def invalidate_account_cache(account_no: str | None = None):
+    if account_no is None:
+        account_cache.invalidate()
+    else:
+        account_cache.invalidate(account_no)
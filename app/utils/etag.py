@@ -0,0 +1,82 @@
+import hashlib
+import os
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..database import upsert_insert
+from ..models import AccountVersionDB
+from .ttl_cache import TTLCache
+
+# Serialised GET /api/consignment/{n} bodies for hot consignments. Off unless
+# RESPONSE_CACHE_SIZE is set. Writes made by this process invalidate entries
+# straight away; writes made by other workers show up once the TTL runs out.
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "0"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "5"))
+
+response_cache = TTLCache(maxsize=max(RESPONSE_CACHE_SIZE, 1), ttl=RESPONSE_CACHE_TTL)
+
+
+def con_etag(consignment_number: int, version: int) -> str:
+    # Consignment numbers are never reissued, and every UPDATE bumps version
+    return f'"{consignment_number}.{version}"'
+
+
+def list_etag(account_no: str, account_version: int, *parts) -> str:
+    key = "|".join(str(p) for p in (account_no, account_version, *parts))
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+def get_cached_con(consignment_number: int):
+    # (account_no, etag, body) or None
+    if RESPONSE_CACHE_SIZE <= 0:
+        return None
+    return response_cache.get(consignment_number)
+
+
+def cache_con(consignment_number: int, account_no: str, etag: str, body: bytes, generation: int):
+    # generation is response_cache.generation from before the row was read; if
+    # anything was invalidated since, the row may already be stale
+    if RESPONSE_CACHE_SIZE > 0 and generation == response_cache.generation:
+        response_cache.set(consignment_number, (account_no, etag, body))
+
+
+def invalidate_con(*consignment_numbers: int):
+    for n in consignment_numbers:
+        response_cache.invalidate(n)
+
+
+async def get_account_version(db: AsyncSession, account_no: str) -> int:
+    version = await db.scalar(
+        select(AccountVersionDB.version).where(AccountVersionDB.account_no == account_no)
+    )
+    return version or 0
+
+
+async def bump_account_versions(db: AsyncSession, *account_nos: str):
+    # One multi-row upsert, in the caller's transaction. Sorted so concurrent
+    # writers lock the counter rows in the same order.
+    account_nos = sorted(set(account_nos))
+    if not account_nos:
+        return
+    stmt = upsert_insert(db, AccountVersionDB).values([{"account_no": a, "version": 1} for a in account_nos])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AccountVersionDB.account_no],
+        set_={"version": AccountVersionDB.version + 1},
+    )
+    await db.execute(stmt)
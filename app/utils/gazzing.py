@@ -1,13 +1,72 @@
-import httpx
+import logging
 import os
 
+from .ttl_cache import TTLCache
+from .upstream import gazzing_client, UpstreamError
+from ..metrics import timed_call
+
 GAZZING_API = os.getenv("GAZZING_API")
+DEPOT_CACHE_TTL = float(os.getenv("DEPOT_CACHE_TTL", "3600"))
+DEPOT_CACHE_SIZE = int(os.getenv("DEPOT_CACHE_SIZE", "1024"))
+# Preload the whole area -> depot table at startup
+DEPOT_CACHE_WARM = os.getenv("DEPOT_CACHE_WARM", "false").lower() == "true"
+
+logger = logging.getLogger(__name__)
+
+# normalised addressline4 -> depot number
+depot_cache = TTLCache(maxsize=DEPOT_CACHE_SIZE, ttl=DEPOT_CACHE_TTL)
+
+
+def normalise_area(area: str) -> str:
+    return " ".join(area.split()).casefold()
+
+
+async def fetch_depot_number(area: str) -> int:
+    # A lookup, so safe to retry even though it's a POST
+    res = await gazzing_client.post(
+        f"{GAZZING_API}/api/depot",
+        json={"addressline4": area},
+        idempotent=True,
+    )
+    if res.status_code != 200:
+        raise UpstreamError(f"Could not resolve depot for '{area}'")
+    return res.json()["depot_number"]
+
 
+@timed_call("resolve_depot_number")
 async def resolve_depot_number(area: str) -> int:
-    async with httpx.AsyncClient() as client:
-        res = await client.post(
-            f"{GAZZING_API}/api/depot",
-            json={"addressline4": area}
+    try:
+        return await depot_cache.get_or_load(
+            normalise_area(area),
+            lambda: fetch_depot_number(area.strip()),
         )
-        res.raise_for_status()
-        return res.json()["depot_number"]
\ No newline at end of file
+    except TimeoutError:
+        raise UpstreamError(f"{gazzing_client.name} service did not answer in time") from None
+
+
+def invalidate_depot_cache(area: str | None = None):
+    if area is None:
+        depot_cache.invalidate()
+    else:
+        depot_cache.invalidate(normalise_area(area))
+
+
+async def fetch_depot_table() -> dict[str, int]:
+    # The full area -> depot table, keyed by normalised area
+    res = await gazzing_client.get(f"{GAZZING_API}/api/depots")
+    if res.status_code != 200:
+        raise UpstreamError("Could not fetch the depot table")
+    return {normalise_area(row["addressline4"]): row["depot_number"] for row in res.json()}
+
+
+async def warm_depot_cache() -> int:
+    # Pull the full area -> depot table in one call; a failure only means a cold cache
+    try:
+        table = await fetch_depot_table()
+    except UpstreamError as e:
+        logger.warning("Depot cache warm-up failed: %s", e.detail)
+        return 0
+
+    for area, depot in table.items():
+        depot_cache.set(area, depot)
+    return len(table)
@@ -1,15 +1,155 @@
-import httpx
+import asyncio
+import logging
 import os
 
+from fastapi import HTTPException
+
+from .upstream import accounts_client, UpstreamError, request_deadline
+from ..metrics import timed_call
+
 ACCOUNTS_API = os.getenv("ACCOUNTS_API")
+# "single" reads the counter and bumps it for each create (each batch), which
+# any accounts service supports. "block" leases numbers a block at a time and
+# needs the atomic incrementConNum described at reserve_con_nums; only turn it
+# on once the accounts service answers that way.
+CON_NUM_ALLOCATION = os.getenv("CON_NUM_ALLOCATION", "single")
+# How many numbers to lease from the accounts service at a time
+CON_BLOCK_SIZE = int(os.getenv("CON_BLOCK_SIZE", "50"))
+# Start leasing the next block once this many numbers are left in the current one
+CON_BLOCK_REFILL_AT = int(os.getenv("CON_BLOCK_REFILL_AT", str(max(1, CON_BLOCK_SIZE // 5))))
+
+logger = logging.getLogger(__name__)
+
+
+async def read_con_nums(account_no: str, count: int) -> list[int]:
+    # GET the current number then PATCH the counter on by count. Two calls, and
+    # nothing stops another worker reading the same number in between; within
+    # this process the allocator's per-account lock keeps them apart.
+    res = await accounts_client.get(f"{ACCOUNTS_API}/api/accounts/{account_no}/currentConNum")
+    if res.status_code != 200:
+        raise UpstreamError("Could not get next consignment number")
+    first = res.json()["current_con_num"]
+
+    res = await accounts_client.patch(
+        f"{ACCOUNTS_API}/api/accounts/{account_no}/incrementConNum",
+        params={"count": count},
+    )
+    if res.status_code != 200:
+        raise UpstreamError("Could not get next consignment number")
+    return list(range(first, first + count))
+
+
+async def reserve_con_nums(account_no: str, count: int) -> list[int]:
+    # What this needs from the accounts service:
+    #
+    #   PATCH /api/accounts/{account_no}/incrementConNum?count=N
+    #   -> 200 {"previous_con_num": P, "current_con_num": P + N}
+    #
+    # adding N to the counter in one atomic step and reporting it before and
+    # after. The block [P, P + N) is then ours alone however many workers are
+    # leasing. Not idempotent, so never retried.
+    res = await accounts_client.patch(
+        f"{ACCOUNTS_API}/api/accounts/{account_no}/incrementConNum",
+        params={"count": count},
+    )
+    if res.status_code != 200:
+        raise UpstreamError("Could not get next consignment number")
+
+    body = res.json()
+    first, end = body.get("previous_con_num"), body.get("current_con_num")
+    if first is None or end is None or end - first != count:
+        # A service that ignores count (or doesn't report the old value) would
+        # have us hand out numbers it never reserved: refuse, loudly
+        logger.error("incrementConNum for %s asked for %d numbers and answered %r", account_no, count, body)
+        raise UpstreamError("Accounts service did not reserve the consignment numbers asked for")
+    return list(range(first, end))
+
+
+class _Block:
+    def __init__(self):
+        self.next = 0
+        self.end = 0 # exclusive
+        self.prefetch: asyncio.Task | None = None
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.next
+
+
+# Hands out con numbers from blocks leased per account. A per-account lock means
+# concurrent creates never see the same number, and the next block is leased in
+# the background once the current one drops to `refill_at` (never, if None).
+# Numbers left in a block when the process stops are skipped, so gaps are expected.
+class ConNumAllocator:
+    def __init__(self, lease=reserve_con_nums, block_size: int = CON_BLOCK_SIZE,
+                 refill_at: int | None = CON_BLOCK_REFILL_AT):
+        self.lease = lease
+        self.block_size = block_size
+        self.refill_at = refill_at
+        self._blocks: dict[str, _Block] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    async def take(self, account_no: str, count: int = 1) -> list[int]:
+        lock = self._locks.setdefault(account_no, asyncio.Lock())
+        async with lock:
+            block = self._blocks.setdefault(account_no, _Block())
+            nums: list[int] = []
+            while len(nums) < count:
+                if not block.remaining:
+                    await self._refill(account_no, block, count - len(nums))
+                n = min(block.remaining, count - len(nums))
+                nums.extend(range(block.next, block.next + n))
+                block.next += n
+
+            if self.refill_at is not None and block.remaining <= self.refill_at and block.prefetch is None:
+                block.prefetch = asyncio.create_task(self._prefetch(account_no))
+            return nums
+
+    async def _prefetch(self, account_no: str) -> list[int]:
+        # Outlives the request that started it, so isn't held to its deadline
+        request_deadline.set(None)
+        return await self.lease(account_no, self.block_size)
+
+    async def _refill(self, account_no: str, block: _Block, needed: int):
+        nums = None
+        if block.prefetch is not None:
+            task, block.prefetch = block.prefetch, None
+            try:
+                nums = await task
+            except HTTPException:
+                pass # lease directly below and let that error surface
+        if nums is None:
+            nums = await self.lease(account_no, max(self.block_size, needed))
+        block.next = nums[0]
+        block.end = nums[-1] + 1
+
+    async def close(self):
+        # Drop state tied to the running event loop (locks, prefetch tasks)
+        for block in self._blocks.values():
+            if block.prefetch is not None:
+                block.prefetch.cancel()
+        self._blocks.clear()
+        self._locks.clear()
+
+
+def make_allocator(kind: str = CON_NUM_ALLOCATION) -> ConNumAllocator:
+    if kind == "block":
+        return ConNumAllocator()
+    if kind == "single":
+        # Exactly the numbers each create or batch asks for, nothing held over
+        return ConNumAllocator(lease=read_con_nums, block_size=1, refill_at=None)
+    raise ValueError(f"Unknown consignment number allocation {kind!r}")
+
+
+con_allocator = make_allocator()
+
 
-async def get_next_con_num(account_no: str):
-    async with httpx.AsyncClient() as client:
-        res = await client.get(f"{ACCOUNTS_API}/api/accounts/{account_no}/currentConNum")
-        res.raise_for_status()
-        num = res.json()["current_con_num"]
+@timed_call("get_next_con_num")
+async def get_next_con_num(account_no: str) -> int:
+    nums = await con_allocator.take(account_no, 1)
+    return nums[0]
 
-        # increment it after grabbing
-        await client.patch(f"{ACCOUNTS_API}/api/accounts/{account_no}/incrementConNum")
 
-        return num
\ No newline at end of file
+@timed_call("allocate_con_nums")
+async def allocate_con_nums(account_no: str, count: int) -> list[int]:
+    return await con_allocator.take(account_no, count)
@@ -0,0 +1,52 @@
+import base64
+import json
+import os
+from datetime import datetime
+
+from fastapi import HTTPException, Request
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+NDJSON = "application/x-ndjson"
+
+
+# Cursors are opaque to clients: the last key of the page, base64'd
+def encode_cursor(last_key: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"k": last_key}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded))["k"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(key, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+
+def page_limit(limit: int | None, *cursors) -> int | None:
+    # The list endpoints page only when asked to, with ?limit or a cursor;
+    # without either they return everything, as they did before paging.
+    if limit is None and any(c is not None for c in cursors):
+        return DEFAULT_PAGE_SIZE
+    return limit
+
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+
+def json_default(value):
+    # created_at, in the same ISO form the JSON responses use
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+async def ndjson_lines(chunks):
+    # One JSON object per row, flushed once per chunk of rows
+    async for rows in chunks:
+        if rows:
+            yield "".join(json.dumps(row._asdict(), default=json_default) + "\n" for row in rows)
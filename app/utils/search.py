@@ -0,0 +1,50 @@
+import os
+import re
+
+from fastapi import HTTPException
+from sqlalchemy import func, literal_column, select, table, column
+
+from ..models import ConsignmentDB
+
+# Search over consignee name and address, backed by the index migration 0006
+# builds: FTS5 on SQLite, a tsvector column with a GIN index on Postgres.
+# Every word in the query has to match the start of a word in one of the
+# fields, so "val ath" finds "50 Valleycourt, Athlone".
+
+MAX_SEARCH_TERMS = int(os.getenv("MAX_SEARCH_TERMS", "8"))
+
+SEARCH_FIELDS = ("name", "addressline1", "addressline2", "addressline3", "addressline4")
+
+consignments_fts = table("consignments_fts", column("rowid"))
+
+
+def search_terms(q: str) -> list[str]:
+    # Letters and digits only, so nothing reaches the query syntax of either engine
+    terms = re.findall(r"[^\W_]+", q.lower())[:MAX_SEARCH_TERMS]
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search needs at least one word")
+    return terms
+
+
+def fts5_query(account_no: str, terms: list[str]) -> str:
+    # The account narrows the match inside the index; the terms only look at
+    # the name and address columns
+    words = " AND ".join(f'"{t}"*' for t in terms)
+    return f'account_no : "{account_no}" AND {{{" ".join(SEARCH_FIELDS)}}} : ({words})'
+
+
+def search_stmt(dialect: str, account_no: str, q: str):
+    terms = search_terms(q)
+    if dialect == "postgresql":
+        tsquery = " & ".join(f"{t}:*" for t in terms)
+        return select(ConsignmentDB).where(
+            ConsignmentDB.account_no == account_no,
+            literal_column("search_vector").op("@@")(func.to_tsquery("simple", tsquery)),
+        )
+    # The index finds the ids, then the rows are fetched by primary key. As a
+    # join SQLite would run the MATCH once per row of the account, and a plain
+    # account_no = ? would have it walk the account index; || '' stops that
+    # (the MATCH has already narrowed to the account, this just double-checks).
+    matches = (select(consignments_fts.c.rowid)
+               .where(literal_column("consignments_fts").op("MATCH")(fts5_query(account_no, terms))))
+    return select(ConsignmentDB).where(ConsignmentDB.id.in_(matches), (ConsignmentDB.account_no + "") == account_no)
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from .upstream import request_deadline, time_left
+
+_MISSING = object()
+
+
+# Small in-process cache: entries expire after a TTL, the least recently used
+# entry is evicted once maxsize is reached, and concurrent misses for the same
+# key share one in-flight load (get_or_load).
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict() # key -> (expires_at, value)
+        self._inflight: dict = {} # key -> asyncio.Task
+        self._generation = 0 # bumped on invalidate so in-flight loads don't write back stale values
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def generation(self) -> int:
+        # Changes on every invalidate; compare before and after a slow load
+        return self._generation
+
+    def get(self, key, default=None):
+        entry = self._data.get(key, _MISSING)
+        if entry is not _MISSING:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=_MISSING):
+        # No key clears everything
+        self._generation += 1
+        if key is _MISSING:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    async def get_or_load(self, key, loader, ttl=None):
+        # ttl may be a number or a function of the loaded value
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            # Run the load as its own task so a cancelled caller doesn't cancel
+            # it for everyone else waiting on the same key
+            task = asyncio.ensure_future(self._load(loader))
+            self._inflight[key] = task
+            generation = self._generation
+
+            def _done(t):
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                if t.cancelled() or t.exception() is not None:
+                    return # errors are never cached
+                if generation == self._generation:
+                    value = t.result()
+                    self.set(key, value, ttl(value) if callable(ttl) else ttl)
+
+            task.add_done_callback(_done)
+        # Each caller waits no longer than its own request deadline allows;
+        # TimeoutError if that comes first (the load carries on for the others)
+        async with asyncio.timeout(time_left()):
+            return await asyncio.shield(task)
+
+    @staticmethod
+    async def _load(loader):
+        # The task copied the context of whoever missed first. The load is
+        # shared, so it isn't held to that request's deadline.
+        request_deadline.set(None)
+        return await loader()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+        }
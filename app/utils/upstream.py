@@ -0,0 +1,235 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import httpx
+from fastapi import HTTPException
+
+from ..metrics import upstream_http_duration
+from ..profiling import record_upstream
+
+# Connection pool per upstream service
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "1.0"))
+# Retries only apply to idempotent calls
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.05"))
+# Circuit breaker: open after this many failures in a row, probe again after the reset time
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "10"))
+
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class UpstreamError(HTTPException):
+    def __init__(self, detail: str):
+        super().__init__(status_code=502, detail=detail)
+
+
+# time.monotonic() by which the current request's upstream calls have to be
+# done. Tasks copy it when they are created, so calls made on behalf of a
+# request share its budget; None means only the per-client timeouts apply.
+request_deadline: ContextVar[float | None] = ContextVar("request_deadline", default=None)
+
+
+def time_left() -> float | None:
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def deadline(seconds: float):
+    # Never extends a deadline that is already set, only tightens it
+    at = time.monotonic() + seconds
+    current = request_deadline.get()
+    token = request_deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET):
+        self.max_failures = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            # let a single request through to see if the service is back
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        # A call ended without telling us anything about the service (it was
+        # cancelled); if it was the probe, the next call gets to probe instead
+        self._probing = False
+
+
+class UpstreamClient:
+    def __init__(self, name: str, timeout: float, breaker: CircuitBreaker | None = None):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._client: httpx.AsyncClient | None = None
+        self._loop = None
+        self.requests = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=UPSTREAM_CONNECT_TIMEOUT),
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created by the app lifespan; created lazily for scripts and tests.
+        # A pool belongs to the loop it was made on, so a new loop gets a new pool.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = self._new_client()
+            self._loop = loop
+        return self._client
+
+    async def start(self):
+        self._get_client()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._loop = None
+
+    async def request(self, method: str, url: str, *, timeout: float | None = None,
+                      idempotent: bool | None = None, **kwargs) -> httpx.Response:
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempts = 1 + (UPSTREAM_RETRIES if idempotent else 0)
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        for attempt in range(attempts):
+            left = time_left()
+            if left is not None and left <= 0:
+                raise UpstreamError(f"{self.name} service did not answer in time")
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise UpstreamError(f"{self.name} service unavailable")
+
+            # Cut the attempt short if the request's deadline comes first
+            clamped = left is not None and left < (timeout or self.timeout)
+            if clamped:
+                kwargs["timeout"] = httpx.Timeout(left, connect=min(left, UPSTREAM_CONNECT_TIMEOUT))
+
+            self.requests += 1
+            start = time.perf_counter()
+            cut_short = False
+            try:
+                res = await self._get_client().request(method, url, **kwargs)
+            except httpx.RequestError as e:
+                res = None
+                cut_short = clamped and isinstance(e, httpx.TimeoutException)
+            except BaseException:
+                self.breaker.release()
+                raise
+            elapsed = time.perf_counter() - start
+            outcome = str(res.status_code) if res is not None else "error"
+            upstream_http_duration.observe(elapsed, self.name, method.upper(), outcome)
+            record_upstream(self.name, method.upper(), url, outcome, elapsed)
+
+            if res is not None and res.status_code < 500:
+                self.breaker.record_success()
+                return res
+
+            if cut_short:
+                # Timed out on the request's deadline, not the service's: no
+                # verdict for the breaker, and no time left to retry in
+                self.breaker.release()
+                break
+            self.breaker.record_failure()
+            retryable = res is None or res.status_code in RETRY_STATUSES
+            if not retryable or attempt + 1 == attempts:
+                break
+            # full jitter so retries from many requests don't line up
+            delay = random.uniform(0, UPSTREAM_RETRY_BACKOFF * 2 ** attempt)
+            left = time_left()
+            if left is not None and delay >= left:
+                break
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        if res is None:
+            if clamped:
+                raise UpstreamError(f"{self.name} service did not answer in time")
+            raise UpstreamError(f"{self.name} service unavailable")
+        return res
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("PATCH", url, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rejected": self.rejected,
+        }
+
+
+accounts_client = UpstreamClient("Accounts", timeout=float(os.getenv("ACCOUNTS_TIMEOUT", "3.0")))
+gazzing_client = UpstreamClient("Gazetteer", timeout=float(os.getenv("GAZZING_TIMEOUT", "3.0")))
+CLIENTS = (accounts_client, gazzing_client)
+
+
+async def start_clients():
+    for c in CLIENTS:
+        await c.start()
+
+
+async def close_clients():
+    for c in CLIENTS:
+        await c.close()
@@ -0,0 +1,54 @@
+# Consignment number allocation throughput, one GET + PATCH per create (before,
+# and CON_NUM_ALLOCATION=single) vs block leasing (after, CON_NUM_ALLOCATION=block),
+# against the local stub accounts service.
+#
+#   python -m bench.con_alloc --creates 2000 --concurrency 100 --latency 0.005
+import argparse
+import asyncio
+import time
+
+from bench.stubs import StubServer, make_accounts_app
+from app.utils import get_next_con
+from app.utils.get_next_con import ConNumAllocator, read_con_nums
+
+
+async def _run(take, creates: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            await take("A12345")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(creates)))
+    return creates / (time.perf_counter() - start)
+
+
+async def _per_create(account_no: str):
+    nums = await read_con_nums(account_no, 1)
+    return nums[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--creates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.005, help="stub latency per call (s)")
+    parser.add_argument("--block-size", type=int, default=get_next_con.CON_BLOCK_SIZE)
+    args = parser.parse_args()
+
+    with StubServer(make_accounts_app(latency=args.latency)) as stub:
+        get_next_con.ACCOUNTS_API = stub.url
+
+        before = asyncio.run(_run(_per_create, args.creates, args.concurrency))
+
+        allocator = ConNumAllocator(block_size=args.block_size, refill_at=max(1, args.block_size // 5))
+        after = asyncio.run(_run(allocator.take, args.creates, args.concurrency))
+
+    print(f"before (GET+PATCH per create): {before:10.1f} creates/sec")
+    print(f"after  (block of {args.block_size}):       {after:10.1f} creates/sec")
+    print(f"speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
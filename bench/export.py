@@ -0,0 +1,75 @@
+# Export throughput and peak memory on a generated SQLite database.
+#
+#   python -m bench.export --rows 1000000 --db /tmp/cons_bench.db
+#
+# Each format runs in its own process so peak RSS is per format.
+import argparse
+import json
+import os
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+
+from sqlalchemy import create_engine
+
+from app.models import Base
+
+
+def generate(path: str, rows: int):
+    if os.path.exists(path):
+        return
+    Base.metadata.create_all(bind=create_engine(f"sqlite:///{path}"))
+    conn = sqlite3.connect(path)
+    batch = 50_000
+    for start in range(1, rows + 1, batch):
+        conn.executemany(
+            "INSERT INTO consignments (account_no, name, addressline1, addressline2, addressline3,"
+            " addressline4, weight, consignment_number, delivery_depot) VALUES (?,?,?,?,?,?,?,?,?)",
+            (
+                (f"A{10000 + i % 500}", f"Name{i % 9973}", "50 Valleycourt", "Dublin Road" if i % 3 else None,
+                 "Athlone", "Westmeath", 1 + i % 30, i, i % 60)
+                for i in range(start, min(start + batch, rows + 1))
+            ),
+        )
+        conn.commit()
+    conn.close()
+
+
+def child(path: str, fmt: str, gz: bool):
+    from app.export import main as export_main
+
+    start = time.perf_counter()
+    argv = ["--format", fmt, "--out", os.devnull, "--database-url", f"sqlite:///{path}"]
+    rows = export_main(argv + (["--gzip"] if gz else []))
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"rows": rows, "seconds": elapsed, "peak_rss_mb": peak_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", default="/tmp/cons_bench.db")
+    parser.add_argument("--child", nargs=2, metavar=("FORMAT", "GZIP"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.db, args.child[0], args.child[1] == "1")
+        return
+
+    generate(args.db, args.rows)
+    print(f"{'format':14} {'rows/sec':>12} {'peak RSS MB':>12}")
+    for fmt, gz in [("csv", False), ("csv", True), ("ndjson", False), ("parquet", False), ("arrow", False)]:
+        out = subprocess.run(
+            [sys.executable, "-m", "bench.export", "--db", args.db, "--child", fmt, "1" if gz else "0"],
+            capture_output=True, text=True, check=True,
+        )
+        res = json.loads(out.stdout.strip().splitlines()[-1])
+        name = fmt + (".gz" if gz else "")
+        print(f"{name:14} {res['rows'] / res['seconds']:12.0f} {res['peak_rss_mb']:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Cost of the always-on metrics: raw recording cost, and per-request overhead of
+# the middleware plus DB statement hooks on a route that does one query.
+#
+#   python -m bench.metrics --requests 5000
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+
+from app import metrics
+from app.metrics import MetricsMiddleware, Registry
+
+
+def observe_cost(n: int) -> float:
+    h = Registry().histogram("bench_seconds", "bench", ("route", "status"))
+    start = time.perf_counter()
+    for i in range(n):
+        h.observe(0.003, "/api/consignment/{consignment_number}", "200")
+    return (time.perf_counter() - start) / n
+
+
+def make_app(with_metrics: bool) -> FastAPI:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    bench = FastAPI()
+    if with_metrics:
+        bench.add_middleware(MetricsMiddleware)
+
+    @bench.get("/api/consignment/{consignment_number}")
+    async def get(consignment_number: int):
+        with engine.connect() as conn:
+            return {"n": conn.execute(text("SELECT :n"), {"n": consignment_number}).scalar()}
+
+    return bench
+
+
+def set_db_hooks(on: bool):
+    hooks = [("before_cursor_execute", metrics._before_execute), ("after_cursor_execute", metrics._after_execute)]
+    for name, fn in hooks:
+        if on and not event.contains(Engine, name, fn):
+            event.listen(Engine, name, fn)
+        elif not on and event.contains(Engine, name, fn):
+            event.remove(Engine, name, fn)
+
+
+async def per_request(bench: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=bench)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for i in range(50):
+            await http.get(f"/api/consignment/{i}")
+        start = time.perf_counter()
+        for i in range(requests):
+            await http.get(f"/api/consignment/{i}")
+        return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"histogram observe: {observe_cost(200_000) * 1e9:8.0f} ns")
+
+    # Alternate runs and keep the best of each, to take noise out
+    off, on = [], []
+    for _ in range(args.rounds):
+        set_db_hooks(False)
+        off.append(asyncio.run(per_request(make_app(False), args.requests)))
+        set_db_hooks(True)
+        on.append(asyncio.run(per_request(make_app(True), args.requests)))
+    off, on = min(off), min(on)
+    print(f"request, metrics off: {off * 1e6:8.1f} us")
+    print(f"request, metrics on:  {on * 1e6:8.1f} us")
+    print(f"overhead: {(on - off) * 1e6:.1f} us/request ({(on - off) / off:+.1%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Local stand-ins for the accounts and gazetteer services, run in a background thread so tests
+# and benchmarks can point ACCOUNTS_API at a real HTTP server.
+import asyncio
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+
+
+async def _pause(stub: FastAPI):
+    # Injected latency and error rate, both adjustable on a running stub via stub.state
+    stub.state.calls += 1
+    if stub.state.latency:
+        await asyncio.sleep(stub.state.latency)
+    if stub.state.error_rate and random.random() < stub.state.error_rate:
+        raise HTTPException(status_code=503, detail="Injected failure")
+
+
+def make_accounts_app(accounts=("A12345",), latency: float = 0.0, error_rate: float = 0.0) -> FastAPI:
+    stub = FastAPI()
+    stub.state.con_nums = {a: 1 for a in accounts}
+    stub.state.calls = 0
+    stub.state.latency = latency
+    stub.state.error_rate = error_rate
+
+    async def pause():
+        await _pause(stub)
+
+    @stub.get("/api/accounts/{account_no}")
+    async def get_account(account_no: str):
+        await pause()
+        if account_no not in stub.state.con_nums:
+            raise HTTPException(status_code=404, detail="Account not found")
+        return {"account_no": account_no}
+
+    @stub.get("/api/accounts/{account_no}/currentConNum")
+    async def current_con_num(account_no: str):
+        await pause()
+        if account_no not in stub.state.con_nums:
+            raise HTTPException(status_code=404, detail="Account not found")
+        return {"current_con_num": stub.state.con_nums[account_no]}
+
+    @stub.patch("/api/accounts/{account_no}/incrementConNum")
+    async def increment_con_num(account_no: str, count: int = 1):
+        await pause()
+        if account_no not in stub.state.con_nums:
+            raise HTTPException(status_code=404, detail="Account not found")
+        previous = stub.state.con_nums[account_no]
+        stub.state.con_nums[account_no] += count
+        return {"previous_con_num": previous, "current_con_num": stub.state.con_nums[account_no]}
+
+    return stub
+
+
+DEPOTS = {
+    "Westmeath": 31,
+    "Offaly": 44,
+    "Dublin": 1,
+    "Cork": 12,
+    "Galway": 21,
+}
+
+
+def make_gazzing_app(depots: dict | None = None, latency: float = 0.0, error_rate: float = 0.0) -> FastAPI:
+    stub = FastAPI()
+    stub.state.depots = dict(DEPOTS if depots is None else depots)
+    stub.state.calls = 0
+    stub.state.latency = latency
+    stub.state.error_rate = error_rate
+
+    async def pause():
+        await _pause(stub)
+
+    @stub.post("/api/depot")
+    async def resolve(payload: dict):
+        await pause()
+        area = payload.get("addressline4", "").strip().title()
+        if area not in stub.state.depots:
+            raise HTTPException(status_code=404, detail="Unknown area")
+        return {"addressline4": area, "depot_number": stub.state.depots[area]}
+
+    @stub.get("/api/depots")
+    async def table():
+        await pause()
+        return [{"addressline4": a, "depot_number": d} for a, d in stub.state.depots.items()]
+
+    return stub
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubServer:
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="off")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
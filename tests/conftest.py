@@ -5,3 +5,117 @@ os.environ.setdefault("JWT_SECRET", "test-secret")
 os.environ.setdefault("JWT_ALG", "HS256")
 os.environ.setdefault("JWT_ISS", "auth-service")
 os.environ.setdefault("JWT_AUD", "dpd-app")
+
+import asyncio
+import itertools
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.fixture
+def databases(request, tmp_path):
+    # A migrated database per test, reached through an async engine (most
+    # endpoints) and a sync one (bulk streams), both wired into the app.
+    # Defaults to a SQLite file; parametrize indirectly with a URL for another.
+    from app.database import async_url
+    from app.main import app, get_db, get_sync_db
+    from app.migrate import run_migrations, schema_migrations
+    from app.models import Base
+
+    url = getattr(request, "param", None) or f"sqlite:///{tmp_path / 'test.db'}"
+    sqlite = url.startswith("sqlite")
+    engine = create_engine(url, connect_args={"check_same_thread": False} if sqlite else {})
+    async_engine = create_async_engine(async_url(url))
+    if not sqlite:
+        # scratch database, start from nothing
+        Base.metadata.drop_all(engine)
+        schema_migrations.drop(engine, checkfirst=True)
+    run_migrations(engine)
+
+    # Same session settings as app.database
+    Session = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    AsyncSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_db():
+        async with AsyncSession() as db:
+            yield db
+
+    def override_get_sync_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_sync_db] = override_get_sync_db
+    yield engine, async_engine
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_sync_db, None)
+    asyncio.run(async_engine.dispose())
+    engine.dispose()
+
+
+# Depots the stubbed gazetteer knows, by county; any other county goes to 31
+DEPOTS = {"westmeath": 31, "dublin": 10, "offaly": 44}
+
+
+def con_payload(
+    account_no="A12345",
+    name="Anto",
+    addressline1="50 Valleycourt",
+    addressline2="Dublin Road",
+    addressline3="Athlone",
+    addressline4="Westmeath",
+    weight=1,
+):
+    return {
+        "account_no": account_no,
+        "name": name,
+        "addressline1": addressline1,
+        "addressline2": addressline2,
+        "addressline3": addressline3,
+        "addressline4": addressline4,
+        "weight": weight,
+    }
+
+
+@pytest.fixture
+def client(databases, monkeypatch):
+    # The app on a fresh database with its upstream lookups stubbed: every
+    # account exists, consignment numbers count up from 1 and depots come from
+    # DEPOTS. Requests carry c.claims as their token; change it to act as
+    # another account.
+    import app.main as main
+    from app.main import app
+    from app.security import get_current_account_claims
+
+    claims = {"account_no": "A12345"}
+    app.dependency_overrides[get_current_account_claims] = lambda: claims
+    numbers = itertools.count(1)
+
+    async def validate(account_no: str):
+        return True
+
+    async def next_con_num(account_no: str) -> int:
+        return next(numbers)
+
+    async def allocate(account_no: str, count: int) -> list[int]:
+        return [next(numbers) for _ in range(count)]
+
+    async def resolve_depot(county: str) -> int:
+        return DEPOTS.get(county.strip().lower(), 31)
+
+    monkeypatch.setattr(main, "validate_account_exists", validate)
+    monkeypatch.setattr(main, "get_next_con_num", next_con_num)
+    monkeypatch.setattr(main, "allocate_con_nums", allocate)
+    monkeypatch.setattr(main, "resolve_depot_number", resolve_depot)
+    monkeypatch.setattr(main.label_pool, "submit", lambda con: None)
+    with TestClient(app) as c:
+        c.claims = claims
+        yield c
+    app.dependency_overrides.pop(get_current_account_claims, None)
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from bench.stubs import StubServer, make_accounts_app
+from app.utils import account_validator
+from app.utils.account_validator import validate_account_exists, account_cache
+from app.utils.upstream import accounts_client, CircuitBreaker
+
+
+@pytest.fixture
+def accounts_stub(monkeypatch):
+    with StubServer(make_accounts_app(accounts=("A12345",))) as stub:
+        monkeypatch.setattr(account_validator, "ACCOUNTS_API", stub.url)
+        monkeypatch.setattr(accounts_client, "breaker", CircuitBreaker())
+        account_cache.invalidate()
+        yield stub
+    account_cache.invalidate()
+
+
+def validate(account_no):
+    return asyncio.run(validate_account_exists(account_no))
+
+
+def test_existing_account_is_cached(accounts_stub):
+    before = account_cache.stats()
+    for _ in range(5):
+        assert validate("A12345") is True
+    assert accounts_stub.app.state.calls == 1
+    assert account_cache.stats()["hits"] - before["hits"] == 4
+
+
+def test_missing_account_is_negatively_cached(accounts_stub, monkeypatch):
+    for _ in range(5):
+        with pytest.raises(HTTPException) as e:
+            validate("A99999")
+        assert e.value.status_code == 400
+        assert e.value.detail == "Account 'A99999' does not exist"
+    assert accounts_stub.app.state.calls == 1
+
+
+def test_negative_entries_expire_sooner(accounts_stub, monkeypatch):
+    monkeypatch.setattr(account_validator, "ACCOUNT_CACHE_NEGATIVE_TTL", 0)
+    with pytest.raises(HTTPException):
+        validate("A99999")
+    accounts_stub.app.state.con_nums["A99999"] = 1
+    assert validate("A99999") is True
+    assert accounts_stub.app.state.calls == 2
+
+
+def test_upstream_errors_are_never_cached(accounts_stub, monkeypatch):
+    monkeypatch.setattr("app.utils.upstream.UPSTREAM_RETRIES", 0)
+    accounts_stub.app.state.error_rate = 1.0
+    with pytest.raises(HTTPException) as e:
+        validate("A12345")
+    assert e.value.status_code == 502
+
+    accounts_stub.app.state.error_rate = 0.0
+    assert validate("A12345") is True
+    assert accounts_stub.app.state.calls == 2
+
+
+def test_invalidation(accounts_stub):
+    validate("A12345")
+    account_validator.invalidate_account_cache("A12345")
+    validate("A12345")
+    assert accounts_stub.app.state.calls == 2
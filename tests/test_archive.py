@@ -0,0 +1,101 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+from app.archive import Archiver
+from app.models import AccountVersionDB, ConsignmentArchiveDB, ConsignmentDB
+from app.summary import verify
+
+from conftest import con_payload
+
+
+@pytest.fixture
+def client(client):
+    batch = [con_payload(weight=i + 1) for i in range(5)]
+    assert client.post("/api/consignment/batch", json=batch).json()["created"] == 5
+    return client
+
+
+@pytest.fixture
+def archiver(databases):
+    _, async_engine = databases
+    factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return Archiver(factory, chunk_size=2, after_days=90)
+
+
+def numbers(engine, model) -> list[int]:
+    with Session(engine) as db:
+        return sorted(db.scalars(select(model.consignment_number)))
+
+
+def account_version(engine) -> int:
+    with Session(engine) as db:
+        return db.get(AccountVersionDB, "A12345").version
+
+
+def test_moves_finished_and_aged_consignments(client, databases, archiver):
+    engine, _ = databases
+    assert client.patch("/api/consignment/2", json={"account_no": "A12345", "status": "delivered"}).status_code == 200
+    assert client.patch("/api/consignment/3", json={"account_no": "A12345", "status": "in_transit"}).status_code == 200
+    with Session(engine) as db, db.begin():
+        old = datetime.now(timezone.utc) - timedelta(days=91)
+        db.execute(update(ConsignmentDB).where(ConsignmentDB.consignment_number == 4).values(created_at=old))
+    version = account_version(engine)
+
+    assert asyncio.run(archiver.run()) == 2
+    assert numbers(engine, ConsignmentDB) == [1, 3, 5]
+    assert numbers(engine, ConsignmentArchiveDB) == [2, 4]
+    # the summaries count what is left in the hot table, and the list changed
+    assert verify(engine) == []
+    assert account_version(engine) == version + 1
+    assert client.get("/api/consignment/account/A12345").json()["consignments"] == [1, 3, 5]
+
+    # Nothing left to do the second time
+    assert asyncio.run(archiver.run()) == 0
+
+
+def test_archived_consignments_can_be_read_but_not_changed(client, databases, archiver):
+    engine, _ = databases
+    client.patch("/api/consignment/2", json={"account_no": "A12345", "status": "delivered"})
+    before = client.get("/api/consignment/2")
+    assert asyncio.run(archiver.run()) == 1
+
+    r = client.get("/api/consignment/2")
+    assert r.status_code == 200
+    assert r.json() == before.json()
+    assert r.json()["status"] == "delivered" and r.json()["created_at"] is not None
+    assert r.headers["ETag"] == before.headers["ETag"]
+
+    r = client.patch("/api/consignment/2", json={"account_no": "A12345", "weight": 3})
+    assert r.status_code == 409
+    assert client.delete("/api/consignment/2").status_code == 409
+    assert client.get("/api/consignment/99").status_code == 404
+
+    # created_at comes through the NDJSON stream as well
+    r = client.get("/api/consignment", headers={"Accept": "application/x-ndjson"})
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["consignment_number"] for row in rows] == [1, 3, 4, 5]
+    assert all(row["status"] == "created" and row["created_at"] for row in rows)
+
+
+def test_rows_edited_since_they_were_picked_are_left(client, databases, archiver):
+    engine, _ = databases
+    client.patch("/api/consignment/1", json={"account_no": "A12345", "status": "delivered"})
+    cutoff = datetime.now(timezone.utc) - timedelta(days=90)
+
+    async def run():
+        async with archiver.session_factory() as db:
+            async with db.begin():
+                # 1 is picked, then put back in transit before the move
+                await db.execute(update(ConsignmentDB).where(ConsignmentDB.id == 1)
+                                 .values(status="in_transit"))
+                return await archiver._chunk(db, [1], cutoff, datetime.now(timezone.utc))
+
+    assert asyncio.run(run()) == []
+    assert numbers(engine, ConsignmentArchiveDB) == []
+    assert verify(engine) == []
@@ -0,0 +1,32 @@
+import json
+
+from bench.load import main
+
+
+def result(rps, p99, labels=100.0):
+    return {
+        "endpoints": {"get_con": {"rps": rps, "p99_ms": p99}, "health": {"rps": 1000.0, "p99_ms": 2.0}},
+        "labels": {"per_sec": labels},
+    }
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_text(json.dumps(data))
+    return str(path)
+
+
+def test_compare_passes_within_threshold(tmp_path, capsys):
+    base = write(tmp_path, "base.json", result(500.0, 20.0))
+    new = write(tmp_path, "new.json", result(480.0, 21.0, labels=95.0))
+    assert main(["compare", base, new, "--threshold", "0.1"]) == 0
+    assert "no regressions" in capsys.readouterr().out
+
+
+def test_compare_flags_slower_endpoints_and_labels(tmp_path, capsys):
+    base = write(tmp_path, "base.json", result(500.0, 20.0))
+    assert main(["compare", base, write(tmp_path, "rps.json", result(400.0, 20.0))]) == 1
+    assert main(["compare", base, write(tmp_path, "p99.json", result(500.0, 30.0))]) == 1
+    assert main(["compare", base, write(tmp_path, "labels.json", result(500.0, 20.0, labels=50.0))]) == 1
+    out = capsys.readouterr().out
+    assert "get_con" in out and "REGRESSION" in out and "labels" in out
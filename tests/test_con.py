@@ -1,74 +1,9 @@
-import pytest
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-from app.main import app, get_db
-from app.models import Base
-from app.security import get_current_account_claims
-
-TEST_DB_URL = "sqlite+pysqlite:///:memory:"
-engine = create_engine(TEST_DB_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
-TestingSessionLocal = sessionmaker(bind=engine, expire_on_commit=False,)
-Base.metadata.create_all(bind=engine)
-
-
-@pytest.fixture
-def client(monkeypatch):
-    def override_get_db():
-        db = TestingSessionLocal()
-        try:
-            yield db
-        finally:
-            db.close()
-    app.dependency_overrides[get_db] = override_get_db
-    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345"}
-    import app.main as main
-
-    monkeypatch.setattr(main, "validate_account_exists", lambda account_no: None)
-    monkeypatch.setattr(main, "generate_label_pdf", lambda con: None)
+import os
 
-    # Need unique consignment numbers per create to avoid DB unique constraint
-    con_counter = {"n": 1}
-
-    async def fake_next_con_num(account_no: str) -> int:
-        n = con_counter["n"]
-        con_counter["n"] += 1
-        return n
-
-    async def fake_resolve_depot(county: str) -> int:
-        return 31
-
-    monkeypatch.setattr(main, "get_next_con_num", fake_next_con_num)
-    monkeypatch.setattr(main, "resolve_depot_number", fake_resolve_depot)
+from app.main import app
+from app.security import get_current_account_claims
 
-    with TestClient(app) as c:
-        yield c
-
-    
-    app.dependency_overrides.clear()
-
-
-
-def con_payload(
-    account_no="A12345",
-    name="Anto",
-    addressline1="50 Valleycourt",
-    addressline2="Dublin Road",
-    addressline3="Athlone",
-    addressline4="Westmeath",
-    weight=1,
-):
-    
-    return {
-        "account_no": account_no,
-        "name": name,
-        "addressline1": addressline1,
-        "addressline2": addressline2,
-        "addressline3": addressline3,
-        "addressline4": addressline4,
-        "weight": weight,
-    }
+from conftest import con_payload
 
 
 # Tests
@@ -178,3 +113,317 @@ def test_auth_forbidden_when_token_account_differs(client):
     assert r.status_code == 403
     assert r.json()["detail"] == "Token not valid for this account"
 
+
+def test_create_con_batch_200(client):
+    r = client.post("/api/consignment/batch", json=[con_payload(), con_payload(name="Conor")])
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert data["created"] == 2
+    assert data["failed"] == 0
+    assert [res["consignment"]["consignment_number"] for res in data["results"]] == [1, 2]
+
+    r2 = client.get("/api/consignment/2")
+    assert r2.status_code == 200
+    assert r2.json()["name"] == "Conor"
+
+
+def test_create_con_batch_calls_upstream_once_per_key(client, monkeypatch):
+    import app.main as main
+
+    calls = {"account": [], "depot": [], "reserve": []}
+
+    async def fake_validate(account_no):
+        calls["account"].append(account_no)
+
+    async def fake_resolve_depot(county: str) -> int:
+        calls["depot"].append(county)
+        return 31
+
+    async def fake_allocate_con_nums(account_no: str, count: int) -> list[int]:
+        calls["reserve"].append((account_no, count))
+        return list(range(100, 100 + count))
+
+    monkeypatch.setattr(main, "validate_account_exists", fake_validate)
+    monkeypatch.setattr(main, "resolve_depot_number", fake_resolve_depot)
+    monkeypatch.setattr(main, "allocate_con_nums", fake_allocate_con_nums)
+
+    payload = [con_payload(addressline4="Westmeath") for _ in range(3)] + [con_payload(addressline4="Offaly")]
+    r = client.post("/api/consignment/batch", json=payload)
+    assert r.status_code == 200, r.text
+    assert r.json()["created"] == 4
+    assert calls["account"] == ["A12345"]
+    assert calls["depot"] == ["Westmeath", "Offaly"]
+    assert calls["reserve"] == [("A12345", 4)]
+
+
+def test_create_con_batch_reports_per_item_failures(client, monkeypatch):
+    import app.main as main
+    from fastapi import HTTPException
+
+    async def fake_validate(account_no):
+        if account_no == "A99999":
+            raise HTTPException(status_code=400, detail=f"Account '{account_no}' does not exist")
+
+    monkeypatch.setattr(main, "validate_account_exists", fake_validate)
+
+    payload = [con_payload(), con_payload(account_no="A99999"), con_payload()]
+    r = client.post("/api/consignment/batch", json=payload)
+    assert r.status_code == 200, r.text
+    data = r.json()
+    assert data["created"] == 2
+    assert data["failed"] == 1
+    assert data["results"][1] == {
+        "index": 1,
+        "ok": False,
+        "consignment": None,
+        "error": "Account 'A99999' does not exist",
+    }
+    assert data["results"][2]["ok"] is True
+
+
+def test_get_label_pdf(client, monkeypatch, tmp_path):
+    import app.main as main
+    from app.label_jobs import LabelRenderPool
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "labels").mkdir()
+    monkeypatch.setattr(main, "label_pool", LabelRenderPool(kind="thread", workers=1))
+
+    client.post("/api/consignment", json=con_payload())
+    r = client.get("/api/consignment/1/label")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/pdf"
+    assert r.content.startswith(b"%PDF")
+
+
+def test_delete_removes_label(client, monkeypatch, tmp_path):
+    import time
+    import app.main as main
+    from app.label_jobs import LabelRenderPool
+    from app.label_store import label_path
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "label_pool", LabelRenderPool(kind="thread", workers=1))
+
+    client.post("/api/consignment", json=con_payload())
+    assert client.get("/api/consignment/1/label").status_code == 200
+    assert os.path.exists(label_path(1))
+
+    assert client.delete("/api/consignment/1").status_code == 204
+    for _ in range(100):
+        if not os.path.exists(label_path(1)):
+            break
+        time.sleep(0.01)
+    assert not os.path.exists(label_path(1))
+
+
+def test_get_label_202_while_rendering(client, monkeypatch, tmp_path):
+    import time
+    import app.main as main
+    from app import label_jobs
+    from app.label_jobs import LabelRenderPool
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "labels").mkdir()
+    monkeypatch.setattr(main, "label_pool", LabelRenderPool(kind="thread", workers=1))
+    monkeypatch.setattr(main, "LABEL_WAIT", 0.01)
+    render = label_jobs._render
+
+    def slow_render(fields):
+        time.sleep(0.3)
+        return render(fields)
+
+    monkeypatch.setattr(label_jobs, "_render", slow_render)
+
+    client.post("/api/consignment", json=con_payload())
+    r = client.get("/api/consignment/1/label")
+    assert r.status_code == 202
+    assert client.get("/api/labels/stats").json()["queue_depth"] == 1
+
+
+def test_manifest_labels_for_depot(client):
+    client.post("/api/consignment/batch", json=[con_payload() for _ in range(5)])
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345", "role": "admin"}
+
+    r = client.get("/api/manifest/labels", params={"depot": 31, "layout": "a4"})
+    assert r.status_code == 200, r.text
+    assert r.headers["content-type"] == "application/pdf"
+    assert r.content.startswith(b"%PDF")
+    assert b"/Count 2" in r.content # 5 labels, 4 to a page
+
+    r = client.get("/api/manifest/labels", params=[("consignment_number", 2), ("consignment_number", 4)])
+    assert r.status_code == 200
+    assert b"/Count 2" in r.content
+
+
+def test_manifest_labels_needs_one_filter(client):
+    r = client.get("/api/manifest/labels")
+    assert r.status_code == 400
+    r = client.get("/api/manifest/labels", params={"depot": 31, "account_no": "A12345"})
+    assert r.status_code == 400
+
+
+def test_manifest_labels_404_when_nothing_matches(client):
+    r = client.get("/api/manifest/labels", params={"account_no": "A12345"})
+    assert r.status_code == 404
+
+
+def test_manifest_labels_are_held_to_the_token_account(client):
+    client.post("/api/consignment/batch", json=[con_payload() for _ in range(2)])
+    assert client.get("/api/manifest/labels", params={"account_no": "A12345"}).status_code == 200
+
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A99999"}
+    assert client.get("/api/manifest/labels", params={"depot": 31}).status_code == 403
+    assert client.get("/api/manifest/labels", params={"account_no": "A12345"}).status_code == 403
+    # someone else's numbers match nothing
+    r = client.get("/api/manifest/labels", params=[("consignment_number", 1), ("consignment_number", 2)])
+    assert r.status_code == 404
+
+
+def test_list_cons_keyset_pages(client):
+    client.post("/api/consignment/batch", json=[con_payload() for _ in range(5)])
+
+    r = client.get("/api/consignment", params={"limit": 2})
+    assert r.status_code == 200
+    assert [c["consignment_number"] for c in r.json()] == [1, 2]
+    cursor = r.headers["X-Next-Cursor"]
+
+    r = client.get("/api/consignment", params={"limit": 2, "cursor": cursor})
+    assert [c["consignment_number"] for c in r.json()] == [3, 4]
+
+    r = client.get("/api/consignment", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert [c["consignment_number"] for c in r.json()] == [5]
+    assert "X-Next-Cursor" not in r.headers
+
+    r = client.get("/api/consignment", params={"after_id": 4})
+    assert [c["id"] for c in r.json()] == [5]
+
+
+def test_lists_without_limit_or_cursor_return_everything(client, monkeypatch):
+    # a page smaller than the list, so a default page would show up as truncation
+    monkeypatch.setattr("app.utils.pagination.DEFAULT_PAGE_SIZE", 2)
+    client.post("/api/consignment/batch", json=[con_payload() for _ in range(5)])
+
+    r = client.get("/api/consignment")
+    assert [c["consignment_number"] for c in r.json()] == [1, 2, 3, 4, 5]
+    assert "X-Next-Cursor" not in r.headers
+    r = client.get("/api/consignment/account/A12345")
+    assert r.json()["consignments"] == [1, 2, 3, 4, 5]
+    assert "X-Next-Cursor" not in r.headers
+
+
+def test_list_cons_bad_cursor_400(client):
+    r = client.get("/api/consignment", params={"cursor": "not-a-cursor"})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
+def test_list_cons_ndjson_stream(client):
+    import json
+
+    client.post("/api/consignment/batch", json=[con_payload() for _ in range(3)])
+    r = client.get("/api/consignment", params={"after_id": 1}, headers={"Accept": "application/x-ndjson"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["consignment_number"] for row in rows] == [2, 3]
+    assert rows[0]["delivery_depot"] == 31
+
+
+def test_list_con_for_account_pages(client):
+    client.post("/api/consignment/batch", json=[con_payload() for _ in range(3)])
+
+    r = client.get("/api/consignment/account/A12345", params={"limit": 2})
+    assert r.status_code == 200, r.text
+    assert r.json()["consignments"] == [1, 2]
+
+    r = client.get("/api/consignment/account/A12345", params={"limit": 2, "cursor": r.headers["X-Next-Cursor"]})
+    assert r.json() == {"account_no": "A12345", "consignments": [3]}
+    assert "X-Next-Cursor" not in r.headers
+
+    r = client.get("/api/consignment/account/A12345", headers={"Accept": "application/x-ndjson"})
+    assert r.text.splitlines() == ['{"consignment_number": 1}', '{"consignment_number": 2}', '{"consignment_number": 3}']
+
+
+def test_export_cons_csv(client):
+    client.post("/api/consignment/batch", json=[con_payload() for _ in range(3)])
+    # every account's consignments, so only for admin tokens
+    assert client.get("/api/export/consignments").status_code == 403
+
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345", "role": "admin"}
+    r = client.get("/api/export/consignments", params={"format": "csv", "from_con": 2})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    assert 'filename="consignments.csv"' in r.headers["content-disposition"]
+    lines = r.text.splitlines()
+    assert lines[0].startswith("id,account_no,name")
+    assert len(lines) == 3
+
+
+def test_get_con_etag_304_until_edited(client):
+    client.post("/api/consignment", json=con_payload())
+    r = client.get("/api/consignment/1")
+    etag = r.headers["etag"]
+
+    r = client.get("/api/consignment/1", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+
+    client.patch("/api/consignment/1", json={"account_no": "A12345", "name": "Conor"})
+    r = client.get("/api/consignment/1", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["name"] == "Conor"
+    assert r.headers["etag"] != etag
+
+
+def test_get_con_etag_still_checks_token(client):
+    client.post("/api/consignment", json=con_payload())
+    etag = client.get("/api/consignment/1").headers["etag"]
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A99999"}
+    r = client.get("/api/consignment/1", headers={"If-None-Match": etag})
+    assert r.status_code == 403
+
+
+def test_list_con_for_account_etag_changes_with_membership(client):
+    client.post("/api/consignment", json=con_payload())
+    etag = client.get("/api/consignment/account/A12345").headers["etag"]
+    assert client.get("/api/consignment/account/A12345", headers={"If-None-Match": etag}).status_code == 304
+
+    # editing a field the list doesn't show keeps the ETag
+    client.patch("/api/consignment/1", json={"account_no": "A12345", "weight": 3})
+    assert client.get("/api/consignment/account/A12345", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/api/consignment", json=con_payload())
+    r = client.get("/api/consignment/account/A12345", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.json()["consignments"] == [1, 2]
+
+    etag = r.headers["etag"]
+    client.delete("/api/consignment/2")
+    assert client.get("/api/consignment/account/A12345", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_response_cache_serves_hot_consignments(client, monkeypatch):
+    from app.utils import etag as etag_module
+    monkeypatch.setattr(etag_module, "RESPONSE_CACHE_SIZE", 100)
+    etag_module.response_cache.invalidate()
+
+    client.post("/api/consignment", json=con_payload())
+    first = client.get("/api/consignment/1")
+    hits = etag_module.response_cache.hits
+    again = client.get("/api/consignment/1")
+    assert etag_module.response_cache.hits == hits + 1
+    assert again.content == first.content
+    assert again.headers["etag"] == first.headers["etag"]
+
+    # the token is checked against the cached entry too
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A99999"}
+    assert client.get("/api/consignment/1").status_code == 403
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345"}
+
+    # edits and deletes drop the entry
+    client.patch("/api/consignment/1", json={"account_no": "A12345", "name": "Conor"})
+    assert client.get("/api/consignment/1").json()["name"] == "Conor"
+    client.delete("/api/consignment/1")
+    assert client.get("/api/consignment/1").status_code == 404
+    etag_module.response_cache.invalidate()
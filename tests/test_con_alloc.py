@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from bench.stubs import StubServer, make_accounts_app
+from app.utils import get_next_con
+from app.utils.upstream import UpstreamError
+from app.utils.get_next_con import ConNumAllocator, make_allocator, read_con_nums
+
+
+@pytest.fixture
+def accounts_stub(monkeypatch):
+    with StubServer(make_accounts_app(accounts=("A12345", "A54321"), latency=0.002)) as stub:
+        monkeypatch.setattr(get_next_con, "ACCOUNTS_API", stub.url)
+        yield stub
+
+
+def test_no_duplicates_under_concurrent_creates(accounts_stub):
+    allocator = ConNumAllocator(block_size=25, refill_at=5)
+
+    async def run():
+        takes = [allocator.take(acc) for _ in range(300) for acc in ("A12345", "A54321")]
+        results = await asyncio.gather(*takes)
+        await allocator.close()
+        return results
+
+    results = asyncio.run(run())
+    for acc, offset in (("A12345", 0), ("A54321", 1)):
+        nums = [r[0] for r in results[offset::2]]
+        assert len(set(nums)) == 300
+        # every number came from the stub's counter, never reused
+        assert max(nums) < accounts_stub.app.state.con_nums[acc]
+
+    # ~300/25 leases per account (one PATCH each), not 300
+    assert accounts_stub.app.state.calls <= 2 * (300 // 25 + 2)
+
+
+def test_single_allocation_reads_and_bumps_per_create(accounts_stub):
+    # The default, for accounts services without the atomic incrementConNum
+    allocator = make_allocator("single")
+    assert allocator.lease is read_con_nums
+
+    async def run():
+        results = await asyncio.gather(*(allocator.take("A12345") for _ in range(20)),
+                                       allocator.take("A12345", 5))
+        await allocator.close()
+        return results
+
+    results = asyncio.run(run())
+    nums = [n for r in results for n in r]
+    assert sorted(nums) == list(range(1, 26))
+    # a GET and a PATCH per take, and nothing leased ahead
+    assert accounts_stub.app.state.calls == 2 * 21
+    assert accounts_stub.app.state.con_nums["A12345"] == 26
+
+
+@pytest.mark.parametrize("answer", [
+    lambda n, count: {"previous_con_num": n, "current_con_num": n + 1}, # count ignored
+    lambda n, count: {"current_con_num": n + count}, # old value not reported
+])
+def test_lease_fails_unless_the_counter_moved_by_count(monkeypatch, answer):
+    stub = FastAPI()
+
+    @stub.patch("/api/accounts/{account_no}/incrementConNum")
+    async def increment(account_no: str, count: int = 1):
+        return answer(1, count)
+
+    with StubServer(stub) as server:
+        monkeypatch.setattr(get_next_con, "ACCOUNTS_API", server.url)
+
+        async def run():
+            with pytest.raises(UpstreamError, match="did not reserve"):
+                await get_next_con.reserve_con_nums("A12345", 50)
+            await get_next_con.accounts_client.close()
+
+        asyncio.run(run())
+
+
+def test_workers_leasing_at_once_get_separate_blocks(accounts_stub):
+    # Two processes' allocators against the same accounts service
+    workers = [ConNumAllocator(block_size=10, refill_at=2) for _ in range(2)]
+
+    async def run():
+        takes = [w.take("A12345") for _ in range(50) for w in workers]
+        results = await asyncio.gather(*takes)
+        for w in workers:
+            await w.close()
+        return [r[0] for r in results]
+
+    nums = asyncio.run(run())
+    assert len(set(nums)) == len(nums) == 100
+
+
+def test_next_block_is_leased_before_current_runs_out(accounts_stub):
+    leases = []
+
+    async def lease(account_no, count):
+        leases.append(count)
+        return await get_next_con.reserve_con_nums(account_no, count)
+
+    allocator = ConNumAllocator(lease=lease, block_size=10, refill_at=3)
+
+    async def run():
+        nums = [(await allocator.take("A12345"))[0] for _ in range(7)]
+        await asyncio.sleep(0.2) # let the prefetch land
+        block = allocator._blocks["A12345"]
+        prefetched = block.prefetch is not None and block.prefetch.done()
+        await allocator.close()
+        return nums, prefetched
+
+    nums, prefetched = asyncio.run(run())
+    assert nums == list(range(1, 8))
+    assert prefetched
+    assert leases == [10, 10]
+
+
+def test_batch_bigger_than_block(accounts_stub):
+    allocator = ConNumAllocator(block_size=10, refill_at=2)
+
+    async def run():
+        first = await allocator.take("A12345", 3)
+        big = await allocator.take("A12345", 40)
+        await allocator.close()
+        return first, big
+
+    first, big = asyncio.run(run())
+    assert first == [1, 2, 3]
+    assert len(big) == 40
+    assert len(set(first + big)) == 43
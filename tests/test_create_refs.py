@@ -0,0 +1,106 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.main import app
+from app.utils import account_validator, gazzing, get_next_con
+from app.utils.account_validator import account_cache
+from app.utils.gazzing import depot_cache
+from app.utils.upstream import CLIENTS
+from bench.stubs import StubServer, make_accounts_app, make_gazzing_app
+
+PAYLOAD = {
+    "account_no": "A12345", "name": "Anto", "addressline1": "50 Valleycourt",
+    "addressline2": "Dublin Road", "addressline3": "Athlone", "addressline4": "Westmeath", "weight": 1,
+}
+
+
+@pytest.fixture
+def stubs(databases, monkeypatch):
+    # The real lookups, against stub services whose latency each test sets
+    with StubServer(make_accounts_app()) as accounts, StubServer(make_gazzing_app()) as gaz:
+        monkeypatch.setattr(account_validator, "ACCOUNTS_API", accounts.url)
+        monkeypatch.setattr(get_next_con, "ACCOUNTS_API", accounts.url)
+        monkeypatch.setattr(gazzing, "GAZZING_API", gaz.url)
+        monkeypatch.setattr(main.label_pool, "submit", lambda con: None)
+        account_cache.invalidate()
+        depot_cache.invalidate()
+        with TestClient(app) as c:
+            yield c, accounts.app.state, gaz.app.state
+        account_cache.invalidate()
+        depot_cache.invalidate()
+        for client in CLIENTS:
+            client.breaker.record_success()
+
+
+def timed_post(client, payload):
+    start = time.perf_counter()
+    r = client.post("/api/consignment", json=payload)
+    return r, time.perf_counter() - start
+
+
+def test_depot_lookup_overlaps_the_account_calls(stubs):
+    client, accounts, gaz = stubs
+    # account check, number GET and PATCH: 0.3s; depot: 0.3s. One after another is 0.6s.
+    accounts.latency = 0.1
+    gaz.latency = 0.3
+    r, elapsed = timed_post(client, PAYLOAD)
+    assert r.status_code == 201, r.text
+    assert r.json()["consignment_number"] == 1
+    assert r.json()["delivery_depot"] == 31
+    assert elapsed < 0.5
+
+
+def test_missing_account_is_400_even_when_the_depot_fails(stubs):
+    client, accounts, gaz = stubs
+    accounts.latency = 0.1
+    r = client.post("/api/consignment", json={**PAYLOAD, "account_no": "A99999", "addressline4": "Nowhere"})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Account 'A99999' does not exist"
+
+
+def test_missing_account_cancels_the_depot_lookup(stubs):
+    client, accounts, gaz = stubs
+    gaz.latency = 1.0
+    r, elapsed = timed_post(client, {**PAYLOAD, "account_no": "A99999"})
+    assert r.status_code == 400
+    assert elapsed < 0.8
+
+
+def test_unavailable_dependency_is_502(stubs):
+    client, accounts, gaz = stubs
+    r = client.post("/api/consignment", json={**PAYLOAD, "addressline4": "Nowhere"})
+    assert r.status_code == 502
+    assert r.json()["detail"] == "Could not resolve depot for 'Nowhere'"
+    # The number lease may have landed before the depot failed; drop it so the
+    # next create has to ask the accounts service
+    client.portal.call(get_next_con.con_allocator.close)
+    accounts.error_rate = 1.0
+    r = client.post("/api/consignment", json=PAYLOAD)
+    assert r.status_code == 502
+    assert r.json()["detail"] == "Could not get next consignment number"
+
+
+def test_slow_gazetteer_is_cut_off_at_the_deadline(stubs, monkeypatch):
+    client, accounts, gaz = stubs
+    monkeypatch.setattr(main, "CREATE_DEADLINE", 0.3)
+    gaz.latency = 2.0
+    r, elapsed = timed_post(client, PAYLOAD)
+    assert r.status_code == 502
+    # the gazetteer wait and the create's own timeout end together; either says so
+    assert r.json()["detail"].endswith("did not answer in time")
+    assert elapsed < 1.0
+
+
+def test_account_check_leaves_time_for_the_number(stubs, monkeypatch):
+    client, accounts, gaz = stubs
+    monkeypatch.setattr(main, "CREATE_DEADLINE", 0.4)
+    accounts.latency = 0.3
+    # The check may only use half the budget, so it gives up rather than
+    # leave the number lease nothing
+    r, elapsed = timed_post(client, PAYLOAD)
+    assert r.status_code == 502
+    assert r.json()["detail"] == "Accounts service did not answer in time"
+    assert elapsed < 0.35
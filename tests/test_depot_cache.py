@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import pytest
+
+from bench.stubs import StubServer, make_gazzing_app
+from app.utils import gazzing
+from app.utils.ttl_cache import TTLCache
+from app.utils.upstream import deadline, time_left
+
+
+@pytest.fixture
+def gazzing_stub(monkeypatch):
+    with StubServer(make_gazzing_app(latency=0.05)) as stub:
+        monkeypatch.setattr(gazzing, "GAZZING_API", stub.url)
+        gazzing.invalidate_depot_cache()
+        yield stub
+    gazzing.invalidate_depot_cache()
+
+
+def test_concurrent_misses_share_one_upstream_call(gazzing_stub):
+    async def run():
+        return await asyncio.gather(*(gazzing.resolve_depot_number(" westmeath ") for _ in range(50)))
+
+    before = gazzing.depot_cache.stats()
+    assert set(asyncio.run(run())) == {31}
+    assert gazzing_stub.app.state.calls == 1
+
+    stats = gazzing.depot_cache.stats()
+    assert stats["coalesced"] - before["coalesced"] == 49
+
+    # normalised key: different spelling of the same area is a hit
+    asyncio.run(gazzing.resolve_depot_number("WESTMEATH"))
+    assert gazzing_stub.app.state.calls == 1
+    assert gazzing.depot_cache.stats()["hits"] == stats["hits"] + 1
+
+
+def test_invalidation_forces_a_fresh_lookup(gazzing_stub):
+    asyncio.run(gazzing.resolve_depot_number("Offaly"))
+    gazzing_stub.app.state.depots["Offaly"] = 45
+    assert asyncio.run(gazzing.resolve_depot_number("Offaly")) == 44
+
+    gazzing.invalidate_depot_cache("offaly")
+    assert asyncio.run(gazzing.resolve_depot_number("Offaly")) == 45
+    assert gazzing_stub.app.state.calls == 2
+
+
+def test_upstream_errors_are_not_cached(gazzing_stub):
+    from fastapi import HTTPException
+
+    with pytest.raises(HTTPException):
+        asyncio.run(gazzing.resolve_depot_number("Atlantis"))
+    gazzing_stub.app.state.depots["Atlantis"] = 99
+    assert asyncio.run(gazzing.resolve_depot_number("Atlantis")) == 99
+
+
+def test_warm_start_preloads_table(gazzing_stub):
+    assert asyncio.run(gazzing.warm_depot_cache()) == len(gazzing_stub.app.state.depots)
+    calls = gazzing_stub.app.state.calls
+    assert asyncio.run(gazzing.resolve_depot_number("Cork")) == 12
+    assert gazzing_stub.app.state.calls == calls
+
+
+def test_shared_load_is_not_held_to_the_first_callers_deadline():
+    cache = TTLCache(maxsize=2, ttl=60)
+
+    async def loader():
+        await asyncio.sleep(0.2)
+        return time_left()
+
+    async def run():
+        async def hurried():
+            with deadline(0.05):
+                return await cache.get_or_load("k", loader)
+
+        first = asyncio.create_task(hurried())
+        await asyncio.sleep(0)
+        # joins the load the hurried caller started, but has no deadline
+        second = await cache.get_or_load("k", loader)
+        with pytest.raises(TimeoutError):
+            await first
+        return second
+
+    assert asyncio.run(run()) is None
+    assert cache.stats()["coalesced"] == 1
+
+
+def test_ttl_and_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a") # a is now most recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+    cache.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
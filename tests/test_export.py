@@ -0,0 +1,92 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.export import export, export_stmt, iter_chunks, main, EXPORT_COLUMNS
+from app.models import Base, ConsignmentDB
+
+
+def seed(engine, n=25):
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        db.add_all(
+            ConsignmentDB(
+                account_no="A12345" if i % 2 else "A54321",
+                name=f"Name{i}",
+                addressline1="50 Valleycourt",
+                addressline2=None if i % 3 == 0 else "Dublin Road",
+                addressline3="Athlone",
+                addressline4="Westmeath",
+                weight=1 + i % 30,
+                consignment_number=i,
+                delivery_depot=31 if i < 10 else 44,
+            )
+            for i in range(1, n + 1)
+        )
+        db.commit()
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite+pysqlite:///:memory:")
+    seed(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def run(db, fmt, gz=False, chunk_size=4, **filters):
+    data = b"".join(export(iter_chunks(db, export_stmt(**filters), chunk_size), fmt, gz))
+    return gzip.decompress(data) if gz else data
+
+
+def test_csv_export(db):
+    rows = list(csv.reader(io.StringIO(run(db, "csv").decode())))
+    assert tuple(rows[0]) == EXPORT_COLUMNS
+    assert len(rows) == 26
+    assert rows[3][2] == "Name3"
+    assert rows[3][4] == "" # NULL addressline2
+    assert rows[3][-1] == "created"
+
+
+def test_ndjson_export_with_filters(db):
+    lines = run(db, "ndjson", account_no="A12345", depot=44, from_con=10, to_con=20).decode().splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [r["consignment_number"] for r in rows] == [11, 13, 15, 17, 19]
+    assert set(rows[0]) == set(EXPORT_COLUMNS)
+    assert rows[0]["version"] == 1 and rows[0]["status"] == "created"
+    assert datetime.fromisoformat(rows[0]["created_at"])
+
+
+@pytest.mark.parametrize("gz", [False, True])
+def test_parquet_export(db, gz):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(run(db, "parquet", gz=gz)))
+    assert table.num_rows == 25
+    assert table.column_names == list(EXPORT_COLUMNS)
+    assert table.column("consignment_number").to_pylist() == list(range(1, 26))
+    # a row group per chunk
+    assert pq.ParquetFile(io.BytesIO(run(db, "parquet"))).num_row_groups == 7
+
+
+def test_arrow_export(db):
+    pa = pytest.importorskip("pyarrow")
+    table = pa.ipc.open_stream(run(db, "arrow")).read_all()
+    assert table.num_rows == 25
+    assert table.column("addressline2").null_count == 8
+    assert table.column("created_at").null_count == 0
+
+
+def test_cli_writes_gzipped_csv(tmp_path):
+    url = f"sqlite:///{tmp_path / 'cons.db'}"
+    seed(create_engine(url))
+    out = tmp_path / "out.csv.gz"
+
+    assert main(["--format", "csv", "--gzip", "--depot", "31", "--out", str(out), "--database-url", url]) == 9
+    rows = list(csv.reader(io.StringIO(gzip.decompress(out.read_bytes()).decode())))
+    assert len(rows) == 10
@@ -1,4 +1,56 @@
-#def test_health(client):
-   # r = client.get("/api/health")
-    #assert r.status_code == 200
-    #assert r.json() == "OK"
\ No newline at end of file
+import asyncio
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.main import app
+
+
+def test_live_and_ready(databases):
+    with TestClient(app) as client:
+        assert client.get("/health").json() == {"status": "ok"}
+        assert client.get("/health/live").json() == {"status": "ok"}
+        r = client.get("/health/ready")
+        assert r.status_code == 200
+        assert r.json() == {"status": "ready"}
+
+
+def test_fast_start_serves_before_database_is_ready(databases, monkeypatch):
+    db_up = threading.Event()
+
+    async def slow_db():
+        while not db_up.is_set():
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(main, "FAST_START", True)
+    monkeypatch.setattr(main, "wait_for_db", slow_db)
+    with TestClient(app) as client:
+        assert client.get("/health/live").status_code == 200
+        r = client.get("/health/ready")
+        assert r.status_code == 503
+        assert r.json() == {"status": "starting"}
+
+        db_up.set()
+        for _ in range(200):
+            if client.get("/health/ready").status_code == 200:
+                break
+        assert client.get("/health/ready").json() == {"status": "ready"}
+
+
+def test_failed_fast_start_fails_liveness(databases, monkeypatch):
+    async def no_db():
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(main, "FAST_START", True)
+    monkeypatch.setattr(main, "wait_for_db", no_db)
+    with TestClient(app) as client:
+        for _ in range(200):
+            if app.state.startup.done():
+                break
+            time.sleep(0.01)
+        r = client.get("/health/live")
+        assert r.status_code == 503
+        assert r.json() == {"status": "failed"}
+        assert client.get("/health/ready").status_code == 503
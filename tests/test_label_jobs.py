@@ -0,0 +1,68 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import label_jobs
+from app.label_jobs import LabelRenderPool
+from app.label_store import label_path
+
+
+def fake_con(n=1, name="Anto"):
+    return SimpleNamespace(
+        account_no="A12345", name=name,
+        addressline1="50 Valleycourt", addressline2="Dublin Road",
+        addressline3="Athlone", addressline4="Westmeath",
+        weight=1, consignment_number=n, delivery_depot=31,
+    )
+
+
+@pytest.fixture
+def label_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("labels")
+    return tmp_path / "labels"
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_shutdown_finishes_queued_renders(label_dir, kind):
+    pool = LabelRenderPool(kind=kind, workers=2)
+
+    async def run():
+        for n in range(1, 6):
+            pool.submit(fake_con(n))
+        assert pool.stats()["queue_depth"] == 5
+        await pool.shutdown()
+
+    asyncio.run(run())
+    assert all(os.path.exists(label_path(n)) for n in range(1, 6))
+    stats = pool.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["completed"] == 5
+    assert stats["render_ms_avg"] > 0
+
+
+def test_renders_of_one_label_run_in_order(label_dir, monkeypatch):
+    order = []
+    render = label_jobs._render
+
+    def slow_first(fields):
+        if fields["name"] == "First":
+            time.sleep(0.1)
+        order.append(fields["name"])
+        return render(fields)
+
+    monkeypatch.setattr(label_jobs, "_render", slow_first)
+    pool = LabelRenderPool(kind="thread", workers=2)
+
+    async def run():
+        pool.submit(fake_con(1, name="First"))
+        last = pool.submit(fake_con(1, name="Second"))
+        assert pool.pending(1) is last
+        await pool.shutdown()
+
+    asyncio.run(run())
+    assert order == ["First", "Second"]
+    assert os.path.exists(label_path(1))
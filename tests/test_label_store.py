@@ -0,0 +1,121 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from app import label_store
+from app.label_jobs import LabelRenderPool
+from app.label_store import LocalLabelStore, S3LabelStore, label_key, label_path
+
+
+def fake_con(n=1, **kw):
+    fields = dict(
+        account_no="A12345", name="Anto",
+        addressline1="50 Valleycourt", addressline2="Dublin Road",
+        addressline3="Athlone", addressline4="Westmeath",
+        weight=1, consignment_number=n, delivery_depot=31,
+    )
+    return SimpleNamespace(**{**fields, **kw})
+
+
+@pytest.fixture
+def label_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.pdf_generator.LABEL_DIR", str(tmp_path / "labels"))
+    return tmp_path / "labels"
+
+
+def test_labels_are_sharded_by_low_digits(label_dir):
+    assert label_key(1234567) == "67/45/label_1234567.pdf"
+    assert label_key(7) == "07/00/label_7.pdf"
+    assert label_path(1234567) == str(label_dir / "67" / "45" / "label_1234567.pdf")
+
+
+def test_local_store_round_trip(label_dir):
+    store = LocalLabelStore()
+    assert store.digest(5) is None and not store.exists(5)
+    store.put(5, b"%PDF-1", "abc")
+    store.put(5, b"%PDF-2", "def")
+    assert store.get(5) == b"%PDF-2"
+    assert store.digest(5) == "def"
+    # temp files are renamed into place, never left behind
+    assert sorted(os.listdir(label_dir / "05" / "00")) == ["label_5.pdf", "label_5.pdf.sha256"]
+
+    store.delete(5)
+    store.delete(5)
+    assert not store.exists(5) and store.digest(5) is None
+
+
+def test_unchanged_labels_are_not_drawn_again(label_dir):
+    pool = LabelRenderPool(kind="thread", workers=1)
+
+    async def run():
+        await pool.submit(fake_con(1))
+        first = os.stat(label_path(1)).st_mtime_ns
+        await pool.submit(fake_con(1))
+        assert os.stat(label_path(1)).st_mtime_ns == first
+        await pool.submit(fake_con(1, delivery_depot=44))
+        await pool.shutdown()
+
+    asyncio.run(run())
+    stats = pool.stats()
+    assert (stats["completed"], stats["unchanged"]) == (2, 1)
+
+
+def test_delete_waits_for_pending_render(label_dir):
+    pool = LabelRenderPool(kind="thread", workers=1)
+
+    async def run():
+        pool.submit(fake_con(3))
+        pool.delete(3)
+        await pool.shutdown()
+
+    asyncio.run(run())
+    assert not os.path.exists(label_path(3))
+    assert not os.path.exists(label_path(3) + ".sha256")
+    assert pool.stats()["deleted"] == 1
+
+
+class FakeS3:
+    # The four calls S3LabelStore makes, against a dict
+    def __init__(self):
+        self.objects = {}
+
+    def _missing(self):
+        e = Exception("Not Found")
+        e.response = {"Error": {"Code": "404"}}
+        return e
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self._missing()
+        return {"Metadata": self.objects[Bucket, Key][1]}
+
+    def put_object(self, Bucket, Key, Body, ContentType, Metadata):
+        self.objects[Bucket, Key] = (Body, Metadata)
+
+    def get_object(self, Bucket, Key):
+        return {"Body": SimpleNamespace(read=lambda: self.objects[Bucket, Key][0])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+def test_object_store_keeps_digest_as_metadata(monkeypatch):
+    s3 = FakeS3()
+    store = S3LabelStore(bucket="b", prefix="labels/", client=s3)
+    monkeypatch.setattr(label_store, "label_store", store)
+    pool = LabelRenderPool(kind="thread", workers=1)
+
+    async def run():
+        await pool.submit(fake_con(42))
+        await pool.submit(fake_con(42))
+
+    asyncio.run(run())
+    body, meta = s3.objects["b", "labels/42/00/label_42.pdf"]
+    assert body.startswith(b"%PDF") and len(meta["label-digest"]) == 64
+    assert store.local_path(42) is None
+    assert pool.stats()["unchanged"] == 1
+
+    store.delete(42)
+    assert not store.exists(42)
@@ -0,0 +1,109 @@
+import re
+import time
+import tracemalloc
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+
+from app.pdf_generator import generate_label_pdf
+from app.label_store import LocalLabelStore
+from app.label_template import LabelTemplate, render_label_pdf
+
+
+def fake_con(n=123456, **kw):
+    fields = dict(
+        account_no="A12345", name="Anto",
+        addressline1="50 Valleycourt", addressline2="Dublin Road",
+        addressline3="Athlone", addressline4="Westmeath",
+        weight=1, consignment_number=n, delivery_depot=31,
+    )
+    fields.update(kw)
+    return SimpleNamespace(**fields)
+
+
+# Text runs and rectangles (box and barcode bars) as reportlab writes them,
+# from uncompressed documents
+MARK = re.compile(rb"BT 1 0 0 1 \S+ \S+ Tm \((?:\\.|[^\\)])*\) Tj|(?:\S+ ){4}re")
+
+
+def marks(pdf: bytes) -> Counter:
+    return Counter(MARK.findall(pdf))
+
+
+def test_template_matches_reportlab_layout(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.pdf_generator.LABEL_DIR", str(tmp_path))
+    monkeypatch.setattr("reportlab.rl_config.pageCompression", 0)
+    for con in (fake_con(), fake_con(7, addressline2=None, name="O'Brien (Jr)"), fake_con(99999999, delivery_depot=4)):
+        with open(generate_label_pdf(con), "rb") as f:
+            old = f.read()
+        new = render_label_pdf(con)
+        assert new.startswith(b"%PDF") and new.rstrip().endswith(b"%%EOF")
+        assert sum(marks(old).values()) > 20 # text, box and every bar
+        assert marks(new) == marks(old)
+        # the box and rule come from the shared form
+        assert b"/FormXob.LabelBase Do" in new
+
+
+def test_compressed_template():
+    con = fake_con()
+    pdf = LabelTemplate(compress=True).render(con)
+    assert b"/FlateDecode" in pdf
+    assert len(pdf) < len(render_label_pdf(con))
+
+
+def test_names_outside_cp1252_are_not_question_marks():
+    pdf = render_label_pdf(fake_con(name="\u0141ukasz"))
+    assert b"(?ukasz)" not in pdf
+    assert b"ukasz) Tj" in pdf
+
+
+@pytest.mark.bench
+def test_label_render_benchmark(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.pdf_generator.LABEL_DIR", str(tmp_path))
+    template = LabelTemplate()
+    store = LocalLabelStore()
+    n = 200
+
+    def measure(render):
+        render(fake_con(1)) # warm up
+        start = time.perf_counter()
+        for i in range(n):
+            render(fake_con(i))
+        rate = n / (time.perf_counter() - start)
+
+        tracemalloc.start()
+        for i in range(20):
+            render(fake_con(i))
+        # everything is freed between labels, so the peak is what one label needs
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return rate, peak
+
+    results = {
+        "reportlab -> file": measure(generate_label_pdf),
+        "template -> memory": measure(template.render),
+        "template -> store": measure(lambda con: store.put(con.consignment_number, template.render(con), "bench")),
+    }
+    print()
+    for name, (rate, peak) in results.items():
+        print(f"{name:20} {rate:10.0f} labels/sec  {peak:8d} peak bytes per label")
+
+    assert results["template -> memory"][0] > results["reportlab -> file"][0]
+
+
+def test_sheet_page_matches_single_label():
+    con = fake_con()
+    sheet = b"".join(LabelTemplate().stream_sheet([con]))
+    assert marks(sheet) == marks(render_label_pdf(con))
+
+
+def test_sheet_draws_the_base_form_once():
+    chunks = list(LabelTemplate().stream_sheet((fake_con(n) for n in range(1, 2001)),
+                                               layout="a4", chunk_size=16 * 1024))
+    assert all(len(chunk) <= 16 * 1024 for chunk in chunks)
+    pdf = b"".join(chunks)
+    assert pdf.startswith(b"%PDF")
+    assert b"/Count 500" in pdf # 4-up
+    assert pdf.count(b"/Subtype /Form") == 1
+    assert pdf.count(b"/FormXob.LabelBase Do") == 2000
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import Registry, timed_call, upstream_call_duration
+from app.security import get_current_account_claims
+
+
+def sample(text: str, name: str, **labels) -> float:
+    want = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in text.splitlines():
+        if line.startswith(f"{name}{{{want}}} ") or (not labels and line.startswith(f"{name} ")):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    reg = Registry()
+    h = reg.histogram("op_seconds", "Op time", ("op",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 5.0):
+        h.observe(v, 'say "hi"')
+    text = reg.render()
+    assert "# TYPE op_seconds histogram" in text
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="0.1"} 1' in text
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="1.0"} 3' in text
+    assert 'op_seconds_bucket{op="say \\"hi\\"",le="+Inf"} 4' in text
+    assert 'op_seconds_count{op="say \\"hi\\""} 4' in text
+
+
+def test_timed_call_records_outcome():
+    @timed_call("test_lookup")
+    async def lookup(fail):
+        if fail:
+            raise ValueError
+        return 1
+
+    asyncio.run(lookup(False))
+    with pytest.raises(ValueError):
+        asyncio.run(lookup(True))
+    assert upstream_call_duration.count("test_lookup", "ok") == 1
+    assert upstream_call_duration.count("test_lookup", "error") == 1
+
+
+def test_metrics_endpoint(databases):
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345"}
+    with TestClient(app) as client:
+        before = client.get("/metrics").text
+        assert client.get("/api/consignment/424242").status_code == 404
+        r = client.get("/metrics")
+    app.dependency_overrides.pop(get_current_account_claims)
+
+    assert r.headers["content-type"].startswith("text/plain")
+    route = dict(method="GET", route="/api/consignment/{consignment_number}", status="404")
+    assert sample(r.text, "http_request_duration_seconds_count", **route) == \
+        sample(before, "http_request_duration_seconds_count", **route) + 1
+    assert sample(r.text, "db_statement_duration_seconds_count", operation="SELECT") > \
+        sample(before, "db_statement_duration_seconds_count", operation="SELECT")
+    # the scrape itself is in flight
+    assert sample(r.text, "http_requests_in_flight") == 1
@@ -0,0 +1,68 @@
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.pool import StaticPool
+
+from app.migrate import discover, run_migrations, status
+from app.migrations import v0001_baseline
+from app.models import Base
+
+
+def memory_engine():
+    return create_engine("sqlite+pysqlite:///:memory:", poolclass=StaticPool)
+
+
+def schema(engine):
+    insp = inspect(engine)
+    return {
+        table: {
+            "columns": [(c["name"], str(c["type"]), c["nullable"]) for c in insp.get_columns(table)],
+            "pk": insp.get_pk_constraint(table)["constrained_columns"],
+            "indexes": sorted((i["name"], tuple(i["column_names"]), bool(i["unique"])) for i in insp.get_indexes(table)),
+            "unique": sorted(tuple(u["column_names"]) for u in insp.get_unique_constraints(table)),
+        }
+        # the FTS5 index and its shadow tables aren't models
+        for table in insp.get_table_names()
+        if table != "schema_migrations" and not table.startswith("consignments_fts")
+    }
+
+
+def test_versions_are_ordered_and_unique():
+    versions = [m.VERSION for m in discover()]
+    assert versions == sorted(set(versions))
+    assert versions[0] == 1
+
+
+def test_migrations_build_the_same_schema_as_the_models():
+    migrated, declared = memory_engine(), memory_engine()
+    run_migrations(migrated)
+    Base.metadata.create_all(declared)
+    assert schema(migrated) == schema(declared)
+
+
+def test_migrations_run_once():
+    engine = memory_engine()
+    assert run_migrations(engine) == [m.VERSION for m in discover()]
+    assert run_migrations(engine) == []
+    assert all(done for _, _, done in status(engine))
+
+
+def test_upgrade_stops_at_target():
+    engine = memory_engine()
+    assert run_migrations(engine, target=1) == [1]
+    assert [done for _, _, done in status(engine)][:2] == [True, False]
+
+
+def test_upgrades_a_database_created_before_migrations():
+    engine = memory_engine()
+    with engine.begin() as conn:
+        v0001_baseline.upgrade(conn)
+        conn.execute(text(
+            "INSERT INTO consignments (account_no, name, addressline1, addressline3, addressline4, "
+            "weight, consignment_number, delivery_depot) VALUES ('A1', 'Anto', 'a', 'b', 'c', 1, 1, 31)"
+        ))
+    run_migrations(engine)
+    names = {i["name"] for i in inspect(engine).get_indexes("consignments")}
+    assert {"ix_consignments_account_no_consignment_number", "ix_consignments_delivery_depot"} <= names
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM consignments")).scalar() == 1
+        # summaries are backfilled from the rows already there
+        assert conn.execute(text("SELECT consignments, total_weight FROM depot_summary")).all() == [(1, 1)]
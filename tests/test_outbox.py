@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+import app.main as main
+from app.models import OutboxDB
+from app.outbox import MemoryBroker, OutboxPublisher, outbox_failures, outbox_published
+
+from conftest import con_payload
+
+
+def events(engine) -> list[tuple]:
+    with Session(engine) as db:
+        rows = db.scalars(select(OutboxDB).order_by(OutboxDB.id)).all()
+        return [(r.event_type, r.consignment_number, r.payload["version"]) for r in rows]
+
+
+def test_lifecycle_writes_events_with_the_change(client, databases):
+    engine, _ = databases
+    assert client.post("/api/consignment", json=con_payload()).status_code == 201
+    assert client.post("/api/consignment/batch", json=[con_payload(), con_payload()]).json()["created"] == 2
+    r = client.patch("/api/consignment/1", json={"account_no": "A12345", "name": "Bobby"})
+    assert r.status_code == 200
+    assert client.delete("/api/consignment/2").status_code == 204
+
+    assert events(engine) == [
+        ("consignment.created", 1, 1),
+        ("consignment.created", 2, 1),
+        ("consignment.created", 3, 1),
+        ("consignment.updated", 1, 2),
+        ("consignment.deleted", 2, 1),
+    ]
+    with Session(engine) as db:
+        updated = db.scalars(select(OutboxDB).where(OutboxDB.event_type == "consignment.updated")).one()
+    assert updated.payload["name"] == "Bobby"
+    assert updated.payload["id"] == 1 and updated.payload["status"] == "created"
+    assert updated.payload["created_at"]
+
+    # a status change carries the new status
+    assert client.patch("/api/consignment/1", json={"account_no": "A12345", "status": "delivered"}).status_code == 200
+    with Session(engine) as db:
+        last = db.scalars(select(OutboxDB).order_by(OutboxDB.id.desc()).limit(1)).one()
+    assert (last.event_type, last.payload["status"], last.payload["version"]) == ("consignment.updated", "delivered", 3)
+
+
+def test_failed_change_writes_no_event(client, databases, monkeypatch):
+    engine, _ = databases
+    assert client.post("/api/consignment", json=con_payload()).status_code == 201
+
+    # A reused consignment number fails the insert, and takes the event with it
+    async def same_number(account_no: str) -> int:
+        return 1
+
+    monkeypatch.setattr(main, "get_next_con_num", same_number)
+    assert client.post("/api/consignment", json=con_payload()).status_code == 400
+    assert events(engine) == [("consignment.created", 1, 1)]
+
+
+def test_publisher_drains_in_batches_and_retries(client, databases):
+    engine, async_engine = databases
+    for _ in range(5):
+        assert client.post("/api/consignment", json=con_payload()).status_code == 201
+
+    broker = MemoryBroker()
+    publisher = OutboxPublisher(async_sessionmaker(async_engine), broker, batch_size=2)
+    published_before = outbox_published.value()
+
+    async def run():
+        broker.fail_next = 1
+        with pytest.raises(ConnectionError):
+            await publisher.publish_batch()
+        return await publisher.drain()
+
+    assert asyncio.run(run()) == 5
+    assert broker.batches == 3
+    assert [e["consignment_number"] for e in broker.published] == [1, 2, 3, 4, 5]
+    assert {e["type"] for e in broker.published} == {"consignment.created"}
+    assert events(engine) == []
+    assert outbox_published.value() == published_before + 5
+
+
+def test_background_publisher_backs_off_and_catches_up(client, databases, monkeypatch):
+    engine, async_engine = databases
+    monkeypatch.setattr("app.outbox.OUTBOX_BACKOFF", 0.01)
+    broker = MemoryBroker()
+    broker.fail_next = 2
+    publisher = OutboxPublisher(async_sessionmaker(async_engine), broker, poll_interval=0.01)
+    failures_before = outbox_failures.value()
+
+    def pending() -> int:
+        with Session(engine) as db:
+            return db.scalar(select(func.count()).select_from(OutboxDB))
+
+    async def run():
+        await publisher.start()
+        # published and deleted; stopping between the two would leave the row
+        for _ in range(500):
+            if broker.published and not pending():
+                break
+            await asyncio.sleep(0.01)
+        await publisher.stop()
+
+    assert client.post("/api/consignment", json=con_payload()).status_code == 201
+    asyncio.run(run())
+    assert [e["consignment_number"] for e in broker.published] == [1]
+    assert outbox_failures.value() == failures_before + 2
+    assert pending() == 0
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import pstats
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import profiling
+from app.main import app
+from app.security import get_current_account_claims
+from app.utils.upstream import accounts_client
+from bench.stubs import StubServer
+
+PAYLOAD = {
+    "account_no": "A12345", "name": "Anto", "addressline1": "50 Valleycourt",
+    "addressline2": "Dublin Road", "addressline3": "Athlone", "addressline4": "Westmeath", "weight": 1,
+}
+
+
+def accounts_stub() -> FastAPI:
+    stub = FastAPI()
+
+    @stub.get("/api/accounts/{account_no}")
+    async def account(account_no: str):
+        return {"account_no": account_no}
+
+    return stub
+
+
+@pytest.fixture
+def client(databases, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345"}
+
+    with StubServer(accounts_stub()) as stub:
+        # Real upstream call for the account check, so it shows up in the trace
+        async def validate(account_no: str):
+            await accounts_client.get(f"{stub.url}/api/accounts/{account_no}")
+
+        async def next_con_num(account_no: str) -> int:
+            return 1
+
+        async def resolve_depot(county: str) -> int:
+            return 31
+
+        monkeypatch.setattr(main, "validate_account_exists", validate)
+        monkeypatch.setattr(main, "get_next_con_num", next_con_num)
+        monkeypatch.setattr(main, "resolve_depot_number", resolve_depot)
+        monkeypatch.setattr(main.label_pool, "submit", lambda con: None)
+        with TestClient(app) as c:
+            yield c
+    app.dependency_overrides.pop(get_current_account_claims)
+
+
+def profiles(tmp_path) -> list:
+    d = tmp_path / "profiles"
+    return sorted(p.stem for p in d.glob("*.json")) if d.exists() else []
+
+
+def test_header_profiles_request_with_sql_and_upstream_calls(client, tmp_path):
+    r = client.post("/api/consignment", json=PAYLOAD, headers={"X-Profile": "1"})
+    assert r.status_code == 201, r.text
+    profile_id = r.headers["x-profile-id"]
+    assert profiles(tmp_path) == [profile_id]
+
+    base = tmp_path / "profiles" / profile_id
+    stats = pstats.Stats(str(base) + ".prof")
+    assert any(func[2] == "create_con" for func in stats.stats)
+
+    info = json.loads((base.with_suffix(".json")).read_text())
+    assert info["route"] == "/api/consignment"
+    assert info["status"] == 201
+    assert any(s["statement"].startswith("INSERT INTO consignments") for s in info["sql"])
+    assert [(u["service"], u["method"], u["status"]) for u in info["upstream"]] == [("Accounts", "GET", "200")]
+    assert info["sql_ms"] > 0 and info["upstream_ms"] > 0
+
+
+def test_unflagged_and_disabled_requests_are_not_profiled(client, tmp_path, monkeypatch):
+    assert "x-profile-id" not in client.get("/api/consignment/1").headers
+    assert "x-profile-id" not in client.get("/api/consignment/1?profile=0").headers
+
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", False)
+    assert "x-profile-id" not in client.get("/api/consignment/1", headers={"X-Profile": "1"}).headers
+    assert profiles(tmp_path) == []
+
+
+def test_token_required_when_configured(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "s3cret")
+    assert "x-profile-id" not in client.get("/api/consignment/1?profile=1").headers
+    assert "x-profile-id" in client.get("/api/consignment/1?profile=s3cret").headers
+
+
+def test_route_sample_rates(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "route_rates", profiling.parse_route_rates(
+        "GET /api/consignment/{consignment_number}=1, /health=0"))
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+
+    assert "x-profile-id" not in client.get("/health").headers
+    r = client.get("/api/consignment/1")
+    assert "x-profile-id" in r.headers
+    info = json.loads((tmp_path / "profiles" / (r.headers["x-profile-id"] + ".json")).read_text())
+    assert info["trigger"] == "sample"
+    assert info["route"] == "/api/consignment/{consignment_number}"
+    # falls back to the global rate
+    assert "x-profile-id" in client.get("/api/cache/stats").headers
+
+
+def test_profile_only_covers_its_own_request(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    demo = FastAPI()
+    demo.add_middleware(profiling.ProfilingMiddleware)
+
+    async def other_work():
+        await asyncio.sleep(0.005)
+
+    @demo.get("/profiled")
+    async def profiled():
+        for _ in range(20):
+            await asyncio.sleep(0.01)
+
+    @demo.get("/other")
+    async def other():
+        for _ in range(20):
+            await other_work()
+
+    # Both on the same event loop, interleaved
+    with TestClient(demo) as c, ThreadPoolExecutor(2) as pool:
+        first = pool.submit(c.get, "/profiled", headers={"X-Profile": "1"})
+        time.sleep(0.02)
+        second = pool.submit(c.get, "/other")
+        profile_id = first.result().headers["x-profile-id"]
+        assert "x-profile-id" not in second.result().headers
+
+    names = {func[2] for func in pstats.Stats(str(tmp_path / "profiles" / profile_id) + ".prof").stats}
+    assert "profiled" in names
+    assert "other" not in names and "other_work" not in names
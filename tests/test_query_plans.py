@@ -0,0 +1,139 @@
+import asyncio
+import json
+import os
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import app.main as main
+from app.archive import Archiver
+from app.label_store import label_path
+from app.main import app
+from app.security import get_current_account_claims
+
+# Every endpoint query has to be answerable from an index. Queries are captured
+# as the endpoints run them, then re-run under EXPLAIN against the same database.
+# Postgres is only checked when TEST_POSTGRES_URL points at a scratch database.
+
+BACKENDS = [None] + ([os.environ["TEST_POSTGRES_URL"]] if os.getenv("TEST_POSTGRES_URL") else [])
+
+# (method, url, body) for each query shape the API runs against consignments
+ENDPOINT_CALLS = [
+    ("GET", "/api/consignment/3", None),
+    ("GET", "/api/consignment/3/label", None),
+    ("GET", "/api/consignment/6", None),
+    ("GET", "/api/consignment?cursor={cursor}&limit=2", None),
+    ("GET", "/api/consignment/account/A12345?limit=2", None),
+    ("GET", "/api/consignment/search?q=anto+athl&limit=2", None),
+    ("GET", "/api/consignment/account/A12345?cursor={cursor}&limit=2", None),
+    ("GET", "/api/manifest/labels?depot=31", None),
+    ("GET", "/api/manifest/labels?account_no=A12345", None),
+    ("GET", "/api/manifest/labels?consignment_number=1&consignment_number=2", None),
+    ("GET", "/api/export/consignments?account_no=A12345", None),
+    ("GET", "/api/export/consignments?depot=31", None),
+    ("GET", "/api/export/consignments?from_con=2&to_con=4", None),
+    ("PATCH", "/api/consignment/4", {"account_no": "A12345", "weight": 2}),
+    ("DELETE", "/api/consignment/5", None),
+]
+
+
+def full_scans(conn, statement, parameters) -> list[str]:
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+        # "SCAN consignments_fts VIRTUAL TABLE" is the search index, not a table scan;
+        # the archive is checked the same as the hot table
+        return [r[-1] for r in rows if re.match(r"SCAN consignments(_archive)?\b", r[-1])]
+
+    # tiny tables would always be seq scanned; ask whether an index *can* be used
+    conn.exec_driver_sql("SET enable_seqscan = off")
+    plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans, nodes = [], [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in ("consignments", "consignments_archive"):
+            scans.append(json.dumps(node))
+        nodes.extend(node.get("Plans", []))
+    return scans
+
+
+@pytest.fixture
+def planned(databases, monkeypatch, tmp_path):
+    engine, async_engine = databases
+
+    async def ok(*args):
+        return True
+
+    counter = iter(range(1, 10_000))
+
+    async def next_con(account_no):
+        return next(counter)
+
+    async def depot(area):
+        return 31
+
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345", "role": "admin"}
+    monkeypatch.setattr(main, "validate_account_exists", ok)
+    monkeypatch.setattr(main, "get_next_con_num", next_con)
+    monkeypatch.setattr(main, "resolve_depot_number", depot)
+    monkeypatch.setattr(main.label_pool, "submit", lambda con: None)
+    monkeypatch.setattr("app.pdf_generator.LABEL_DIR", str(tmp_path))
+
+    with TestClient(app) as client:
+        for _ in range(6):
+            client.post("/api/consignment", json={
+                "account_no": "A12345", "name": "Anto", "addressline1": "50 Valleycourt",
+                "addressline2": None, "addressline3": "Athlone", "addressline4": "Westmeath",
+                "weight": 1,
+            }).raise_for_status()
+        os.makedirs(os.path.dirname(label_path(3)))
+        with open(label_path(3), "wb") as f:
+            f.write(b"%PDF-1.4")
+        # 6 is read from the archive
+        client.patch("/api/consignment/6", json={"account_no": "A12345", "status": "delivered"}).raise_for_status()
+        factory = async_sessionmaker(async_engine, expire_on_commit=False)
+        assert asyncio.run(Archiver(factory).run()) == 1
+        yield client, engine, async_engine
+    app.dependency_overrides.pop(get_current_account_claims, None)
+
+
+@pytest.mark.parametrize("databases", BACKENDS, indirect=True)
+def test_endpoint_queries_use_indexes(planned):
+    client, engine, async_engine = planned
+    cursor = client.get("/api/consignment?limit=2").headers["X-Next-Cursor"]
+    captured = []
+
+    def capture(conn, cursor_, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "consignments" in statement:
+            captured.append((statement, parameters))
+
+    # the endpoints run on both engines, so listen on both; EXPLAIN on the sync one
+    engines = [engine, async_engine.sync_engine]
+    for e in engines:
+        event.listen(e, "before_cursor_execute", capture)
+    try:
+        for method, url, body in ENDPOINT_CALLS:
+            captured.clear()
+            resp = client.request(method, url.format(cursor=cursor), json=body)
+            assert resp.status_code < 400, (url, resp.text)
+            assert captured, f"{url} ran no queries"
+            queries = list(captured)
+            with engine.connect() as conn:
+                for statement, parameters in queries:
+                    assert full_scans(conn, statement, parameters) == [], f"{method} {url}: {statement}"
+    finally:
+        for e in engines:
+            event.remove(e, "before_cursor_execute", capture)
+
+
+@pytest.mark.parametrize("databases", BACKENDS, indirect=True)
+def test_unindexed_query_is_caught(planned):
+    # Guard against the check passing vacuously
+    _, engine, _ = planned
+    with engine.connect() as conn:
+        stmt = "SELECT id FROM consignments WHERE weight = 1"
+        assert full_scans(conn, stmt, () if conn.dialect.name == "sqlite" else {}) != []
@@ -0,0 +1,190 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import Session
+
+import app.main as main
+from app.main import app
+from app.models import ConsignmentDB, OutboxDB, RedepotJobDB
+from app.redepot import RedepotJob
+from app.security import get_current_account_claims
+from app.summary import verify
+from app.utils.gazzing import depot_cache
+
+from conftest import con_payload
+
+
+class Labels:
+    def __init__(self):
+        self.rendered = []
+
+    def submit(self, con):
+        self.rendered.append((con.consignment_number, con.delivery_depot))
+
+
+@pytest.fixture
+def client(client):
+    # Westmeath as typed three ways, around two Dublin ones
+    counties = ["Westmeath", "Dublin", "WESTMEATH", "Dublin", "Westmeath ", "Westmeath"]
+    batch = [con_payload(addressline4=county, weight=i + 1) for i, county in enumerate(counties)]
+    assert client.post("/api/consignment/batch", json=batch).json()["created"] == 6
+    yield client
+    depot_cache.invalidate()
+
+
+@pytest.fixture
+def job(databases):
+    _, async_engine = databases
+    factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    return RedepotJob(factory, chunk_size=2, labels=Labels())
+
+
+def depots(engine) -> dict[int, tuple]:
+    with Session(engine) as db:
+        rows = db.execute(select(ConsignmentDB.consignment_number, ConsignmentDB.delivery_depot,
+                                 ConsignmentDB.version))
+        return {n: (depot, version) for n, depot, version in rows}
+
+
+def updated_events(engine) -> list[int]:
+    with Session(engine) as db:
+        return sorted(db.scalars(select(OutboxDB.consignment_number)
+                                 .where(OutboxDB.event_type == "consignment.updated")))
+
+
+def test_moves_only_the_remapped_area(client, databases, job):
+    engine, _ = databases
+    assert asyncio.run(job.remap({"westmeath": 99, "dublin": 10})) == ["westmeath"]
+    assert asyncio.run(job.run()) == 4
+
+    assert depots(engine) == {
+        1: (99, 2), 2: (10, 1), 3: (99, 2), 4: (10, 1), 5: (99, 2), 6: (99, 2),
+    }
+    assert sorted(job.labels.rendered) == [(1, 99), (3, 99), (5, 99), (6, 99)]
+    assert updated_events(engine) == [1, 3, 5, 6]
+    with Session(engine) as db:
+        event = db.scalars(select(OutboxDB).where(OutboxDB.consignment_number == 1,
+                                                  OutboxDB.event_type == "consignment.updated")).one()
+    assert (event.payload["delivery_depot"], event.payload["version"], event.payload["status"]) == (99, 2, "created")
+    assert event.payload["created_at"]
+    assert verify(engine) == []
+    assert job.stats()["rows_changed"] == 4
+    assert job.stats()["rows_scanned"] == job.stats()["rows_total"] == 6
+
+    # Nothing left on the wrong depot, so a second remap has nothing to do
+    assert asyncio.run(job.remap({"westmeath": 99})) == []
+    assert asyncio.run(job.run()) == 0
+
+
+def test_several_areas_are_remapped_in_one_pass(client, databases, job):
+    engine, _ = databases
+    assert asyncio.run(job.remap({"westmeath": 99, "dublin": 11})) == ["dublin", "westmeath"]
+
+    chunks = []
+    chunk = job._chunk
+
+    async def counted(spellings, upto):
+        chunks.append(upto)
+        await chunk(spellings, upto)
+
+    job._chunk = counted
+    assert asyncio.run(job.run()) == 6
+    # 6 ids in chunks of 2, once for both areas
+    assert chunks == [2, 4, 6]
+    assert {n: depot for n, (depot, _) in depots(engine).items()} == {
+        1: 99, 2: 11, 3: 99, 4: 11, 5: 99, 6: 99,
+    }
+    with Session(engine) as db:
+        jobs = {j.area: (j.status, j.last_id, j.changed) for j in db.scalars(select(RedepotJobDB))}
+    assert jobs == {"dublin": ("done", 6, 2), "westmeath": ("done", 6, 4)}
+    assert verify(engine) == []
+
+
+def test_interrupted_job_resumes_after_the_last_chunk(client, databases, job):
+    engine, _ = databases
+    asyncio.run(job.remap({"westmeath": 99}))
+
+    chunks = 0
+    chunk = job._chunk
+
+    async def fail_second_chunk(*args):
+        nonlocal chunks
+        chunks += 1
+        if chunks == 2:
+            raise ConnectionError("database went away")
+        await chunk(*args)
+
+    job._chunk = fail_second_chunk
+    with pytest.raises(ConnectionError):
+        asyncio.run(job.run())
+    with Session(engine) as db:
+        progress = db.get(RedepotJobDB, "westmeath")
+        assert (progress.status, progress.last_id, progress.changed) == ("pending", 2, 1)
+    assert job.stats()["error"] == "ConnectionError('database went away')"
+
+    del job._chunk
+    assert asyncio.run(job.run()) == 3
+    assert updated_events(engine) == [1, 3, 5, 6]
+    assert [n for n, (depot, _) in depots(engine).items() if depot == 99] == [1, 3, 5, 6]
+    assert verify(engine) == []
+
+
+@pytest.fixture
+def admin():
+    app.dependency_overrides[get_current_account_claims] = lambda: {"sub": "ops", "role": "admin"}
+    yield
+    app.dependency_overrides.pop(get_current_account_claims, None)
+
+
+def test_endpoints_need_an_admin_token(client):
+    assert client.post("/api/admin/redepot").status_code in (401, 403)
+    app.dependency_overrides[get_current_account_claims] = lambda: {"account_no": "A12345"}
+    try:
+        assert client.post("/api/admin/redepot").status_code == 403
+        assert client.get("/api/admin/redepot").status_code == 403
+    finally:
+        app.dependency_overrides.pop(get_current_account_claims, None)
+
+
+def test_only_one_of_two_concurrent_starts_runs(client, job, admin, monkeypatch):
+    async def slow_fetch(area: str) -> int:
+        await asyncio.sleep(0.2)
+        return 44
+
+    monkeypatch.setattr(main, "redepot_job", job)
+    monkeypatch.setattr(main, "fetch_depot_number", slow_fetch)
+    with ThreadPoolExecutor(2) as pool:
+        posts = [pool.submit(client.post, "/api/admin/redepot", params={"area": "Westmeath"})
+                 for _ in range(2)]
+        codes = sorted(p.result().status_code for p in posts)
+    assert codes == [202, 409]
+
+
+def test_endpoint_runs_job_in_background(client, databases, job, admin, monkeypatch):
+    engine, _ = databases
+
+    async def fetch_depot(area: str) -> int:
+        return {"Westmeath": 44}[area]
+
+    monkeypatch.setattr(main, "redepot_job", job)
+    monkeypatch.setattr(main, "fetch_depot_number", fetch_depot)
+    r = client.post("/api/admin/redepot", params={"area": "Westmeath"})
+    assert r.status_code == 202
+    assert r.json()["areas"] == ["westmeath"]
+    # creates from now on use the new depot without waiting for the cache TTL
+    assert depot_cache.get("westmeath") == 44
+
+    for _ in range(200):
+        status = client.get("/api/admin/redepot").json()
+        if not status["running"]:
+            break
+        time.sleep(0.01)
+    assert status["rows_changed"] == 4
+    assert status["jobs"] == [
+        {"area": "westmeath", "delivery_depot": 44, "status": "done", "last_id": 6, "changed": 4},
+    ]
+    assert depots(engine)[3] == (44, 2)
@@ -0,0 +1,60 @@
+import pytest
+
+from conftest import con_payload
+
+PEOPLE = [
+    ("A12345", "Anto", "50 Valleycourt", "Athlone", "Westmeath"),
+    ("A12345", "Antonia", "2 Main Street", "Mullingar", "Westmeath"),
+    ("A12345", "Bridget", "7 Valley View", "Tullamore", "Offaly"),
+    ("A23456", "Anto", "50 Valleycourt", "Athlone", "Westmeath"),
+]
+
+
+@pytest.fixture
+def client(client):
+    for account_no, name, line1, line3, line4 in PEOPLE:
+        r = client.post("/api/consignment", json=con_payload(
+            account_no, name, line1, addressline2=None, addressline3=line3, addressline4=line4))
+        assert r.status_code == 201, r.text
+    return client
+
+
+def found(client, q, **params) -> list[int]:
+    r = client.get("/api/consignment/search", params={"q": q, **params})
+    assert r.status_code == 200, r.text
+    return [c["consignment_number"] for c in r.json()["consignments"]]
+
+
+def test_prefix_search_over_name_and_address(client):
+    assert found(client, "anto") == [1, 2]
+    assert found(client, "valley") == [1, 3]
+    assert found(client, "VALL ath") == [1]
+    assert found(client, "westmeath, mull") == [2]
+    assert found(client, "nobody") == []
+
+
+def test_search_is_scoped_to_the_token_account(client):
+    # account numbers aren't searchable text, and other accounts' rows never show
+    assert found(client, "a23456") == []
+    client.claims["account_no"] = "A23456"
+    assert found(client, "anto") == [4]
+
+
+def test_search_pages_with_a_cursor(client):
+    r = client.get("/api/consignment/search", params={"q": "westmeath", "limit": 1}).json()
+    assert [c["consignment_number"] for c in r["consignments"]] == [1]
+    assert found(client, "westmeath", cursor=r["next_cursor"]) == [2]
+
+
+def test_index_follows_edits_and_deletes(client):
+    r = client.patch("/api/consignment/1", json={"account_no": "A12345", "name": "Ciara", "addressline3": "Kilbeggan"})
+    assert r.status_code == 200, r.text
+    assert found(client, "anto") == [2]
+    assert found(client, "ciara kilb") == [1]
+    assert client.delete("/api/consignment/2").status_code == 204
+    assert found(client, "anto") == []
+
+
+def test_query_without_words_is_rejected(client):
+    assert client.get("/api/consignment/search", params={"q": '"*:()'}).status_code == 400
+    assert client.get("/api/consignment/search").status_code == 422
@@ -0,0 +1,74 @@
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+import app.main as main
+from app.models import DepotSummaryDB
+from app.summary import rebuild, verify
+
+from conftest import con_payload
+
+
+def summaries(client):
+    client.claims["role"] = "admin"
+    depots = {d["delivery_depot"]: (d["consignments"], d["total_weight"])
+              for d in client.get("/api/summary/depot").json()}
+    accounts = {a["account_no"]: (a["consignments"], a["total_weight"])
+                for a in client.get("/api/summary/account").json()}
+    return depots, accounts
+
+
+def test_summaries_follow_creates_edits_and_deletes(client, databases):
+    engine, _ = databases
+    assert client.post("/api/consignment", json=con_payload(weight=5)).status_code == 201
+    batch = [con_payload(weight=2), con_payload("A23456", addressline4="Dublin", weight=3), con_payload("A23456", weight=4)]
+    assert client.post("/api/consignment/batch", json=batch).json()["created"] == 3
+    assert summaries(client) == (
+        {31: (3, 11), 10: (1, 3)},
+        {"A12345": (2, 7), "A23456": (2, 7)},
+    )
+
+    # New county re-resolves the depot, and the weight changes too
+    r = client.patch("/api/consignment/1", json={"account_no": "A12345", "addressline4": "Dublin", "weight": 6})
+    assert r.status_code == 200, r.text
+    # Moved to another account
+    assert client.patch("/api/consignment/2", json={"account_no": "A23456"}).status_code == 200
+    client.claims["account_no"] = "A23456"
+    assert client.delete("/api/consignment/3").status_code == 204
+
+    depots, accounts = summaries(client)
+    assert depots == {31: (2, 6), 10: (1, 6)}
+    assert accounts == {"A12345": (1, 6), "A23456": (2, 6)}
+    assert client.get("/api/summary/depot", params={"depot": 10}).json() == [
+        {"delivery_depot": 10, "consignments": 1, "total_weight": 6}]
+    assert client.get("/api/summary/account", params={"account_no": "A99999"}).json() == []
+    assert verify(engine) == []
+
+
+def test_summaries_need_an_admin_token(client):
+    assert client.get("/api/summary/depot").status_code == 403
+    assert client.get("/api/summary/account").status_code == 403
+
+
+def test_failed_write_leaves_summaries_alone(client, monkeypatch):
+    assert client.post("/api/consignment", json=con_payload(weight=5)).status_code == 201
+
+    async def same_number(account_no: str) -> int:
+        return 1
+
+    monkeypatch.setattr(main, "get_next_con_num", same_number)
+    assert client.post("/api/consignment", json=con_payload(weight=9)).status_code == 400
+    assert summaries(client) == ({31: (1, 5)}, {"A12345": (1, 5)})
+
+
+def test_verify_reports_drift_and_rebuild_fixes_it(client, databases):
+    engine, _ = databases
+    for w in (1, 2, 3):
+        assert client.post("/api/consignment", json=con_payload(weight=w)).status_code == 201
+    with Session(engine) as db:
+        db.execute(update(DepotSummaryDB).values(consignments=7))
+        db.commit()
+
+    assert verify(engine) == [("depot_summary", 31, (7, 6), (3, 6))]
+    rebuild(engine)
+    assert verify(engine) == []
+    assert summaries(client)[0] == {31: (3, 6)}
@@ -0,0 +1,93 @@
+import time
+
+import jwt
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app import security
+from app.main import app
+from app.security import decode_access_token, rotate_jwt_secret, token_cache
+
+
+def make_token(secret=None, exp_in=3600, **claims):
+    payload = {
+        "account_no": "A12345",
+        "iss": security.JWT_ISS,
+        "aud": security.JWT_AUD,
+        "exp": int(time.time()) + exp_in,
+        **claims,
+    }
+    return jwt.encode(payload, secret or security.JWT_SECRET, algorithm=security.JWT_ALG)
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(security, "JWT_SECRET", "test-secret")
+    token_cache.invalidate()
+    yield
+    token_cache.invalidate()
+
+
+def test_repeat_token_is_served_from_cache(monkeypatch):
+    token = make_token()
+    assert decode_access_token(token)["account_no"] == "A12345"
+
+    def fail(*args, **kw):
+        raise AssertionError("token verified twice")
+
+    monkeypatch.setattr(security.jwt, "decode", fail)
+    before = token_cache.stats()
+    for _ in range(3):
+        assert decode_access_token(token)["account_no"] == "A12345"
+    assert token_cache.stats()["hits"] - before["hits"] == 3
+
+
+def test_entry_expires_with_the_token():
+    token = make_token(exp_in=1)
+    decode_access_token(token)
+    (expires_at, _), = token_cache._data.values()
+    assert expires_at <= time.monotonic() + 1
+
+    time.sleep(1.1)
+    with pytest.raises(HTTPException) as e:
+        decode_access_token(token)
+    assert e.value.detail == "Token expired"
+
+
+@pytest.mark.parametrize("claims, detail", [
+    ({"exp_in": -10}, "Token expired"),
+    ({"aud": "someone-else"}, "Invalid token claims"),
+    ({"iss": "someone-else"}, "Invalid token claims"),
+    ({"secret": "wrong-secret"}, "Invalid token"),
+])
+def test_bad_tokens_rejected_every_time(claims, detail):
+    token = make_token(**claims)
+    for _ in range(2):
+        with pytest.raises(HTTPException) as e:
+            decode_access_token(token)
+        assert e.value.status_code == 401
+        assert e.value.detail == detail
+    assert len(token_cache) == 0
+
+
+def test_rotation_drops_tokens_signed_with_the_old_secret():
+    token = make_token()
+    decode_access_token(token)
+    rotate_jwt_secret("rotated-secret")
+    assert len(token_cache) == 0
+    with pytest.raises(HTTPException) as e:
+        decode_access_token(token)
+    assert e.value.detail == "Invalid token"
+    assert decode_access_token(make_token())["account_no"] == "A12345"
+
+
+@pytest.mark.parametrize("path", ["/api/cache/depot", "/api/cache/account", "/api/cache/token"])
+def test_cache_flushes_need_an_admin_token(databases, path):
+    # Flushing forces a burst of upstream lookups, so not for just anyone
+    with TestClient(app) as client:
+        assert client.delete(path).status_code in (401, 403)
+        user = {"Authorization": f"Bearer {make_token()}"}
+        assert client.delete(path, headers=user).status_code == 403
+        admin = {"Authorization": f"Bearer {make_token(role='admin')}"}
+        assert client.delete(path, headers=admin).status_code == 204
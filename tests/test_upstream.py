@@ -0,0 +1,169 @@
+import asyncio
+import time
+
+from fastapi import FastAPI, Response
+
+from bench.stubs import StubServer, free_port
+from app.utils.upstream import UpstreamClient, UpstreamError, CircuitBreaker, deadline
+
+
+def flaky_app(failures: int) -> FastAPI:
+    # Fails the first `failures` calls with 503, then answers 200
+    stub = FastAPI()
+    stub.state.calls = 0
+
+    @stub.api_route("/thing", methods=["GET", "PATCH"])
+    async def thing():
+        stub.state.calls += 1
+        if stub.state.calls <= failures:
+            return Response(status_code=503)
+        return {"ok": True}
+
+    return stub
+
+
+def test_idempotent_calls_are_retried():
+    with StubServer(flaky_app(failures=2)) as stub:
+        client = UpstreamClient("Flaky", timeout=1.0)
+
+        async def run():
+            res = await client.get(f"{stub.url}/thing")
+            await client.close()
+            return res
+
+        res = asyncio.run(run())
+    assert res.status_code == 200
+    assert stub.app.state.calls == 3
+    assert client.retries == 2
+
+
+def test_non_idempotent_calls_are_not_retried():
+    with StubServer(flaky_app(failures=1)) as stub:
+        client = UpstreamClient("Flaky", timeout=1.0)
+
+        async def run():
+            res = await client.patch(f"{stub.url}/thing")
+            await client.close()
+            return res
+
+        res = asyncio.run(run())
+    assert res.status_code == 503
+    assert stub.app.state.calls == 1
+
+
+def test_breaker_fails_fast_when_dependency_is_down():
+    dead_url = f"http://127.0.0.1:{free_port()}"
+    client = UpstreamClient("Dead", timeout=0.5, breaker=CircuitBreaker(failures=3, reset=0.2))
+
+    async def call():
+        try:
+            await client.patch(dead_url)
+        except UpstreamError as e:
+            return e
+
+    async def run():
+        errors = [await call() for _ in range(5)]
+        await client.close()
+        return errors
+
+    errors = asyncio.run(run())
+    assert all(e.status_code == 502 and e.detail == "Dead service unavailable" for e in errors)
+    assert client.requests == 3 # the last two never left the process
+    assert client.rejected == 2
+    assert client.breaker.state == "open"
+
+    time.sleep(0.25)
+    assert client.breaker.state == "half_open"
+
+
+def test_breaker_closes_again_after_successful_probe():
+    with StubServer(flaky_app(failures=0)) as stub:
+        client = UpstreamClient("Flaky", timeout=1.0, breaker=CircuitBreaker(failures=1, reset=0.05))
+        client.breaker.record_failure()
+        assert client.breaker.state == "open"
+        time.sleep(0.06)
+
+        async def run():
+            res = await client.get(f"{stub.url}/thing")
+            await client.close()
+            return res
+
+        assert asyncio.run(run()).status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    # The first call hangs, and is cancelled the way a client disconnect or
+    # create's deadline would cancel it
+    stub = FastAPI()
+    stub.state.calls = 0
+
+    @stub.get("/thing")
+    async def thing():
+        stub.state.calls += 1
+        if stub.state.calls == 1:
+            await asyncio.sleep(1)
+        return {"ok": True}
+
+    with StubServer(stub) as server:
+        client = UpstreamClient("Slow", timeout=2.0, breaker=CircuitBreaker(failures=1, reset=0.05))
+        client.breaker.record_failure()
+        time.sleep(0.06)
+        assert client.breaker.state == "half_open"
+
+        async def run():
+            probe = asyncio.create_task(client.get(f"{server.url}/thing"))
+            await asyncio.sleep(0.1)
+            probe.cancel()
+            try:
+                await probe
+            except asyncio.CancelledError:
+                pass
+            res = await client.get(f"{server.url}/thing")
+            await client.close()
+            return res
+
+        assert asyncio.run(run()).status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_deadline_timeouts_do_not_open_the_breaker():
+    stub = FastAPI()
+
+    @stub.get("/thing")
+    async def thing():
+        await asyncio.sleep(1)
+        return {"ok": True}
+
+    with StubServer(stub) as server:
+        client = UpstreamClient("Slow", timeout=2.0, breaker=CircuitBreaker(failures=1, reset=60))
+
+        async def run():
+            # A short request deadline is the caller's budget running out, not
+            # the service failing; other callers must still get through
+            try:
+                with deadline(0.1):
+                    await client.get(f"{server.url}/thing")
+            except UpstreamError as e:
+                return e
+            finally:
+                await client.close()
+
+        assert asyncio.run(run()).detail == "Slow service did not answer in time"
+    assert client.breaker.state == "closed"
+    assert client.breaker.failures == 0
+
+
+def test_connections_are_reused():
+    with StubServer(flaky_app(failures=0)) as stub:
+        client = UpstreamClient("Pooled", timeout=1.0)
+
+        async def run():
+            for _ in range(20):
+                await client.get(f"{stub.url}/thing")
+            pool = client._get_client()._transport._pool
+            open_conns = len(pool.connections)
+            await client.close()
+            return open_conns
+
+        assert asyncio.run(run()) == 1